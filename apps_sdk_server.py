@@ -22,7 +22,6 @@ from typing import Any, Dict, List, Optional, Union
 import httpx
 from contextlib import asynccontextmanager
 import random
-import uuid
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware  
@@ -30,85 +29,61 @@ from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 
-# Wikipedia On This Day API base URL
-WIKI_API_BASE = "https://api.wikimedia.org/feed/v1/wikipedia/en/onthisday"
+import day_cache
+import lifecycle
+import prefetch
+import records
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("historical-facts-apps-sdk")
 
 # Global state for demo (in production, use proper database)
-user_favorites = []
+user_favorites = set()  # stable item IDs (see records.item_id)
 user_preferences = {
     "preferred_categories": ["events", "births"],
     "discovery_mode": "chronological"
 }
 
+# Categories that get Apps SDK metadata; others are passed through as-is
+ENHANCED_CATEGORIES = ("events", "births", "deaths", "holidays")
+
 async def fetch_historical_events(month: int, day: int, event_type: str = "all") -> dict:
     """Fetch historical events from Wikipedia's On This Day API with enhanced metadata"""
     try:
-        if event_type == "all":
-            url = f"{WIKI_API_BASE}/all/{month:02d}/{day:02d}"
-        else:
-            url = f"{WIKI_API_BASE}/{event_type}/{month:02d}/{day:02d}"
+        logger.info(f"Fetching {event_type} for {month:02d}/{day:02d}")
         
-        logger.info(f"Fetching from: {url}")
+        record = await day_cache.get_record(month, day, timeout=5.0)
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Enhance data with Apps SDK metadata
-            enhanced_data = enhance_historical_data(data, month, day)
-            return enhanced_data
+        # Enhance data with Apps SDK metadata
+        enhanced_data = enhance_historical_data(record, event_type)
+        return enhanced_data
             
     except Exception as e:
         logger.error(f"Error fetching historical events: {e}")
         return {"error": str(e), "events": [], "births": [], "deaths": [], "holidays": []}
 
-def enhance_historical_data(data: dict, month: int, day: int) -> dict:
-    """Enhance historical data with Apps SDK specific metadata"""
-    enhanced = data.copy()
+def enhance_historical_data(record: records.DayRecord, event_type: str = "all") -> dict:
+    """Build the Apps SDK payload for a day from its record; era, summaries and
+    extract previews were computed when the day was ingested"""
+    month, day = record.month, record.day
+    categories = records.CATEGORIES if event_type == "all" else (event_type,)
+    current_year = datetime.now().year
+    enhanced = {}
     
     # Add rich metadata for each event type
-    for category in ["events", "births", "deaths", "holidays"]:
-        if category in enhanced:
-            for item in enhanced[category]:
-                # Add unique ID for state management
-                item["id"] = str(uuid.uuid4())
-                
-                # Add Apps SDK specific metadata
-                item["category"] = category
-                item["date_info"] = {
-                    "month": month,
-                    "day": day,
-                    "formatted": f"{month:02d}/{day:02d}"
-                }
-                
-                # Add interaction metadata
-                item["is_favorite"] = item["id"] in user_favorites
-                item["interaction_count"] = 0
-                
-                # Enhanced descriptions for better UI
-                if "text" in item:
-                    item["enhanced_description"] = enhance_description(item["text"], item.get("year"))
-                
-                # Add geographic data if available
-                if "pages" in item and len(item["pages"]) > 0:
-                    page = item["pages"][0]
-                    item["primary_page"] = {
-                        "title": page.get("title", ""),
-                        "extract": page.get("extract", "")[:200] + "..." if page.get("extract", "") else "",
-                        "thumbnail": page.get("thumbnail", {}),
-                        "content_urls": page.get("content_urls", {})
-                    }
+    for category in categories:
+        if category in ENHANCED_CATEGORIES:
+            enhanced[category] = [enhance_item(item, month, day, current_year) for item in record.items(category)]
+        else:
+            enhanced[category] = [item.to_dict() for item in record.items(category)]
     
     # Add discovery recommendations
     enhanced["recommendations"] = generate_recommendations(enhanced, month, day)
     
     # Add Apps SDK component metadata
     enhanced["component_metadata"] = {
+        "stale": record.stale,
         "total_events": len(enhanced.get("events", [])),
         "total_births": len(enhanced.get("births", [])),
         "total_deaths": len(enhanced.get("deaths", [])),
@@ -116,67 +91,65 @@ def enhance_historical_data(data: dict, month: int, day: int) -> dict:
         "date_formatted": f"{datetime(2024, month, day).strftime('%B %d')}",
         "has_images": any(
             item.get("primary_page", {}).get("thumbnail")
-            for category in ["events", "births", "deaths", "holidays"]
+            for category in ENHANCED_CATEGORIES
             for item in enhanced.get(category, [])
         )
     }
     
     return enhanced
 
-def enhance_description(text: str, year: Optional[int]) -> dict:
-    """Create enhanced description with Apps SDK metadata"""
+def enhance_item(item: records.ItemRecord, month: int, day: int, current_year: int) -> dict:
+    """Apps SDK view of one item: the shared record view plus this request's fields"""
+    enhanced = item.overlay(
+        # Add Apps SDK specific metadata
+        category=item.category,
+        date_info={
+            "month": month,
+            "day": day,
+            "formatted": f"{month:02d}/{day:02d}"
+        },
+        # Add interaction metadata
+        is_favorite=item.id in user_favorites,
+        interaction_count=0,
+        # Enhanced descriptions for better UI
+        enhanced_description=enhance_description(item, current_year)
+    )
+    
+    # Add geographic data if available
+    page = item.primary_page
+    if page is not None:
+        page_view = page.to_dict()
+        enhanced["primary_page"] = {
+            "title": page.title,
+            "extract": page.extract_preview,
+            "thumbnail": page_view.get("thumbnail", {}),
+            "content_urls": page_view.get("content_urls", {})
+        }
+    
+    return enhanced
+
+def enhance_description(item: records.ItemRecord, current_year: Optional[int] = None) -> dict:
+    """Create enhanced description with Apps SDK metadata; only time_ago depends on today"""
     return {
-        "summary": text[:150] + "..." if len(text) > 150 else text,
-        "full_text": text,
-        "year": year,
-        "era": get_historical_era(year) if year else None,
-        "time_ago": get_time_ago(year) if year else None
+        "summary": item.summary,
+        "full_text": item.text,
+        "year": item.year,
+        "era": item.era,
+        "time_ago": item.time_ago(current_year)
     }
 
-def get_historical_era(year: int) -> str:
-    """Get historical era for better categorization"""
-    if year >= 2000:
-        return "21st Century"
-    elif year >= 1900:
-        return "20th Century"
-    elif year >= 1800:
-        return "19th Century"
-    elif year >= 1700:
-        return "18th Century"
-    elif year >= 1600:
-        return "17th Century"
-    elif year >= 1500:
-        return "16th Century"
-    elif year >= 1000:
-        return "Medieval Period"
-    else:
-        return "Ancient Times"
-
-def get_time_ago(year: int) -> str:
-    """Get human-readable time ago"""
-    current_year = datetime.now().year
-    years_ago = current_year - year
-    
-    if years_ago < 10:
-        return f"{years_ago} years ago"
-    elif years_ago < 100:
-        return f"{years_ago // 10 * 10}+ years ago"
-    elif years_ago < 1000:
-        return f"{years_ago // 100} centuries ago"
-    else:
-        return f"{years_ago // 1000}+ millennia ago"
-
 def generate_recommendations(data: dict, month: int, day: int) -> dict:
     """Generate discovery recommendations for Apps SDK carousel"""
     recommendations = {
         "related_dates": [
-            {"month": month, "day": (day + i) % 31 + 1, "reason": f"{i} days later"}
-            for i in [1, 7, 30]
+            {"month": related_month, "day": related_day, "reason": f"{i} days later"}
+            for i in prefetch.RECOMMENDED_OFFSETS
+            for related_month, related_day in [prefetch.shift_date(month, day, i)]
         ],
         "same_month_highlights": [
-            {"month": month, "day": day + 10, "reason": "Major events this month"}
-            for day in [1, 15]
-            if day != day
+            {"month": month, "day": target_day, "reason": "Major events this month"}
+            for target_day in [1, 15]
+            if target_day != day
         ][:2],
         "historical_anniversaries": [
             {"month": month, "day": day, "year_offset": offset, "reason": f"{offset} years ago"}
@@ -201,8 +174,14 @@ def generate_recommendations(data: dict, month: int, day: int) -> dict:
     
     return recommendations
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the shared upstream client for the lifetime of the app"""
+    async with lifecycle.running():
+        yield
+
 # FastAPI app setup
-app = FastAPI(title="Historical Facts Apps SDK Server", version="2.0.0")
+app = FastAPI(title="Historical Facts Apps SDK Server", version="2.0.0", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Pluggable upstream backends for the On This Day feed
+
+Every upstream GET goes through the shared client in upstream.py. The backend
+decides what answers it:
+
+    live    the Wikimedia API, or whatever HISTORICAL_FACTS_UPSTREAM_URL points at
+    corpus  a corpus file built by corpus.py, answered in-process
+    fake    a local ASGI imitation of the Wikimedia feed that serves recorded
+            fixtures, with configurable latency and error injection
+
+Coalescing, rate limiting, retries, the circuit breaker, hedging, conditional
+requests and the day cache all run unchanged on every backend. That makes
+servers, tests and benchmarks runnable offline and reproducibly:
+
+    HISTORICAL_FACTS_UPSTREAM=fake python mcp_http_server.py
+
+The corpus backend differs from corpus mode (HISTORICAL_FACTS_CORPUS), which
+skips the upstream path and the caches altogether. It is meant for
+benchmarking that path against real data without touching the network.
+
+Fixtures are `MM-DD.json` files holding the day's `all` feed payload. A few
+are bundled in fixtures/onthisday. A corpus file can be used instead. The fake
+answers dates without their own fixture with one of the others, so every
+calendar date works. It also honours If-None-Match with a 304, as Wikimedia
+does. Record more fixtures from the live API, or serve the fake over HTTP for
+another process (point its HISTORICAL_FACTS_UPSTREAM_URL at it), with:
+
+    python backends.py record 03-14 10-31 [--output DIR] [--limit N]
+    python backends.py serve [--host HOST] [--port PORT]
+
+Settings are read from the environment:
+
+    HISTORICAL_FACTS_UPSTREAM           live, corpus or fake (default live)
+    HISTORICAL_FACTS_UPSTREAM_CORPUS    corpus file for the corpus backend
+                                        (default corpus/historical-facts-corpus.json)
+    HISTORICAL_FACTS_FAKE_FIXTURES      fixture directory or corpus file for the fake
+                                        (default the bundled fixtures)
+    HISTORICAL_FACTS_FAKE_LATENCY       seconds the fake waits before answering (default 0)
+    HISTORICAL_FACTS_FAKE_JITTER        extra random latency of up to this many seconds (default 0)
+    HISTORICAL_FACTS_FAKE_ERROR_RATE    fraction of requests answered with an error (default 0)
+    HISTORICAL_FACTS_FAKE_ERROR_STATUS  status of injected errors (default 503; 429 adds Retry-After)
+    HISTORICAL_FACTS_FAKE_SEED          seed for injected latency and errors (default 0)
+
+License: MIT
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+import corpus
+import upstream
+
+logger = logging.getLogger("historical-facts-backends")
+
+LIVE = "live"
+CORPUS = "corpus"
+FAKE = "fake"
+BACKENDS = (LIVE, CORPUS, FAKE)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "onthisday")
+
+# Feed types Wikimedia serves under onthisday/{type}/MM/DD
+FEED_TYPES = ("all", "selected", "births", "deaths", "events", "holidays")
+
+Answer = Tuple[int, Dict[str, str], bytes]
+
+
+def backend_name() -> str:
+    """Backend selected by HISTORICAL_FACTS_UPSTREAM"""
+    name = (os.environ.get("HISTORICAL_FACTS_UPSTREAM") or LIVE).strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(f"HISTORICAL_FACTS_UPSTREAM must be one of {', '.join(BACKENDS)}, not {name!r}")
+    return name
+
+
+def parse_feed_path(path: str) -> Optional[Tuple[str, int, int]]:
+    """(feed type, month, day) from a path ending in {type}/MM/DD, or None if it is not one"""
+    parts = path.rstrip("/").split("/")
+    if len(parts) < 3:
+        return None
+    event_type, month, day = parts[-3:]
+    if event_type not in FEED_TYPES or not month.isdigit() or not day.isdigit():
+        return None
+    try:
+        date(2024, int(month), int(day))  # leap year, so 02/29 is valid
+    except ValueError:
+        return None
+    return event_type, int(month), int(day)
+
+
+class PayloadStore:
+    """`all` feed payloads keyed "MM-DD", answering any feed type for a stored date"""
+
+    def __init__(self, days: Dict[str, Dict[str, Any]], fallback: bool = False):
+        if not days:
+            raise ValueError("No On This Day payloads to serve")
+        self.days = days
+        self.fallback = fallback
+        self._keys = sorted(days)
+        self._bodies: Dict[Tuple[str, str], Tuple[bytes, str]] = {}
+
+    @classmethod
+    def from_path(cls, path: str, fallback: bool = False) -> "PayloadStore":
+        """Load a fixture directory of MM-DD.json files, or a corpus file"""
+        if not os.path.isdir(path):
+            return cls(corpus.read_corpus(path)["days"], fallback)
+        days = {}
+        for name in sorted(os.listdir(path)):
+            key, ext = os.path.splitext(name)
+            if ext == ".json":
+                with open(os.path.join(path, name), "rb") as f:
+                    days[key] = json.loads(f.read())
+        return cls(days, fallback)
+
+    def key_for(self, month: int, day: int) -> Optional[str]:
+        key = corpus.day_key(month, day)
+        if key in self.days:
+            return key
+        if not self.fallback:
+            return None
+        # Spread missing dates over the stored ones, the same way every run
+        index = (date(2024, month, day) - date(2024, 1, 1)).days
+        return self._keys[index % len(self._keys)]
+
+    def _body(self, event_type: str, key: str) -> Tuple[bytes, str]:
+        cached = self._bodies.get((event_type, key))
+        if cached is None:
+            payload = self.days[key]
+            data = payload if event_type == "all" else {event_type: payload.get(event_type, [])}
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+            cached = self._bodies[(event_type, key)] = (body, etag)
+        return cached
+
+    def answer(self, method: str, path: str, if_none_match: Optional[str] = None) -> Answer:
+        """(status, headers, body) for a request to the feed"""
+        if method == "HEAD":
+            return 200, {}, b""
+        feed = parse_feed_path(path)
+        key = feed and self.key_for(feed[1], feed[2])
+        if key is None:
+            return 404, {"content-type": "application/problem+json"}, b'{"title":"Not found."}'
+        body, etag = self._body(feed[0], key)
+        if if_none_match == etag:
+            return 304, {"etag": etag}, b""
+        return 200, {"content-type": "application/json; charset=utf-8", "etag": etag}, body
+
+
+class CorpusTransport(httpx.AsyncBaseTransport):
+    """Answers upstream GETs from a corpus file without leaving the process"""
+
+    def __init__(self, store: PayloadStore):
+        self.store = store
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        status, headers, body = self.store.answer(request.method, request.url.path,
+                                                  request.headers.get("If-None-Match"))
+        return httpx.Response(status, headers=headers, content=body)
+
+
+class FakeWikimedia:
+    """ASGI app imitating the Wikimedia On This Day feed, with injected latency and errors"""
+
+    def __init__(self, store: PayloadStore, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 503, seed: int = 0):
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+
+    @classmethod
+    def from_env(cls) -> "FakeWikimedia":
+        fixtures = os.environ.get("HISTORICAL_FACTS_FAKE_FIXTURES") or FIXTURES_DIR
+        return cls(
+            PayloadStore.from_path(fixtures, fallback=True),
+            latency=upstream.env_float("HISTORICAL_FACTS_FAKE_LATENCY", 0.0),
+            jitter=upstream.env_float("HISTORICAL_FACTS_FAKE_JITTER", 0.0),
+            error_rate=upstream.env_float("HISTORICAL_FACTS_FAKE_ERROR_RATE", 0.0),
+            error_status=upstream.env_int("HISTORICAL_FACTS_FAKE_ERROR_STATUS", 503),
+            seed=upstream.env_int("HISTORICAL_FACTS_FAKE_SEED", 0),
+        )
+
+    def _injected_error(self) -> Answer:
+        headers = {"content-type": "application/problem+json"}
+        if self.error_status == 429:
+            headers["retry-after"] = "1"
+        return self.error_status, headers, b'{"title":"Injected error."}'
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            return
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter > 0 else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.error_rate > 0 and self.random.random() < self.error_rate:
+            status, headers, body = self._injected_error()
+        else:
+            request_headers = {name.decode("latin-1").lower(): value.decode("latin-1")
+                               for name, value in scope.get("headers", [])}
+            status, headers, body = self.store.answer(scope["method"], scope["path"],
+                                                      request_headers.get("if-none-match"))
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def create_transport(name: Optional[str] = None) -> Optional[httpx.AsyncBaseTransport]:
+    """Transport for a backend; None for live, which uses the network"""
+    name = name or backend_name()
+    if name == CORPUS:
+        path = os.environ.get("HISTORICAL_FACTS_UPSTREAM_CORPUS") or corpus.DEFAULT_CORPUS_PATH
+        return CorpusTransport(PayloadStore.from_path(path))
+    if name == FAKE:
+        return httpx.ASGITransport(app=FakeWikimedia.from_env())
+    return None
+
+
+def install(name: Optional[str] = None) -> str:
+    """Point the shared upstream client at a backend (called from lifecycle.running())"""
+    name = name or backend_name()
+    upstream.set_transport(create_transport(name))
+    if name != LIVE:
+        logger.info(f"Upstream backend: {name} (no requests leave the process)")
+    return name
+
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+async def record(dates: Sequence[Tuple[int, int]], output_dir: str, limit: int = 0) -> List[str]:
+    """
+    Fetch days from the live API into fixture files; returns the paths written.
+
+    With limit, each category keeps only its first `limit` items, so fixtures
+    stay small enough to commit.
+    """
+    install(LIVE)
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    try:
+        for month, day in dates:
+            payload = json.loads(await upstream.fetch_onthisday_body("all", month, day))
+            if limit > 0:
+                payload = {category: items[:limit] for category, items in payload.items()}
+            path = os.path.join(output_dir, f"{corpus.day_key(month, day)}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, indent=1)
+                f.write("\n")
+            written.append(path)
+            logger.info(f"Recorded {month:02d}/{day:02d} to {path}")
+    finally:
+        await upstream.close_client()
+    return written
+
+
+def serve(host: str, port: int) -> None:
+    """Serve the fake feed over HTTP at /feed/v1/wikipedia/en/onthisday/{type}/MM/DD"""
+    import uvicorn  # only needed to serve the fake standalone
+
+    logger.info(f"Fake Wikimedia feed on http://{host}:{port}/feed/v1/wikipedia/en/onthisday")
+    uvicorn.run(FakeWikimedia.from_env(), host=host, port=port, lifespan="off")
+
+
+def _parse_date(value: str) -> Tuple[int, int]:
+    feed = parse_feed_path(f"all/{value.replace('-', '/')}")
+    if feed is None:
+        raise argparse.ArgumentTypeError(f"not a calendar date (MM-DD): {value!r}")
+    return feed[1], feed[2]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Upstream backends for offline runs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="record fixtures from the live API")
+    record_parser.add_argument("dates", nargs="+", type=_parse_date, help="dates to record, as MM-DD")
+    record_parser.add_argument("--output", default=FIXTURES_DIR,
+                               help=f"fixture directory (default: {FIXTURES_DIR})")
+    record_parser.add_argument("--limit", type=int, default=10,
+                               help="items kept per category, 0 for all (default: 10)")
+    serve_parser = subparsers.add_parser("serve", help="serve the fake feed over HTTP")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        asyncio.run(record(args.dates, args.output, args.limit))
+    else:
+        serve(args.host, args.port)
@@ -7,28 +7,37 @@ Specifically designed to eliminate 424 errors in ChatGPT
 import asyncio
 import json
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime, date
 from typing import Any, Dict, List, Optional
 import httpx
 import random
-import uuid
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware  
 from fastapi.responses import JSONResponse
 import uvicorn
 
+import day_cache
+import lifecycle
+import rollover
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("chatgpt-optimized-mcp")
 
-# Wikipedia API
-WIKI_API_BASE = "https://api.wikimedia.org/feed/v1/wikipedia/en/onthisday"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the shared upstream client for the lifetime of the app"""
+    async with lifecycle.running():
+        yield
+
 
 class ChatGPTOptimizedServer:
     """MCP Server optimized specifically for ChatGPT compatibility"""
     
     def __init__(self):
-        self.app = FastAPI(title="Historical Facts MCP - ChatGPT Optimized")
+        self.app = FastAPI(title="Historical Facts MCP - ChatGPT Optimized", lifespan=lifespan)
         self.setup_middleware()
         self.setup_routes()
         
@@ -126,6 +135,10 @@ class ChatGPTOptimizedServer:
                                                 "type": "string",
                                                 "enum": ["events", "births", "deaths", "all"],
                                                 "description": "Category of historical facts"
+                                            },
+                                            "timezone": {
+                                                "type": "string",
+                                                "description": "IANA timezone of the user, e.g. \"Europe/Paris\" (default: server time)"
                                             }
                                         }
                                     }
@@ -157,7 +170,8 @@ class ChatGPTOptimizedServer:
                     if tool_name == "get_historical_facts":
                         result = await self.get_historical_facts_optimized(tool_args)
                     elif tool_name == "get_todays_facts":
-                        result = await self.get_todays_facts_optimized(tool_args)
+                        timezone = tool_args.get("timezone") or request.headers.get(rollover.TIMEZONE_HEADER)
+                        result = await self.get_todays_facts_optimized({**tool_args, "timezone": timezone})
                     elif tool_name == "get_random_fact":
                         result = await self.get_random_fact_optimized(tool_args)
                     else:
@@ -199,17 +213,12 @@ class ChatGPTOptimizedServer:
                     }
                 }, status_code=200)  # Always return 200 for MCP
     
-    async def fetch_wikipedia_safe(self, endpoint: str) -> dict:
+    async def fetch_wikipedia_safe(self, category: str, month: int, day: int) -> dict:
         """Ultra-safe Wikipedia fetch with aggressive timeouts for ChatGPT"""
         try:
             # Very conservative settings for ChatGPT compatibility
             timeout = httpx.Timeout(8.0, connect=3.0)  # Much shorter timeouts
-            limits = httpx.Limits(max_keepalive_connections=2, max_connections=3)
-            
-            async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
-                response = await client.get(endpoint)
-                response.raise_for_status()
-                return response.json()
+            return await day_cache.get_feed(category, month, day, timeout=timeout)
         except Exception as e:
             logger.warning(f"Wikipedia fetch failed: {e}")
             return {}
@@ -229,13 +238,10 @@ class ChatGPTOptimizedServer:
             except ValueError:
                 return {"text": "Invalid date format. Please use YYYY-MM-DD"}
             
-            # Fetch data with timeout protection
-            endpoint = f"{WIKI_API_BASE}/{category}/{month:02d}/{day:02d}"
-            
-            # Use asyncio.wait_for for additional timeout protection
+            # Fetch data with timeout protection (asyncio.wait_for as a hard cap)
             try:
                 data = await asyncio.wait_for(
-                    self.fetch_wikipedia_safe(endpoint), 
+                    self.fetch_wikipedia_safe(category, month, day), 
                     timeout=10.0  # Hard timeout for ChatGPT
                 )
             except asyncio.TimeoutError:
@@ -251,6 +257,8 @@ class ChatGPTOptimizedServer:
             
             # Create simple text response for ChatGPT
             text_response = f"Historical {category} for {date_str}:\\n\\n"
+            if day_cache.is_stale(data):
+                text_response += f"{day_cache.STALE_NOTICE}\\n\\n"
             for i, item in enumerate(items, 1):
                 title = item.get("text", "Historical Event")[:100]  # Truncate for ChatGPT
                 description = item.get("extract", "")[:200]  # Limit description
@@ -270,7 +278,7 @@ class ChatGPTOptimizedServer:
     
     async def get_todays_facts_optimized(self, args: dict) -> dict:
         """Get today's historical facts optimized for ChatGPT"""
-        today = datetime.now()
+        today = rollover.today(args.get("timezone"))
         return await self.get_historical_facts_optimized({
             "date": today.strftime("%Y-%m-%d"),
             "category": args.get("category", "events")
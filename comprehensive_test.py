@@ -2,21 +2,37 @@
 """
 Comprehensive test suite for Historical Facts MCP Server
 Tests all endpoints, tools, and integration points
+
+Runs against a deployed server ($HISTORICAL_FACTS_TEST_URL), or with --offline
+against http_server.py in-process, with upstream answered by the local fake
+Wikimedia backend (see backends.py).
 """
 
 import asyncio
 import json
+import os
 import sys
 from datetime import datetime
 import httpx
 
 
-BASE_URL = "https://historical-facts-api-morphvm-87kmb6bw.http.cloud.morph.so"
+BASE_URL = os.environ.get("HISTORICAL_FACTS_TEST_URL",
+                          "https://historical-facts-api-morphvm-87kmb6bw.http.cloud.morph.so")
+
+# ASGI app under test when running --offline
+APP = None
+
+
+def api_client() -> httpx.AsyncClient:
+    """Client for the server under test"""
+    if APP is not None:
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=APP), timeout=30.0)
+    return httpx.AsyncClient(timeout=30.0)
 
 async def test_health_endpoint():
     """Test the health check endpoint"""
     print("🩺 Testing health endpoint...")
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with api_client() as client:
         response = await client.get(f"{BASE_URL}/health")
         assert response.status_code == 200
         data = response.json()
@@ -28,7 +44,7 @@ async def test_health_endpoint():
 async def test_root_endpoint():
     """Test the root information endpoint"""
     print("🏠 Testing root endpoint...")
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with api_client() as client:
         response = await client.get(f"{BASE_URL}/")
         assert response.status_code == 200
         data = response.json()
@@ -41,7 +57,7 @@ async def test_root_endpoint():
 async def test_specific_date_endpoint():
     """Test getting facts for a specific date"""
     print("📅 Testing specific date endpoint (July 4th)...")
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with api_client() as client:
         response = await client.get(f"{BASE_URL}/historical-facts/7/4")
         assert response.status_code == 200
         data = response.json()
@@ -55,7 +71,7 @@ async def test_specific_date_endpoint():
 async def test_today_endpoint():
     """Test getting today's historical facts"""
     print("📆 Testing today's facts endpoint...")
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with api_client() as client:
         response = await client.get(f"{BASE_URL}/historical-facts/today")
         assert response.status_code == 200
         data = response.json()
@@ -69,7 +85,7 @@ async def test_today_endpoint():
 async def test_random_endpoint():
     """Test getting random historical facts"""
     print("🎲 Testing random facts endpoint...")
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with api_client() as client:
         response = await client.get(f"{BASE_URL}/historical-facts/random")
         assert response.status_code == 200
         data = response.json()
@@ -86,7 +102,7 @@ async def test_event_type_filtering():
     event_types = ["events", "births", "deaths"]
     
     for event_type in event_types:
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        async with api_client() as client:
             response = await client.get(f"{BASE_URL}/historical-facts/1/1?event_type={event_type}")
             assert response.status_code == 200
             data = response.json()
@@ -108,7 +124,7 @@ async def test_mcp_tool_calls():
         "arguments": {"event_type": "events"}
     }
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with api_client() as client:
         response = await client.post(
             f"{BASE_URL}/mcp/call-tool",
             json=tool_request,
@@ -125,7 +141,7 @@ async def test_mcp_tool_calls():
         "arguments": {"month": 12, "day": 25, "event_type": "all"}
     }
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with api_client() as client:
         response = await client.post(
             f"{BASE_URL}/mcp/call-tool",
             json=tool_request,
@@ -142,7 +158,7 @@ async def test_mcp_tool_calls():
         "arguments": {"event_type": "events"}
     }
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with api_client() as client:
         response = await client.post(
             f"{BASE_URL}/mcp/call-tool",
             json=tool_request,
@@ -161,13 +177,13 @@ async def test_error_handling():
     print("⚠️  Testing error handling...")
     
     # Test invalid date
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with api_client() as client:
         response = await client.get(f"{BASE_URL}/historical-facts/13/40")
         assert response.status_code == 400
         print("  ✅ Invalid date handling works")
     
     # Test invalid event type
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with api_client() as client:
         response = await client.get(f"{BASE_URL}/historical-facts/1/1?event_type=invalid")
         assert response.status_code == 400
         print("  ✅ Invalid event type handling works")
@@ -179,7 +195,7 @@ async def test_data_quality():
     """Test data quality and format"""
     print("📊 Testing data quality...")
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with api_client() as client:
         response = await client.get(f"{BASE_URL}/historical-facts/1/15")
         data = response.json()
         
@@ -244,6 +260,21 @@ async def run_all_tests():
         return False
 
 
+async def run_offline_tests():
+    """Run all tests against http_server.py in-process, on the fake upstream backend"""
+    global APP, BASE_URL
+    os.environ.setdefault("HISTORICAL_FACTS_UPSTREAM", "fake")
+    os.environ.setdefault("HISTORICAL_FACTS_CACHE_DIR", "off")
+    import http_server
+
+    APP, BASE_URL = http_server.app, "http://testserver"
+    async with APP.router.lifespan_context(APP):
+        return await run_all_tests()
+
+
 if __name__ == "__main__":
-    result = asyncio.run(run_all_tests())
+    if "--offline" in sys.argv[1:]:
+        result = asyncio.run(run_offline_tests())
+    else:
+        result = asyncio.run(run_all_tests())
     sys.exit(0 if result else 1)
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Offline corpus of the Wikimedia "On This Day" feed
+
+The whole dataset is 366 `all/MM/DD` payloads. build_corpus() fetches every
+one of them with bounded concurrency, checkpointing each day to a work
+directory so an interrupted build resumes where it stopped, and then writes a
+single versioned corpus file.
+
+Servers started with HISTORICAL_FACTS_CORPUS pointing at that file run in
+"corpus mode": every date tool is answered from the corpus with zero network
+calls.
+
+Each build also writes a binary copy of the corpus next to the JSON file
+(`.bin`). It holds a header, the JSON metadata, a 366-entry table of each
+day's (offset, length), then each day's compact encoded records. Servers
+pointed at the binary file mmap it instead of parsing the whole year: a day
+lookup is an O(1) slice, only the days actually requested are decoded (and
+a bounded number of them kept), and the mapped pages are shared by every
+worker process through the OS page cache.
+
+Usage:
+    historical-facts-mcp build-corpus [--output PATH] [--concurrency N]
+    historical-facts-mcp pack-corpus [--corpus PATH] [--output PATH]
+    python corpus.py [--output PATH] [--concurrency N]
+
+Settings are read from the environment:
+
+    HISTORICAL_FACTS_CORPUS               corpus file (JSON or binary) for corpus mode
+    HISTORICAL_FACTS_CORPUS_DECODED_DAYS  days of a binary corpus kept decoded per process (default 64)
+
+License: MIT
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+import records
+import upstream
+
+logger = logging.getLogger("historical-facts-corpus")
+
+CORPUS_FORMAT = "historical-facts-corpus"
+CORPUS_VERSION = 1
+
+DEFAULT_CORPUS_PATH = os.path.join("corpus", "historical-facts-corpus.json")
+
+# Binary corpus layout: header, metadata JSON, day table, then one blob per day
+BINARY_MAGIC = b"HFCORPUS"
+BINARY_VERSION = 1
+_HEADER = struct.Struct("<8sHHI")   # magic, version, table entries, metadata length
+_DAY_ENTRY = struct.Struct("<QI")   # offset and length of a day's blob; (0, 0) if missing
+_PACKED_FIELDS = ("text", "year", "pages")
+
+DECODED_DAYS = upstream.env_int("HISTORICAL_FACTS_CORPUS_DECODED_DAYS", 64)
+
+# Loaded corpus: "MM-DD" -> the day converted to records (see records.py), or
+# the mapped binary corpus
+_days: Optional[Dict[str, records.DayRecord]] = None
+_binary: Optional["BinaryCorpus"] = None
+_metadata: Dict[str, object] = {}
+
+
+def all_dates() -> List[Tuple[int, int]]:
+    """Every (month, day) in a leap year, so Feb 29 is included"""
+    start = date(2024, 1, 1)
+    days = (start + timedelta(days=i) for i in range(366))
+    return [(d.month, d.day) for d in days]
+
+
+def day_key(month: int, day: int) -> str:
+    return f"{month:02d}-{day:02d}"
+
+
+def day_index(month: int, day: int) -> int:
+    """Position of a date in all_dates(), i.e. its slot in the binary day table"""
+    return (date(2024, month, day) - date(2024, 1, 1)).days
+
+
+def binary_path(corpus_file: str) -> str:
+    """Where the binary copy of a JSON corpus file is written"""
+    return f"{os.path.splitext(corpus_file)[0]}.bin"
+
+
+def corpus_path() -> Optional[str]:
+    """Corpus file configured for this process, if any"""
+    return os.environ.get("HISTORICAL_FACTS_CORPUS") or None
+
+
+# ---------------------------------------------------------------------------
+# Building
+# ---------------------------------------------------------------------------
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+async def _fetch_day(month: int, day: int, checkpoint_dir: str, semaphore: asyncio.Semaphore,
+                     retries: int) -> bool:
+    path = os.path.join(checkpoint_dir, f"{day_key(month, day)}.json")
+    if os.path.exists(path):
+        return True
+
+    async with semaphore:
+        for attempt in range(1, retries + 1):
+            try:
+                body = await upstream.fetch_onthisday_body("all", month, day)
+                json.loads(body)  # never checkpoint a truncated or non-JSON body
+                await asyncio.to_thread(_write_atomic, path, body)
+                return True
+            except (httpx.HTTPError, ValueError) as e:
+                logger.warning(f"Fetching {month:02d}/{day:02d} failed (attempt {attempt}/{retries}): {e}")
+                if attempt < retries:
+                    await asyncio.sleep(2 ** attempt)
+    return False
+
+
+def _assemble(checkpoint_dir: str, output_path: str) -> None:
+    days = {}
+    for month, day in all_dates():
+        key = day_key(month, day)
+        with open(os.path.join(checkpoint_dir, f"{key}.json"), "rb") as f:
+            days[key] = json.loads(f.read())
+
+    corpus = {
+        "format": CORPUS_FORMAT,
+        "version": CORPUS_VERSION,
+        "built_at": datetime.now().isoformat(),
+        "source": upstream.WIKI_API_BASE,
+        "day_count": len(days),
+        "days": days,
+    }
+    _write_atomic(output_path, json.dumps(corpus, ensure_ascii=False).encode("utf-8"))
+    _write_atomic(binary_path(output_path), pack(corpus))
+
+
+async def build_corpus(output_path: str = DEFAULT_CORPUS_PATH, checkpoint_dir: Optional[str] = None,
+                       concurrency: int = 4, retries: int = 3) -> bool:
+    """
+    Fetch all 366 `all/MM/DD` payloads and write a versioned corpus file.
+
+    Days already present in checkpoint_dir are skipped, so re-running after a
+    failure only fetches what is missing.
+
+    Returns:
+        True if the corpus was written, False if some days are still missing
+    """
+    checkpoint_dir = checkpoint_dir or f"{output_path}.parts"
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    dates = all_dates()
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(*[
+        _fetch_day(month, day, checkpoint_dir, semaphore, retries) for month, day in dates
+    ])
+
+    missing = [f"{month:02d}/{day:02d}" for (month, day), ok in zip(dates, results) if not ok]
+    if missing:
+        logger.error(f"{len(missing)} of {len(dates)} days could not be fetched ({', '.join(missing[:10])}"
+                     f"{', ...' if len(missing) > 10 else ''}); re-run to resume")
+        return False
+
+    await asyncio.to_thread(_assemble, checkpoint_dir, output_path)
+    logger.info(f"Wrote corpus with {len(dates)} days to {output_path}")
+    return True
+
+
+def add_build_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument("--output", default=corpus_path() or DEFAULT_CORPUS_PATH,
+                        help=f"corpus file to write (default: $HISTORICAL_FACTS_CORPUS or {DEFAULT_CORPUS_PATH})")
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help="directory for per-day checkpoints (default: <output>.parts)")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="maximum concurrent upstream requests (default: 4)")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="attempts per day before giving up (default: 3)")
+    return parser
+
+
+def run_build(args: argparse.Namespace) -> int:
+    """Run a corpus build from parsed CLI arguments; returns a process exit code"""
+    import backends  # backends reads corpus files, so it imports this module
+
+    backends.install()
+
+    async def _run() -> bool:
+        # The build runs at background priority; --concurrency is that class's upstream limit
+        upstream.set_priority(upstream.BACKGROUND)
+        upstream.scheduler.set_limit(upstream.BACKGROUND, max(args.concurrency, 1))
+        try:
+            return await build_corpus(args.output, args.checkpoint_dir, args.concurrency, args.retries)
+        finally:
+            await upstream.close_client()
+
+    return 0 if asyncio.run(_run()) else 1
+
+
+def pack(corpus: Dict[str, object]) -> bytes:
+    """Encode a corpus (as read by read_corpus()) in the binary format"""
+    metadata = {key: value for key, value in corpus.items() if key != "days"}
+    metadata_bytes = json.dumps(metadata, ensure_ascii=False).encode("utf-8")
+    dates = all_dates()
+    table_offset = _HEADER.size + len(metadata_bytes)
+    offset = table_offset + _DAY_ENTRY.size * len(dates)
+
+    table, blobs = [], []
+    for month, day in dates:
+        payload = corpus["days"].get(day_key(month, day))
+        if payload is None:
+            table.append(_DAY_ENTRY.pack(0, 0))
+            continue
+        # Only what the records keep, re-encoded from them; IDs are recomputed on decode
+        record = records.DayRecord.from_payload(month, day, payload)
+        blob = json.dumps(record.to_dict(fields=_PACKED_FIELDS), ensure_ascii=False,
+                          separators=(",", ":")).encode("utf-8")
+        table.append(_DAY_ENTRY.pack(offset, len(blob)))
+        blobs.append(blob)
+        offset += len(blob)
+
+    header = _HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(dates), len(metadata_bytes))
+    return b"".join([header, metadata_bytes, *table, *blobs])
+
+
+def pack_corpus(corpus_file: str, output_path: Optional[str] = None) -> str:
+    """Write the binary copy of a corpus file; returns its path"""
+    output_path = output_path or binary_path(corpus_file)
+    _write_atomic(output_path, pack(read_corpus(corpus_file)))
+    logger.info(f"Wrote binary corpus to {output_path}")
+    return output_path
+
+
+def add_pack_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_PATH,
+                        help=f"JSON corpus file to pack (default: {DEFAULT_CORPUS_PATH})")
+    parser.add_argument("--output", default=None,
+                        help="binary corpus to write (default: the corpus path with a .bin extension)")
+    return parser
+
+
+def run_pack(args: argparse.Namespace) -> int:
+    """Pack a JSON corpus from parsed CLI arguments; returns a process exit code"""
+    try:
+        pack_corpus(args.corpus, args.output)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not pack the corpus: {e}")
+        return 1
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Corpus mode
+# ---------------------------------------------------------------------------
+
+class BinaryCorpus:
+    """A memory-mapped binary corpus; each day is decoded on first use"""
+
+    def __init__(self, path: str, decoded_days: int = DECODED_DAYS):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, entries, metadata_length = _HEADER.unpack_from(self._map, 0)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION or entries != len(all_dates()):
+            self._map.close()
+            raise ValueError(f"{path} is not a version {BINARY_VERSION} binary corpus")
+        self.metadata = json.loads(self._map[_HEADER.size:_HEADER.size + metadata_length])
+        self._table_offset = _HEADER.size + metadata_length
+        self._decoded: "OrderedDict[int, records.DayRecord]" = OrderedDict()
+        self.decoded_days = max(decoded_days, 1)
+
+    @staticmethod
+    def is_binary(path: str) -> bool:
+        with open(path, "rb") as f:
+            return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+    def day_bytes(self, index: int) -> Optional[bytes]:
+        """Encoded blob of the day at a table index, or None if the corpus lacks it"""
+        offset, length = _DAY_ENTRY.unpack_from(self._map, self._table_offset + index * _DAY_ENTRY.size)
+        return self._map[offset:offset + length] if length else None
+
+    def __len__(self) -> int:
+        return sum(1 for index in range(len(all_dates())) if self.day_bytes(index) is not None)
+
+    def record(self, month: int, day: int) -> Optional[records.DayRecord]:
+        index = day_index(month, day)
+        record = self._decoded.get(index)
+        if record is not None:
+            self._decoded.move_to_end(index)
+            return record
+        blob = self.day_bytes(index)
+        if blob is None:
+            return None
+        record = records.DayRecord.from_payload(month, day, json.loads(blob))
+        self._decoded[index] = record
+        if len(self._decoded) > self.decoded_days:
+            self._decoded.popitem(last=False)
+        return record
+
+    def payloads(self) -> Dict[str, Dict[str, object]]:
+        """Every day decoded to an upstream-shaped payload, keyed "MM-DD" as in a JSON corpus"""
+        payloads = {}
+        for index, (month, day) in enumerate(all_dates()):
+            blob = self.day_bytes(index)
+            if blob is not None:
+                payloads[day_key(month, day)] = json.loads(blob)
+        return payloads
+
+    def close(self) -> None:
+        self._decoded.clear()
+        self._map.close()
+
+
+def read_corpus(path: str) -> Dict[str, object]:
+    """
+    Read and validate a corpus file; raw payloads are under "days", keyed "MM-DD".
+
+    A binary corpus is decoded in full, with the payloads cut down to what
+    records keep.
+
+    Raises:
+        ValueError: if the file is not a corpus of the supported version
+    """
+    if BinaryCorpus.is_binary(path):
+        binary = BinaryCorpus(path)
+        try:
+            return {**binary.metadata, "days": binary.payloads()}
+        finally:
+            binary.close()
+    with open(path, "rb") as f:
+        corpus = json.loads(f.read())
+    if corpus.get("format") != CORPUS_FORMAT or corpus.get("version") != CORPUS_VERSION:
+        raise ValueError(f"{path} is not a version {CORPUS_VERSION} {CORPUS_FORMAT} file")
+    return corpus
+
+
+def load(path: Optional[str] = None) -> bool:
+    """
+    Load the corpus file into memory, or map it if it is a binary corpus.
+
+    Returns:
+        True if a corpus is configured and loaded
+    """
+    global _days, _binary, _metadata
+    path = path or corpus_path()
+    if not path:
+        return False
+
+    if BinaryCorpus.is_binary(path):
+        _binary = BinaryCorpus(path)
+        _metadata = dict(_binary.metadata)
+        logger.info(f"Corpus mode: mapped {len(_binary)} days from {path} (built {_metadata.get('built_at')})")
+        return True
+
+    corpus = read_corpus(path)
+
+    # Convert every day to compact records up front; the raw payloads are dropped
+    _days = {}
+    for key, payload in corpus.pop("days").items():
+        month, day = (int(part) for part in key.split("-"))
+        _days[key] = records.DayRecord.from_payload(month, day, payload)
+    _metadata = corpus
+    logger.info(f"Corpus mode: loaded {len(_days)} days from {path} (built {_metadata.get('built_at')})")
+    return True
+
+
+def active() -> bool:
+    """Whether this process answers date tools from a corpus, loading it on first use"""
+    if _days is None and _binary is None and corpus_path():
+        load()
+    return _days is not None or _binary is not None
+
+
+def get_record(month: int, day: int) -> Optional[records.DayRecord]:
+    """The record for a date from the loaded corpus, or None if the day is missing"""
+    if _binary is not None:
+        return _binary.record(month, day)
+    return _days.get(day_key(month, day)) if _days is not None else None
+
+
+def metadata() -> Dict[str, object]:
+    """Header fields of the loaded corpus (format, version, built_at, ...)"""
+    return dict(_metadata)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = add_build_arguments(argparse.ArgumentParser(description="Build an offline On This Day corpus"))
+    sys.exit(run_build(parser.parse_args()))
@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+"""
+SQLite store of the offline corpus, with full-text search and a year index
+
+A corpus file (see corpus.py) only answers "what happened on MM/DD". This
+module loads it into a SQLite database so it can be queried across all 366
+days with no upstream calls:
+
+    days        one row per calendar date
+    items       every event, birth, death, holiday and selected item, with its
+                stable ID (records.item_id), category, year, text, and region
+                and theme bitmasks (see facets.classify())
+    pages       linked Wikipedia pages, stored once however many items link them
+    item_pages  which pages each item links, in order
+    page_keys   normalized page titles (see entity_key()), the inverted index
+                from an entity name to the items linking it
+    items_fts   FTS5 index over item text, page titles and page extracts
+
+search() ranks matches with BM25, weighting the item text above page titles
+and titles above extracts, and returns ItemRecords like every other date tool.
+The index is contentless (the text lives only in `items`), and the store is
+opened read-only.
+
+facts_for_year() answers "what happened in year X" from an index on
+items(year, day_id, position): one range scan returns the year's items
+already in calendar order, instead of reading all 366 days. facets.py
+builds its bitmaps from facet_rows() and reads matches with items_by_rowid().
+
+facts_about_entity() finds every item linking a Wikipedia page, on any day,
+with two index lookups: the name's key in page_keys, then the page's items in
+item_pages. Keys are case-folded, ignore underscores, diacritics, markup and
+punctuation, and a title without its "(...)" disambiguation is an alias, much
+as a Wikipedia redirect would be: "napoleon", "NAPOLÉON" and "Napoleon_(emperor)"
+all find the page Napoleon, and "Mercury" finds "Mercury (planet)".
+
+Build the store from an existing corpus file with:
+
+    historical-facts-mcp build-search-index [--corpus PATH] [--output PATH]
+    python corpus_store.py [--corpus PATH] [--output PATH]
+
+Settings are read from the environment:
+
+    HISTORICAL_FACTS_SEARCH_INDEX  SQLite store to search (default: the corpus file
+                                   path with a .sqlite extension)
+
+License: MIT
+"""
+
+import argparse
+import html
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+import unicodedata
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import corpus
+import records
+
+logger = logging.getLogger("historical-facts-corpus-store")
+
+STORE_VERSION = 4
+
+MAX_SEARCH_RESULTS = 50
+MAX_YEAR_RESULTS = 200
+MAX_ENTITY_RESULTS = 200
+
+# BM25 column weights for items_fts(text, titles, extracts)
+TEXT_WEIGHT = 4.0
+TITLE_WEIGHT = 2.0
+EXTRACT_WEIGHT = 1.0
+
+SCHEMA = """
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE days (
+    id INTEGER PRIMARY KEY,
+    month INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    UNIQUE (month, day)
+);
+CREATE TABLE pages (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL UNIQUE,
+    displaytitle TEXT,
+    description TEXT,
+    extract TEXT,
+    thumbnail TEXT,
+    thumbnail_width INTEGER,
+    thumbnail_height INTEGER,
+    image TEXT,
+    url TEXT,
+    mobile_url TEXT
+);
+CREATE TABLE items (
+    id INTEGER PRIMARY KEY,
+    item_id TEXT NOT NULL UNIQUE,
+    day_id INTEGER NOT NULL REFERENCES days (id),
+    category TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    year INTEGER,
+    text TEXT NOT NULL,
+    regions INTEGER NOT NULL DEFAULT 0,
+    themes INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX items_by_year ON items (year, day_id, position);
+CREATE TABLE item_pages (
+    item INTEGER NOT NULL REFERENCES items (id),
+    position INTEGER NOT NULL,
+    page INTEGER NOT NULL REFERENCES pages (id),
+    PRIMARY KEY (item, position)
+) WITHOUT ROWID;
+CREATE INDEX item_pages_by_page ON item_pages (page, item);
+CREATE TABLE page_keys (
+    key TEXT NOT NULL,
+    alias INTEGER NOT NULL,
+    page INTEGER NOT NULL REFERENCES pages (id),
+    PRIMARY KEY (key, alias, page)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE items_fts USING fts5 (
+    text, titles, extracts,
+    content = '',
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+_PAGE_COLUMNS = ("title", "displaytitle", "description", "extract", "thumbnail",
+                 "thumbnail_width", "thumbnail_height", "image", "url", "mobile_url")
+
+# Words in a free-text query; everything else (FTS5 operators, quotes) is dropped
+_TERM = re.compile(r"\w+")
+
+_MARKUP = re.compile(r"<[^>]+>")
+_DISAMBIGUATION = re.compile(r"\s*\([^()]*\)$")
+
+_connection: Optional[sqlite3.Connection] = None
+_counters = {
+    "searches": 0,
+    "search_seconds": 0.0,
+    "year_lookups": 0,
+    "year_lookup_seconds": 0.0,
+    "entity_lookups": 0,
+    "entity_lookup_seconds": 0.0,
+}
+
+
+class SearchHit(NamedTuple):
+    """One ranked match: the item and the date it happened on"""
+    month: int
+    day: int
+    item: records.ItemRecord
+    score: float
+
+
+class DatedItem(NamedTuple):
+    """An item and the date it happened on"""
+    month: int
+    day: int
+    item: records.ItemRecord
+
+
+class EntityFacts(NamedTuple):
+    """Items linking the pages an entity name resolved to"""
+    titles: List[str]
+    total: int
+    items: List[DatedItem]
+
+
+def index_path(corpus_file: Optional[str] = None) -> str:
+    """SQLite store path: HISTORICAL_FACTS_SEARCH_INDEX, else next to the corpus file"""
+    configured = os.environ.get("HISTORICAL_FACTS_SEARCH_INDEX")
+    if configured:
+        return configured
+    corpus_file = corpus_file or corpus.corpus_path() or corpus.DEFAULT_CORPUS_PATH
+    return f"{os.path.splitext(corpus_file)[0]}.sqlite"
+
+
+def _plain_title(title: str) -> str:
+    return html.unescape(_MARKUP.sub("", title)).replace("_", " ")
+
+
+def _base_title(title: str) -> str:
+    return _DISAMBIGUATION.sub("", _plain_title(title))
+
+
+def entity_key(title: str) -> str:
+    """
+    Lookup key of a page title or entity name: markup, underscores, diacritics
+    and punctuation removed, case-folded, whitespace collapsed.
+    """
+    decomposed = unicodedata.normalize("NFKD", _plain_title(title))
+    text = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(_TERM.findall(text.casefold()))
+
+
+def entity_keys(title: str, displaytitle: Optional[str] = None) -> Set[Tuple[str, int]]:
+    """(key, alias) pairs a page is found by: its title and display title, and (as
+    aliases) the same without a trailing "(...)" disambiguation"""
+    keys = set()
+    for name in (title, displaytitle):
+        if not name:
+            continue
+        keys.add((entity_key(name), 0))
+        keys.add((entity_key(_base_title(name)), 1))
+    return {(key, alias) for key, alias in keys if key and (alias == 0 or (key, 0) not in keys)}
+
+
+# ---------------------------------------------------------------------------
+# Building
+# ---------------------------------------------------------------------------
+
+def _insert_day(db: sqlite3.Connection, day_id: int, record: records.DayRecord,
+                page_ids: Dict[str, int]) -> int:
+    import facets  # facets reads the store, so it imports this module
+
+    db.execute("INSERT INTO days (id, month, day) VALUES (?, ?, ?)", (day_id, record.month, record.day))
+    count = 0
+    for category in records.CATEGORIES:
+        for position, item in enumerate(record.items(category)):
+            regions, themes = facets.classify_item(item)
+            cursor = db.execute(
+                "INSERT INTO items (item_id, day_id, category, position, year, text, regions, themes) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (item.id, day_id, category, position, item.year, item.text, regions, themes)
+            )
+            rowid = cursor.lastrowid
+            for page_position, page in enumerate(item.pages):
+                page_id = page_ids.get(page.title)
+                if page_id is None:
+                    page_id = db.execute(
+                        f"INSERT INTO pages ({', '.join(_PAGE_COLUMNS)}) VALUES ({', '.join('?' * len(_PAGE_COLUMNS))})",
+                        tuple(getattr(page, column) for column in _PAGE_COLUMNS)
+                    ).lastrowid
+                    page_ids[page.title] = page_id
+                    db.executemany("INSERT INTO page_keys (key, alias, page) VALUES (?, ?, ?)",
+                                   [(key, alias, page_id) for key, alias in entity_keys(page.title, page.displaytitle)])
+                db.execute("INSERT INTO item_pages (item, position, page) VALUES (?, ?, ?)",
+                           (rowid, page_position, page_id))
+            db.execute(
+                "INSERT INTO items_fts (rowid, text, titles, extracts) VALUES (?, ?, ?, ?)",
+                (rowid, item.text,
+                 " ".join(page.label for page in item.pages),
+                 " ".join(page.extract for page in item.pages if page.extract))
+            )
+            count += 1
+    return count
+
+
+def build_index(corpus_file: str, output_path: Optional[str] = None) -> str:
+    """
+    Build the SQLite store for a corpus file; returns its path.
+
+    The store is written to a temporary file and moved into place, so a
+    running server never sees a half-built one.
+    """
+    output_path = output_path or index_path(corpus_file)
+    data = corpus.read_corpus(corpus_file)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    db = sqlite3.connect(tmp_path)
+    try:
+        with db:
+            db.executescript(SCHEMA)
+            page_ids: Dict[str, int] = {}
+            item_count = 0
+            for day_id, (month, day) in enumerate(corpus.all_dates()):
+                payload = data["days"].get(corpus.day_key(month, day))
+                if payload is None:
+                    continue
+                record = records.DayRecord.from_payload(month, day, payload)
+                item_count += _insert_day(db, day_id, record, page_ids)
+            db.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+                ("version", str(STORE_VERSION)),
+                ("corpus_built_at", str(data.get("built_at"))),
+                ("source", str(data.get("source"))),
+                ("items", str(item_count)),
+                ("pages", str(len(page_ids))),
+            ])
+            db.execute("INSERT INTO items_fts (items_fts) VALUES ('optimize')")
+    finally:
+        db.close()
+    os.replace(tmp_path, output_path)
+    logger.info(f"Wrote search index with {item_count} items and {len(page_ids)} pages to {output_path}")
+    return output_path
+
+
+# ---------------------------------------------------------------------------
+# Searching
+# ---------------------------------------------------------------------------
+
+def _connect() -> Optional[sqlite3.Connection]:
+    global _connection
+    if _connection is None:
+        path = index_path()
+        if not os.path.exists(path):
+            return None
+        _connection = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True,
+                                      check_same_thread=False)
+        version = _connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if version is None or version[0] != str(STORE_VERSION):
+            _connection.close()
+            _connection = None
+            raise ValueError(f"{path} is not a version {STORE_VERSION} search index; rebuild it")
+    return _connection
+
+
+def _require() -> sqlite3.Connection:
+    db = _connect()
+    if db is None:
+        raise LookupError(f"No search index at {index_path()}; build one with "
+                          f"`historical-facts-mcp build-search-index`")
+    return db
+
+
+def available() -> bool:
+    """Whether a search index exists for this process"""
+    return _connect() is not None
+
+
+def close() -> None:
+    global _connection
+    if _connection is not None:
+        _connection.close()
+        _connection = None
+
+
+def match_expression(query: str, any_term: bool = False) -> Optional[str]:
+    """FTS5 MATCH expression for free text: every word (or any word) as a quoted term"""
+    terms = _TERM.findall(query.lower())
+    if not terms:
+        return None
+    return (" OR " if any_term else " AND ").join(f'"{term}"' for term in terms)
+
+
+def _pages_for(db: sqlite3.Connection, rowids: List[int]) -> Dict[int, List[records.PageRecord]]:
+    pages: Dict[int, List[records.PageRecord]] = {rowid: [] for rowid in rowids}
+    rows = db.execute(
+        f"SELECT item_pages.item, {', '.join('pages.' + column for column in _PAGE_COLUMNS)} "
+        f"FROM item_pages JOIN pages ON pages.id = item_pages.page "
+        f"WHERE item_pages.item IN ({', '.join('?' * len(rowids))}) "
+        f"ORDER BY item_pages.item, item_pages.position",
+        rowids
+    )
+    for rowid, *values in rows:
+        pages[rowid].append(records.PageRecord(**dict(zip(_PAGE_COLUMNS, values))))
+    return pages
+
+
+def _search(db: sqlite3.Connection, expression: str, category: Optional[str], limit: int) -> List[SearchHit]:
+    # Selected items repeat events of the same day, so they only show up when asked for
+    rows = db.execute(
+        """
+        SELECT items.id, items.item_id, days.month, days.day, items.category, items.year, items.text,
+               bm25(items_fts, ?, ?, ?) AS score
+        FROM items_fts
+        JOIN items ON items.id = items_fts.rowid
+        JOIN days ON days.id = items.day_id
+        WHERE items_fts MATCH ?
+          AND (items.category = ? OR (? IS NULL AND items.category != 'selected'))
+        ORDER BY score, items.day_id, items.position
+        LIMIT ?
+        """,
+        (TEXT_WEIGHT, TITLE_WEIGHT, EXTRACT_WEIGHT, expression, category, category, limit)
+    ).fetchall()
+    if not rows:
+        return []
+    pages = _pages_for(db, [row[0] for row in rows])
+    return [
+        SearchHit(month, day, records.ItemRecord(item_id, category, year, text, tuple(pages[rowid])), -score)
+        for rowid, item_id, month, day, category, year, text, score in rows
+    ]
+
+
+def search(query: str, category: Optional[str] = None, limit: int = 10) -> List[SearchHit]:
+    """
+    Rank items from every day of the corpus against free text.
+
+    Items matching all words come first; if none do, items matching any word
+    are returned instead.
+
+    Raises:
+        LookupError: if there is no search index
+    """
+    db = _require()
+    limit = max(1, min(int(limit), MAX_SEARCH_RESULTS))
+    expression = match_expression(query)
+    if expression is None:
+        return []
+
+    started = time.perf_counter()
+    hits = _search(db, expression, category, limit)
+    if not hits and " AND " in expression:
+        hits = _search(db, match_expression(query, any_term=True), category, limit)
+    _counters["searches"] += 1
+    _counters["search_seconds"] += time.perf_counter() - started
+    return hits
+
+
+def facts_for_year(year: int, category: Optional[str] = None, limit: int = 20) -> List[DatedItem]:
+    """
+    Items from a year (negative for BCE) across the whole corpus, in calendar order.
+
+    Raises:
+        LookupError: if there is no search index
+    """
+    db = _require()
+    limit = max(1, min(int(limit), MAX_YEAR_RESULTS))
+
+    started = time.perf_counter()
+    rows = db.execute(
+        """
+        SELECT items.id, items.item_id, days.month, days.day, items.category, items.text
+        FROM items
+        JOIN days ON days.id = items.day_id
+        WHERE items.year = ?
+          AND (items.category = ? OR (? IS NULL AND items.category != 'selected'))
+        ORDER BY items.day_id, items.position
+        LIMIT ?
+        """,
+        (int(year), category, category, limit)
+    ).fetchall()
+    pages = _pages_for(db, [row[0] for row in rows]) if rows else {}
+    _counters["year_lookups"] += 1
+    _counters["year_lookup_seconds"] += time.perf_counter() - started
+    return [
+        DatedItem(month, day, records.ItemRecord(item_id, category, int(year), text, tuple(pages[rowid])))
+        for rowid, item_id, month, day, category, text in rows
+    ]
+
+
+def facet_rows() -> Iterator[Tuple[int, int, str, Optional[int], int, int]]:
+    """
+    (rowid, day_id, category, year, regions, themes) of every item, in calendar order
+
+    Raises:
+        LookupError: if there is no search index
+    """
+    # Rows are inserted day by day, so rowid order is calendar order
+    return _require().execute("SELECT id, day_id, category, year, regions, themes FROM items ORDER BY id")
+
+
+def items_by_rowid(rowids: List[int]) -> List[DatedItem]:
+    """Items with their dates for store rowids (e.g. from facets), in the order given"""
+    if not rowids:
+        return []
+    db = _require()
+    rows = db.execute(
+        f"SELECT items.id, items.item_id, days.month, days.day, items.category, items.year, items.text "
+        f"FROM items JOIN days ON days.id = items.day_id "
+        f"WHERE items.id IN ({', '.join('?' * len(rowids))})",
+        rowids
+    ).fetchall()
+    pages = _pages_for(db, rowids)
+    found = {
+        rowid: DatedItem(month, day, records.ItemRecord(item_id, category, year, text, tuple(pages[rowid])))
+        for rowid, item_id, month, day, category, year, text in rows
+    }
+    return [found[rowid] for rowid in rowids if rowid in found]
+
+
+def facts_about_entity(title: str, category: Optional[str] = None, limit: int = 20) -> EntityFacts:
+    """
+    Items from every day of the corpus that link a page, in calendar order.
+
+    The name is matched on entity_key(); if no page has that exact key, pages
+    with it as an alias (title without its disambiguation) are used, and
+    failing that the name is retried without its own disambiguation.
+
+    Raises:
+        LookupError: if there is no search index
+    """
+    db = _require()
+    limit = max(1, min(int(limit), MAX_ENTITY_RESULTS))
+    started = time.perf_counter()
+    pages: List[int] = []
+    for key in dict.fromkeys((entity_key(title), entity_key(_base_title(title)))):
+        if key and not pages:
+            pages = [page for page, in db.execute(
+                "SELECT page FROM page_keys WHERE key = ? AND alias = "
+                "(SELECT MIN(alias) FROM page_keys WHERE key = ?)",
+                (key, key)
+            )]
+    facts = EntityFacts([], 0, [])
+    if pages:
+        placeholders = ", ".join("?" * len(pages))
+        matching = (
+            f"FROM item_pages JOIN items ON items.id = item_pages.item "
+            f"WHERE item_pages.page IN ({placeholders}) "
+            f"AND (items.category = ? OR (? IS NULL AND items.category != 'selected'))"
+        )
+        total, = db.execute(f"SELECT COUNT(DISTINCT items.id) {matching}", (*pages, category, category)).fetchone()
+        rowids = [rowid for rowid, in db.execute(
+            f"SELECT DISTINCT items.id {matching} ORDER BY items.id LIMIT ?", (*pages, category, category, limit)
+        )]
+        titles = [name for name, in db.execute(
+            f"SELECT COALESCE(displaytitle, title) FROM pages WHERE id IN ({placeholders}) ORDER BY title", pages
+        )]
+        facts = EntityFacts([_plain_title(name) for name in titles], total, items_by_rowid(rowids))
+    _counters["entity_lookups"] += 1
+    _counters["entity_lookup_seconds"] += time.perf_counter() - started
+    return facts
+
+
+def _average_ms(seconds: str, count: str) -> Optional[float]:
+    return round(1000 * _counters[seconds] / _counters[count], 3) if _counters[count] else None
+
+
+def metrics() -> Dict[str, Any]:
+    """Search counters for health and metrics endpoints"""
+    return {
+        "index": index_path(),
+        "open": _connection is not None,
+        "searches": _counters["searches"],
+        "avg_search_ms": _average_ms("search_seconds", "searches"),
+        "year_lookups": _counters["year_lookups"],
+        "avg_year_lookup_ms": _average_ms("year_lookup_seconds", "year_lookups"),
+        "entity_lookups": _counters["entity_lookups"],
+        "avg_entity_lookup_ms": _average_ms("entity_lookup_seconds", "entity_lookups"),
+    }
+
+
+def add_build_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument("--corpus", default=corpus.corpus_path() or corpus.DEFAULT_CORPUS_PATH,
+                        help=f"corpus file to index (default: $HISTORICAL_FACTS_CORPUS or {corpus.DEFAULT_CORPUS_PATH})")
+    parser.add_argument("--output", default=None,
+                        help="SQLite file to write (default: $HISTORICAL_FACTS_SEARCH_INDEX or the corpus path "
+                             "with a .sqlite extension)")
+    return parser
+
+
+def run_build(args: argparse.Namespace) -> int:
+    """Build the search index from parsed CLI arguments; returns a process exit code"""
+    try:
+        build_index(args.corpus, args.output)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not build the search index: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = add_build_arguments(argparse.ArgumentParser(description="Build the corpus search index"))
+    sys.exit(run_build(parser.parse_args()))
@@ -0,0 +1,561 @@
+#!/usr/bin/env python3
+"""
+Tiered cache for the Wikimedia "On This Day" feed
+
+The dataset is small and bounded (366 days), so every server reads feeds
+through this cache instead of going to the network on each tool call. Lookups
+check a bounded in-memory LRU first, then an on-disk tier that survives
+restarts, and only then fetch upstream. Every entry carries its own expiry
+time. In corpus mode (see corpus.py) feeds are answered from the local corpus
+and the network is never touched.
+
+One entry is kept per date: the upstream `all` payload, which carries every
+category. Requests for a single feed type are answered as views over that day
+record, so a date costs at most one upstream request whatever is asked of it.
+
+Expired entries are not dropped straight away: for up to the configured
+max-staleness they are served immediately while a background refresh queue
+fetches a new copy, so TTL expiry never puts an upstream round-trip on a
+tool call's critical path. The refresh workers run for the lifetime of the
+server (see lifecycle.running()).
+
+If upstream fails (or its circuit breaker is open, see upstream.py) the
+last-known-good copy of the day is served whatever its age. Day records served
+that way, or while the latest background refresh of the day has failed, carry
+"stale": true so servers can tell clients the data may be out of date. An
+expired entry served while its refresh is merely queued is not flagged.
+
+Entries keep the upstream ETag / Last-Modified validators, and refreshes are
+sent as conditional GETs: a 304 renews the entry's expiry without downloading
+or parsing the payload again.
+
+Each cached day is decoded once into compact records (see records.py) that
+every caller shares. get_record() hands out the record itself; get_day() and
+get_feed() build dicts from it holding only the categories, number of items
+and fields the caller asks for.
+
+Settings are read from the environment:
+
+    HISTORICAL_FACTS_CACHE_TTL          entry lifetime in seconds (default 86400)
+    HISTORICAL_FACTS_CACHE_MAX_ENTRIES  in-memory LRU capacity (default 512)
+    HISTORICAL_FACTS_CACHE_DIR          on-disk tier location (default
+                                        ~/.cache/historical-facts-mcp, "off" disables it)
+    HISTORICAL_FACTS_CACHE_MAX_STALE    seconds past expiry an entry may still be served
+                                        while it is refreshed (default 604800, 0 disables)
+    HISTORICAL_FACTS_REFRESH_CONCURRENCY  concurrent background refreshes (default 2)
+
+License: MIT
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+import httpx
+
+import corpus
+import records
+import upstream
+
+logger = logging.getLogger("historical-facts-cache")
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "historical-facts-mcp")
+
+
+class CacheEntry:
+    """A cached feed body with its storage and expiry times (epoch seconds) and upstream validators"""
+
+    __slots__ = ("body", "stored_at", "expires_at", "etag", "last_modified", "_record")
+
+    def __init__(self, body: bytes, stored_at: float, expires_at: float,
+                 etag: Optional[str] = None, last_modified: Optional[str] = None):
+        self.body = body
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+        self._record: Optional[records.DayRecord] = None
+
+    def record(self, month: int, day: int) -> records.DayRecord:
+        """The body converted to a DayRecord, decoded once per entry"""
+        if self._record is None:
+            self._record = records.DayRecord.from_payload(month, day, json.loads(self.body))
+        return self._record
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        return (now if now is not None else time.time()) < self.expires_at
+
+    def is_servable(self, max_stale: float, now: Optional[float] = None) -> bool:
+        """Fresh, or expired by no more than max_stale seconds"""
+        return (now if now is not None else time.time()) < self.expires_at + max_stale
+
+
+class TieredCache:
+    """Bounded in-memory LRU in front of a directory of cached feed bodies"""
+
+    def __init__(self, max_entries: int, directory: Optional[str], default_ttl: float,
+                 max_stale: float = 0.0):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.default_ttl = default_ttl
+        self.max_stale = max_stale
+        self._memory: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.pinned: Set[str] = set()
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "stores": 0,
+            "evictions": 0,
+            "fallbacks": 0,
+            "rejected": 0,      # upstream bodies that did not decode and were not stored
+            "revalidated": 0,   # stale entries renewed by a 304
+            "bytes_saved": 0,   # payload bytes not re-downloaded thanks to 304s
+        }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key.replace("/", "-") + ".json")
+
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            # Evict the least recently used entry that is not pinned
+            victim = next((k for k in self._memory if k not in self.pinned), None)
+            if victim is None:
+                break
+            del self._memory[victim]
+            self.counters["evictions"] += 1
+
+    async def warm(self, key: str) -> Optional[CacheEntry]:
+        """A fresh entry for key, loaded into memory if it was only on disk; None if there is none"""
+        entry = self._memory.get(key)
+        if entry is None and self.directory:
+            entry = await asyncio.to_thread(self._read_disk, key)
+            if entry is not None and entry.is_fresh():
+                self._remember(key, entry)
+        return entry if entry is not None and entry.is_fresh() else None
+
+    def pin(self, keys: Iterable[str]) -> None:
+        """Keep exactly these keys in memory whatever the LRU order (replaces earlier pins)"""
+        self.pinned = set(keys)
+
+    def _read_disk(self, key: str) -> Optional[CacheEntry]:
+        # File layout: one JSON header line with the timestamps and validators, then the raw body
+        try:
+            with open(self._path(key), "rb") as f:
+                header = json.loads(f.readline())
+                body = f.read()
+            return CacheEntry(body, header["stored_at"], header["expires_at"],
+                              header.get("etag"), header.get("last_modified"))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable cache file for {key}: {e}")
+            return None
+
+    def _write_disk(self, key: str, entry: CacheEntry) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            header = json.dumps({
+                "stored_at": entry.stored_at,
+                "expires_at": entry.expires_at,
+                "etag": entry.etag,
+                "last_modified": entry.last_modified,
+            })
+            with open(tmp_path, "wb") as f:
+                f.write(header.encode("utf-8") + b"\n")
+                f.write(entry.body)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not persist cache entry {key}: {e}")
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        Return an entry for key from memory or disk, or None.
+
+        Entries past their expiry are still returned while within max_stale;
+        callers check is_fresh() to decide whether to refresh them.
+        """
+        now = time.time()
+        entry = self._memory.get(key)
+        from_disk = False
+        if entry is None and self.directory:
+            entry = await asyncio.to_thread(self._read_disk, key)
+            from_disk = True
+
+        if entry is not None:
+            if entry.is_servable(self.max_stale, now):
+                if from_disk:
+                    self._remember(key, entry)
+                else:
+                    self._memory.move_to_end(key)
+                if entry.is_fresh(now):
+                    self.counters["disk_hits" if from_disk else "memory_hits"] += 1
+                else:
+                    self.counters["stale_hits"] += 1
+                return entry
+            self.counters["expired"] += 1
+
+        self.counters["misses"] += 1
+        return None
+
+    async def peek(self, key: str) -> Optional[CacheEntry]:
+        """Return whatever copy of key is held in memory or on disk, ignoring expiry and counters"""
+        entry = self._memory.get(key)
+        if entry is None and self.directory:
+            entry = await asyncio.to_thread(self._read_disk, key)
+        return entry
+
+    async def last_known_good(self, key: str) -> Optional[CacheEntry]:
+        """Like peek(), counted as a fallback when upstream could not be reached"""
+        entry = await self.peek(key)
+        if entry is not None:
+            self.counters["fallbacks"] += 1
+        return entry
+
+    async def put(self, key: str, body: bytes, ttl: Optional[float] = None,
+                  etag: Optional[str] = None, last_modified: Optional[str] = None) -> CacheEntry:
+        """Store body under key in both tiers with its own TTL"""
+        now = time.time()
+        entry = CacheEntry(body, now, now + (ttl if ttl is not None else self.default_ttl),
+                           etag, last_modified)
+        self._remember(key, entry)
+        self.counters["stores"] += 1
+        if self.directory:
+            await asyncio.to_thread(self._write_disk, key, entry)
+        return entry
+
+    async def renew(self, key: str, entry: CacheEntry, ttl: Optional[float] = None) -> CacheEntry:
+        """Give an unchanged entry a new lifetime after upstream answered 304"""
+        self.counters["revalidated"] += 1
+        self.counters["bytes_saved"] += len(entry.body)
+        renewed = await self.put(key, entry.body, ttl, entry.etag, entry.last_modified)
+        renewed._record = entry._record
+        return renewed
+
+    def metrics(self) -> Dict[str, Any]:
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["stale_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "memory_entries": len(self._memory),
+            "pinned": sorted(self.pinned),
+            "max_entries": self.max_entries,
+            "hit_ratio": round(hits / lookups, 3) if lookups else None,
+            "disk_tier": self.directory,
+            "max_stale": self.max_stale,
+        }
+
+
+class RefreshQueue:
+    """Background workers that re-fetch stale days off the request path"""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self._queue: "Optional[asyncio.Queue[str]]" = None
+        self._pending: Set[str] = set()
+        self._failing: Set[str] = set()
+        self._workers: List[asyncio.Task] = []
+        self.counters = {
+            "scheduled": 0,
+            "refreshed": 0,
+            "failed": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self) -> None:
+        """Start the refresh workers on the running event loop"""
+        if self.running or self.concurrency <= 0:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        logger.info(f"Background refresh started ({self.concurrency} workers)")
+
+    async def stop(self) -> None:
+        """Cancel the workers; queued refreshes are dropped"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._pending.clear()
+        self._failing.clear()
+
+    def schedule(self, key: str) -> bool:
+        """Queue a refresh for key unless one is already pending; False if not running"""
+        if not self.running:
+            return False
+        if key not in self._pending:
+            self._pending.add(key)
+            self._queue.put_nowait(key)
+            self.counters["scheduled"] += 1
+        return True
+
+    def is_failing(self, key: str) -> bool:
+        """Whether the latest background refresh of key failed"""
+        return key in self._failing
+
+    async def _worker(self) -> None:
+        upstream.set_priority(upstream.BACKGROUND)
+        while True:
+            key = await self._queue.get()
+            try:
+                await _fetch_and_store(key, current=await cache.peek(key))
+                self.counters["refreshed"] += 1
+                self._failing.discard(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.counters["failed"] += 1
+                self._failing.add(key)
+                logger.warning(f"Background refresh of {key} failed, keeping stale copy: {e}")
+            finally:
+                self._pending.discard(key)
+                self._queue.task_done()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "queued": len(self._pending),
+            "failing": len(self._failing),
+            "workers": len(self._workers),
+        }
+
+
+def _cache_directory() -> Optional[str]:
+    directory = os.environ.get("HISTORICAL_FACTS_CACHE_DIR", DEFAULT_CACHE_DIR)
+    if directory.lower() in ("", "off", "none", "0"):
+        return None
+    return directory
+
+
+cache = TieredCache(
+    max_entries=upstream.env_int("HISTORICAL_FACTS_CACHE_MAX_ENTRIES", 512),
+    directory=_cache_directory(),
+    default_ttl=upstream.env_float("HISTORICAL_FACTS_CACHE_TTL", 86400.0),
+    max_stale=upstream.env_float("HISTORICAL_FACTS_CACHE_MAX_STALE", 604800.0),
+)
+
+refresher = RefreshQueue(upstream.env_int("HISTORICAL_FACTS_REFRESH_CONCURRENCY", 2))
+
+
+# Feed categories carried by the upstream `all` payload
+CATEGORIES = records.CATEGORIES
+
+# Set on day records served because upstream could not provide a fresh copy
+STALE_FLAG = "stale"
+
+# Shown by text-rendering servers above results carrying STALE_FLAG
+STALE_NOTICE = "_⚠️ Wikipedia could not be reached; showing cached data that may be out of date._"
+
+# Called with (month, day) whenever a day is served to a client (see prefetch.py)
+_served_hooks: List[Callable[[int, int], Any]] = []
+
+
+def cache_key(month: int, day: int) -> str:
+    return f"all/{month:02d}/{day:02d}"
+
+
+def _parse_key(key: str) -> Tuple[int, int]:
+    _, month, day = key.split("/")
+    return int(month), int(day)
+
+
+async def _fetch_and_store(key: str, timeout: Union[float, httpx.Timeout, None] = None,
+                           current: Optional[CacheEntry] = None) -> CacheEntry:
+    """
+    Fetch a day from upstream into the cache, revalidating current if given.
+
+    The body is decoded before it is stored, so a truncated or non-JSON body
+    never reaches either tier.
+
+    Raises:
+        httpx.HTTPError: if the fetch fails, or httpx.DecodingError if the body
+            does not decode; callers fall back to the last-known-good copy
+    """
+    month, day = _parse_key(key)
+    response = await upstream.fetch_onthisday(
+        "all", month, day, timeout=timeout,
+        etag=current.etag if current else None,
+        last_modified=current.last_modified if current else None,
+    )
+    if response.not_modified and current is not None:
+        return await cache.renew(key, current)
+    try:
+        payload = json.loads(response.body)
+        if not isinstance(payload, dict):
+            raise ValueError(f"expected a JSON object, got {type(payload).__name__}")
+        record = records.DayRecord.from_payload(month, day, payload)
+    except (ValueError, TypeError, AttributeError) as e:
+        cache.counters["rejected"] += 1
+        raise httpx.DecodingError(f"Undecodable upstream body for {key}: {e}") from e
+    entry = await cache.put(key, response.body, etag=response.etag, last_modified=response.last_modified)
+    entry._record = record
+    return entry
+
+
+def category_view(record: dict, event_type: str) -> dict:
+    """Answer one feed type as a view over a day record, shaped like the upstream feed"""
+    if event_type == "all":
+        return record
+    view = {event_type: record.get(event_type, [])}
+    if record.get(STALE_FLAG):
+        view[STALE_FLAG] = True
+    return view
+
+
+def is_stale(data: dict) -> bool:
+    """Whether a day record or view was served from the cache because upstream failed"""
+    return bool(data.get(STALE_FLAG))
+
+
+async def get_record(month: int, day: int,
+                     timeout: Union[float, httpx.Timeout, None] = None,
+                     background: bool = False) -> records.DayRecord:
+    """
+    Get the shared DayRecord for a date: every category from a single `all` fetch.
+
+    The record is shared by every caller and must not be modified. When upstream
+    is unavailable the last-known-good copy is returned with stale set; an
+    expired copy served while a background refresh is queued is not marked.
+    background marks calls made by the server itself (prewarming and the like),
+    which do not count as a client visiting the date.
+
+    Raises:
+        httpx.HTTPError: if the day was never cached and the upstream fetch fails
+    """
+    if corpus.active():
+        record = corpus.get_record(month, day)
+        if record is not None:
+            return record
+        logger.warning(f"Corpus has no entry for {month:02d}/{day:02d}; falling back to upstream")
+
+    key = cache_key(month, day)
+    entry = await cache.get(key)
+    upstream_failed = False
+    if entry is None:
+        try:
+            entry = await _fetch_and_store(key, timeout=timeout)
+        except httpx.HTTPError as e:
+            entry = await cache.last_known_good(key)
+            if entry is None:
+                raise
+            upstream_failed = True
+            logger.warning(f"Fetching {key} failed, serving last-known-good copy: {e}")
+    elif not entry.is_fresh():
+        if refresher.schedule(key):
+            upstream_failed = refresher.is_failing(key)
+        else:
+            # No background workers (e.g. called outside a server): refresh inline,
+            # keeping the stale copy if upstream is unavailable
+            try:
+                entry = await _fetch_and_store(key, timeout=timeout, current=entry)
+            except httpx.HTTPError as e:
+                upstream_failed = True
+                logger.warning(f"Refreshing {key} failed, serving stale copy: {e}")
+    if not background:
+        for hook in _served_hooks:
+            hook(month, day)
+    record = entry.record(month, day)
+    return record.marked_stale() if upstream_failed else record
+
+
+async def get_day(month: int, day: int,
+                  timeout: Union[float, httpx.Timeout, None] = None,
+                  categories: Optional[Sequence[str]] = None,
+                  limit: Optional[int] = None,
+                  fields: Optional[Sequence[str]] = None,
+                  page_fields: Optional[Sequence[str]] = None) -> dict:
+    """
+    Get a date's day record as an upstream-shaped dict (see get_record()).
+
+    Each call returns its own copy, so callers may post-process it. Records
+    served because upstream failed are flagged with STALE_FLAG.
+
+    Args:
+        categories: Only decode these categories (default: all)
+        limit: Decode at most this many items per category
+        fields: Only keep these item keys
+        page_fields: Only keep these keys on each of an item's pages
+
+    Raises:
+        httpx.HTTPError: if the day was never cached and the upstream fetch fails
+    """
+    record = await get_record(month, day, timeout=timeout)
+    # Every requested category is present, as an empty list if upstream had none
+    data = record.to_dict(categories, limit, fields, page_fields)
+    if record.stale:
+        data[STALE_FLAG] = True
+    return data
+
+
+async def get_feed(event_type: str, month: int, day: int,
+                   timeout: Union[float, httpx.Timeout, None] = None,
+                   limit: Optional[int] = None,
+                   fields: Optional[Sequence[str]] = None,
+                   page_fields: Optional[Sequence[str]] = None) -> dict:
+    """
+    Get one On This Day feed for a date ('all', 'selected', 'events', 'births',
+    'deaths', 'holidays'), derived from the cached day record.
+
+    Every feed type for a date shares one upstream `all` fetch and one cache
+    entry. limit, fields and page_fields are passed to get_day() so only what
+    the caller renders is decoded.
+
+    Raises:
+        httpx.HTTPError: if the day is not cached and the upstream fetch fails
+    """
+    categories = None if event_type == "all" else (event_type,)
+    record = await get_day(month, day, timeout=timeout, categories=categories,
+                           limit=limit, fields=fields, page_fields=page_fields)
+    return category_view(record, event_type)
+
+
+async def warm(month: int, day: int, timeout: Union[float, httpx.Timeout, None] = None) -> bool:
+    """
+    Make sure a fresh copy of a day is cached, without counting a lookup.
+
+    Returns:
+        True if it had to be fetched from upstream
+    """
+    key = cache_key(month, day)
+    if await cache.warm(key) is not None:
+        return False
+    await _fetch_and_store(key, timeout=timeout, current=await cache.peek(key))
+    return True
+
+
+def add_served_hook(hook: Callable[[int, int], Any]) -> None:
+    """Register hook(month, day), called whenever a client is served a date"""
+    _served_hooks.append(hook)
+
+
+def pin_days(dates: Iterable[Tuple[int, int]]) -> None:
+    """Keep these (month, day) records in memory, e.g. the dates that are "today" somewhere"""
+    cache.pin(cache_key(month, day) for month, day in dates)
+
+
+async def start_refresher() -> None:
+    """Start background refresh of stale days (called from lifecycle.running())"""
+    refresher.start()
+
+
+async def stop_refresher() -> None:
+    await refresher.stop()
+
+
+def metrics() -> Dict[str, Any]:
+    """Cache counters for health and metrics endpoints"""
+    return {**cache.metrics(), "refresh": refresher.metrics()}
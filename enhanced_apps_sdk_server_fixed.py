@@ -4,15 +4,12 @@ Enhanced Historical Facts MCP Server with ChatGPT-Compatible UI Rendering
 This version embeds data directly into HTML templates for proper ChatGPT rendering
 """
 
-import asyncio
 import json
 import logging
 from datetime import datetime, date
 from typing import Any, Dict, List, Optional, Union
-import httpx
 from contextlib import asynccontextmanager
 import random
-import uuid
 import os
 
 from fastapi import FastAPI, HTTPException, Request
@@ -21,8 +18,9 @@ from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 
-# Wikipedia On This Day API base URL
-WIKI_API_BASE = "https://api.wikimedia.org/feed/v1/wikipedia/en/onthisday"
+import day_cache
+import facets
+import lifecycle
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -35,60 +33,36 @@ user_preferences = {
     "discovery_mode": "chronological"
 }
 
-async def fetch_single_endpoint(client: httpx.AsyncClient, endpoint: str) -> tuple[str, dict]:
-    """Fetch a single endpoint with proper error handling"""
-    try:
-        response = await client.get(endpoint)
-        response.raise_for_status()
-        data = response.json()
-        category = endpoint.split('/')[-3]  # Extract category from URL
-        return category, data.get(category, [])[:20]  # Limit to 20 items
-    except Exception as e:
-        logger.warning(f"Failed to fetch {endpoint}: {e}")
-        category = endpoint.split('/')[-3]
-        return category, []
-
-async def fetch_historical_events(month: int, day: int, event_type: str = "all") -> dict:
-    """Fetch historical events from Wikipedia API with improved error handling"""
+async def fetch_historical_events(month: int, day: int, event_type: str = "all",
+                                  filters: Optional[Dict[str, Any]] = None) -> dict:
+    """Fetch historical events from Wikipedia API with improved error handling;
+    filters (see facets.matches()) keep only matching items"""
     
-    endpoints = []
-    if event_type in ("all", "events"):
-        endpoints.append(f"{WIKI_API_BASE}/events/{month:02d}/{day:02d}")
-    if event_type in ("all", "births"):
-        endpoints.append(f"{WIKI_API_BASE}/births/{month:02d}/{day:02d}")
-    if event_type in ("all", "deaths"):
-        endpoints.append(f"{WIKI_API_BASE}/deaths/{month:02d}/{day:02d}")
-    if event_type in ("all", "holidays"):
-        endpoints.append(f"{WIKI_API_BASE}/holidays/{month:02d}/{day:02d}")
+    categories = [
+        category for category in ("events", "births", "deaths", "holidays")
+        if event_type in ("all", category)
+    ]
     
     all_data = {"events": [], "births": [], "deaths": [], "holidays": []}
+    stale = False
     
     try:
-        # Use httpx.AsyncClient with proper timeout and limits
-        limits = httpx.Limits(max_keepalive_connections=5, max_connections=10)
-        timeout = httpx.Timeout(30.0, connect=10.0)
-        
-        async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
-            # Fetch all endpoints concurrently with asyncio.gather
-            tasks = [fetch_single_endpoint(client, endpoint) for endpoint in endpoints]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Process results
-            for result in results:
-                if isinstance(result, Exception):
-                    logger.warning(f"Task failed: {result}")
-                    continue
-                    
-                category, data = result
-                all_data[category] = data
-                
+        # One `all` fetch carries every category; only the first 20 items of
+        # the requested ones are decoded (or of the matches, when filtering)
+        record = await day_cache.get_day(month, day, categories=categories, limit=None if filters else 20)
+        stale = day_cache.is_stale(record)
+        for category in categories:
+            items = record[category]
+            if filters:
+                items = [item for item in items if facets.matches(item, **filters)][:20]
+            all_data[category] = items
     except Exception as e:
-        logger.error(f"Critical error in fetch_historical_events: {e}")
-        # Return default data structure even if everything fails
-        pass
+        logger.warning(f"Failed to fetch {month:02d}/{day:02d}: {e}")
+        # Return default data structure even if the fetch fails
     
     # Add metadata
     all_data["component_metadata"] = {
+        "stale": stale,
         "total_events": len(all_data["events"]),
         "total_births": len(all_data["births"]),
         "total_deaths": len(all_data["deaths"]),
@@ -749,7 +723,8 @@ def generate_world_map_html(data: dict, month: int, day: int) -> str:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("🚀 Enhanced Apps SDK MCP Server starting up...")
-    yield
+    async with lifecycle.running():
+        yield
     logger.info("👋 Enhanced Apps SDK MCP Server shutting down...")
 
 # Create FastAPI app
@@ -951,16 +926,17 @@ async def mcp_handler(request: Request):
             discovery_mode = arguments.get("discovery_mode", "serendipity")
             focus_category = arguments.get("focus_category", "all")
             time_period = arguments.get("time_period", "any")
+            filters = facets.focus_filters(focus_category, time_period)
             
-            # Generate random date for discovery
+            # Generate random date for discovery, one with matches when the corpus store is available
             if discovery_mode == "serendipity":
-                month, day = random.randint(1, 12), random.randint(1, 28)
+                month, day = facets.random_date(**filters) or (random.randint(1, 12), random.randint(1, 28))
             else:
                 # Use today's date for other modes
                 today = datetime.now()
                 month, day = today.month, today.day
                 
-            data = await fetch_historical_events(month, day, focus_category)
+            data = await fetch_historical_events(month, day, filters.get("category", "all"), filters)
             html_content = generate_discovery_html(data)
             
             return {
@@ -987,7 +963,7 @@ async def mcp_handler(request: Request):
             marker_density = arguments.get("marker_density", "moderate") 
             focus_region = arguments.get("focus_region", "world")
             
-            data = await fetch_historical_events(month, day, "all")
+            data = await fetch_historical_events(month, day, "all", facets.focus_filters(focus_region=focus_region))
             html_content = generate_world_map_html(data, month, day)
             
             return {
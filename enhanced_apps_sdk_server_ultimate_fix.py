@@ -4,14 +4,12 @@ Enhanced Historical Facts MCP Server with ChatGPT-Compatible UI Rendering
 This version fixes the 424 TaskGroup error by improving async error handling
 """
 
-import asyncio
 import json
 import logging
 from datetime import datetime, date
 from typing import Any, Dict, List, Optional, Union
 import httpx
 from contextlib import asynccontextmanager
-import random
 import uuid
 import os
 
@@ -21,8 +19,9 @@ from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 
-# Wikipedia On This Day API base URL
-WIKI_API_BASE = "https://api.wikimedia.org/feed/v1/wikipedia/en/onthisday"
+import day_cache
+import facets
+import lifecycle
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -35,83 +34,36 @@ user_preferences = {
     "discovery_mode": "chronological"
 }
 
-async def fetch_single_endpoint(client: httpx.AsyncClient, endpoint: str) -> tuple[str, dict]:
-    """Fetch a single endpoint with proper error handling"""
-    try:
-        response = await client.get(endpoint, timeout=15.0)  # Add explicit timeout
-        response.raise_for_status()
-        data = response.json()
-        category = endpoint.split('/')[-3]  # Extract category from URL
-        return category, data.get(category, [])[:20]  # Limit to 20 items
-    except httpx.TimeoutException:
-        logger.warning(f"Timeout fetching {endpoint}")
-        category = endpoint.split('/')[-3]
-        return category, []
-    except httpx.HTTPStatusError as e:
-        logger.warning(f"HTTP error {e.response.status_code} fetching {endpoint}")
-        category = endpoint.split('/')[-3]
-        return category, []
-    except Exception as e:
-        logger.warning(f"Failed to fetch {endpoint}: {e}")
-        category = endpoint.split('/')[-3]
-        return category, []
-
 async def fetch_historical_events(month: int, day: int, event_type: str = "all") -> dict:
     """Fetch historical events from Wikipedia API with FIXED error handling"""
     
-    endpoints = []
-    if event_type in ("all", "events"):
-        endpoints.append(f"{WIKI_API_BASE}/events/{month:02d}/{day:02d}")
-    if event_type in ("all", "births"):
-        endpoints.append(f"{WIKI_API_BASE}/births/{month:02d}/{day:02d}")
-    if event_type in ("all", "deaths"):
-        endpoints.append(f"{WIKI_API_BASE}/deaths/{month:02d}/{day:02d}")
-    if event_type in ("all", "holidays"):
-        endpoints.append(f"{WIKI_API_BASE}/holidays/{month:02d}/{day:02d}")
+    categories = [
+        category for category in ("events", "births", "deaths", "holidays")
+        if event_type in ("all", category)
+    ]
 
     all_data = {"events": [], "births": [], "deaths": [], "holidays": []}
+    stale = False
 
     try:
-        # Use httpx.AsyncClient with proper timeout and limits
-        limits = httpx.Limits(max_keepalive_connections=5, max_connections=10)
-        timeout = httpx.Timeout(20.0, connect=10.0)  # Increase timeout
-        
-        async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
-            # FIXED: Use asyncio.wait with tasks (not coroutines)
-            if endpoints:
-                # Create tasks explicitly 
-                tasks = [asyncio.create_task(fetch_single_endpoint(client, endpoint)) for endpoint in endpoints]
-                
-                # Wait for tasks with timeout
-                done, pending = await asyncio.wait(
-                    tasks, 
-                    timeout=30.0,  # Overall timeout
-                    return_when=asyncio.ALL_COMPLETED
-                )
-                
-                # Cancel any pending tasks
-                for task in pending:
-                    task.cancel()
-                
-                # Process completed tasks
-                for task in done:
-                    try:
-                        result = await task
-                        if isinstance(result, tuple) and len(result) == 2:
-                            category, data = result
-                            if category in all_data and isinstance(data, list):
-                                all_data[category] = data
-                    except Exception as e:
-                        logger.warning(f"Task result error: {e}")
-                        continue
-                        
+        # One `all` fetch carries every category; only the first 20 items of
+        # the requested ones are decoded
+        if categories:
+            record = await day_cache.get_day(month, day, timeout=15.0, categories=categories, limit=20)  # Add explicit timeout
+            stale = day_cache.is_stale(record)
+            for category in categories:
+                all_data[category] = record[category]
+    except httpx.TimeoutException:
+        logger.warning(f"Timeout fetching {month:02d}/{day:02d}")
+    except httpx.HTTPStatusError as e:
+        logger.warning(f"HTTP error {e.response.status_code} fetching {month:02d}/{day:02d}")
     except Exception as e:
         logger.error(f"Critical error in fetch_historical_events: {e}")
         # Return default data structure even if everything fails
-        pass
 
     # Add metadata
     all_data["component_metadata"] = {
+        "stale": stale,
         "total_events": len(all_data["events"]),
         "total_births": len(all_data["births"]),
         "total_deaths": len(all_data["deaths"]),
@@ -132,28 +84,22 @@ def enhance_historical_data(data: dict) -> dict:
     """Enhance historical data with additional context and processing"""
     
     def process_item(item):
+        # Items are shared read-only views of the cached day; build a
+        # per-request overlay on top instead of modifying them
         if not isinstance(item, dict):
             return item
             
-        # Extract year from text if available
+        # The year was parsed once at ingest (negative for BCE)
         text = item.get("text", "")
-        year_match = None
-        for word in text.split():
-            if word.isdigit() and len(word) == 4 and 0 <= int(word) <= 2024:
-                year_match = int(word)
-                break
         
         return {
             **item,
-            "year_extracted": year_match,
+            "year_extracted": item.get("year"),
             "thumbnail": item.get("thumbnail", {}),
             "extract": item.get("extract", text[:200] + "..." if len(text) > 200 else text),
             "content_urls": item.get("content_urls", {}),
-            "category_info": {
-                "importance": random.choice(["high", "medium", "low"]),
-                "region": random.choice(["Europe", "Asia", "Americas", "Africa", "Global"]),
-                "theme": random.choice(["Politics", "Science", "Culture", "War", "Discovery"])
-            }
+            # Region and theme from the item's text and linked pages
+            "category_info": facets.category_info(item)
         }
     
     # Process all categories
@@ -435,7 +381,7 @@ def generate_timeline_html(historical_data: dict, current_date: str) -> str:
                     <div class="event-title">${{event.text || 'Historical Event'}}</div>
                     <div class="event-description">${{event.extract || event.text || 'No description available'}}</div>
                     <div class="event-actions">
-                        <button class="action-btn" onclick="toggleFavorite('${{event.text || ''}}')">${{favorites.includes(event.text) ? '❤️ Favorited' : '🤍 Add to Favorites'}}</button>
+                        <button class="action-btn" onclick="toggleFavorite('${{event.id || ''}}')">${{favorites.includes(event.id) ? '❤️ Favorited' : '🤍 Add to Favorites'}}</button>
                         ${{event.content_urls && event.content_urls.desktop ? `<button class="action-btn" onclick="window.open('${{event.content_urls.desktop.page}}', '_blank')">📖 Read More</button>` : ''}}
                     </div>
                 </div>
@@ -451,11 +397,11 @@ def generate_timeline_html(historical_data: dict, current_date: str) -> str:
             renderEvents(filter);
         }}
 
-        function toggleFavorite(eventText) {{
-            if (favorites.includes(eventText)) {{
-                favorites = favorites.filter(f => f !== eventText);
+        function toggleFavorite(eventId) {{
+            if (favorites.includes(eventId)) {{
+                favorites = favorites.filter(f => f !== eventId);
             }} else {{
-                favorites.push(eventText);
+                favorites.push(eventId);
             }}
             renderEvents(currentFilter); // Re-render to update button states
         }}
@@ -479,7 +425,8 @@ def generate_timeline_html(historical_data: dict, current_date: str) -> str:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("🚀 Enhanced Apps SDK MCP Server (ULTIMATE FIX) starting up...")
-    yield
+    async with lifecycle.running():
+        yield
     logger.info("👋 Enhanced Apps SDK MCP Server shutting down...")
 
 # Create FastAPI app
@@ -4,14 +4,11 @@ Enhanced Historical Facts MCP Server with Definitive 424 Error Fix
 This version completely eliminates any possibility of TaskGroup errors
 """
 
-import asyncio
 import json
 import logging
 from datetime import datetime, date
 from typing import Any, Dict, List, Optional, Union
-import httpx
 from contextlib import asynccontextmanager
-import random
 import uuid
 import os
 
@@ -21,8 +18,9 @@ from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 
-# Wikipedia On This Day API base URL
-WIKI_API_BASE = "https://api.wikimedia.org/feed/v1/wikipedia/en/onthisday"
+import day_cache
+import facets
+import lifecycle
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -35,79 +33,35 @@ user_preferences = {
     "discovery_mode": "chronological"
 }
 
-async def fetch_single_endpoint_safe(client: httpx.AsyncClient, endpoint: str) -> dict:
-    """Fetch a single endpoint with completely safe error handling - NO exceptions raised"""
-    try:
-        response = await client.get(endpoint, timeout=15.0)
-        response.raise_for_status()
-        data = response.json()
-        category = endpoint.split('/')[-3]  # Extract category from URL
-        return {
-            "success": True,
-            "category": category,
-            "data": data.get(category, [])[:20]  # Limit to 20 items
-        }
-    except Exception as e:
-        category = endpoint.split('/')[-3] if '/' in endpoint else "unknown"
-        logger.warning(f"Safe fetch failed for {endpoint}: {e}")
-        return {
-            "success": False,
-            "category": category,
-            "data": []
-        }
-
 async def fetch_historical_events(month: int, day: int, event_type: str = "all") -> dict:
     """Fetch historical events with BULLETPROOF error handling - NO TaskGroup errors possible"""
     
-    endpoints = []
-    if event_type in ("all", "events"):
-        endpoints.append(f"{WIKI_API_BASE}/events/{month:02d}/{day:02d}")
-    if event_type in ("all", "births"):
-        endpoints.append(f"{WIKI_API_BASE}/births/{month:02d}/{day:02d}")
-    if event_type in ("all", "deaths"):
-        endpoints.append(f"{WIKI_API_BASE}/deaths/{month:02d}/{day:02d}")
-    if event_type in ("all", "holidays"):
-        endpoints.append(f"{WIKI_API_BASE}/holidays/{month:02d}/{day:02d}")
+    categories = [
+        category for category in ("events", "births", "deaths", "holidays")
+        if event_type in ("all", category)
+    ]
 
     all_data = {"events": [], "births": [], "deaths": [], "holidays": []}
+    stale = False
 
-    if not endpoints:
+    if not categories:
         return all_data
 
     try:
-        # Use httpx.AsyncClient with conservative settings
-        limits = httpx.Limits(max_keepalive_connections=3, max_connections=5)
-        timeout = httpx.Timeout(15.0, connect=5.0)
-        
-        async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
-            # BULLETPROOF APPROACH: Use asyncio.gather with return_exceptions=True
-            # This completely prevents any unhandled exceptions from bubbling up
-            results = await asyncio.gather(
-                *[fetch_single_endpoint_safe(client, endpoint) for endpoint in endpoints],
-                return_exceptions=True
-            )
-            
-            # Process results - guaranteed to be safe
-            for result in results:
-                # Handle any exceptions that made it through
-                if isinstance(result, Exception):
-                    logger.warning(f"Gather exception handled: {result}")
-                    continue
-                    
-                # Handle successful results
-                if isinstance(result, dict) and result.get("success"):
-                    category = result.get("category")
-                    data = result.get("data", [])
-                    if category in all_data:
-                        all_data[category] = data
-                        
+        # SINGLE FETCH: the `all` feed carries every category, so there is
+        # nothing to fan out and no partial failures to reconcile. Only the
+        # first 20 items of the requested categories are decoded
+        record = await day_cache.get_day(month, day, timeout=15.0, categories=categories, limit=20)
+        stale = day_cache.is_stale(record)
+        for category in categories:
+            all_data[category] = record[category]
     except Exception as e:
-        logger.error(f"Outer error handler caught: {e}")
+        logger.warning(f"Safe fetch failed for {month:02d}/{day:02d}: {e}")
         # Even if everything fails, we return a valid structure
-        pass
 
     # Add metadata
     all_data["component_metadata"] = {
+        "stale": stale,
         "total_events": len(all_data["events"]),
         "total_births": len(all_data["births"]),
         "total_deaths": len(all_data["deaths"]),
@@ -128,28 +82,22 @@ def enhance_historical_data(data: dict) -> dict:
     """Enhance historical data with additional context and processing"""
     
     def process_item(item):
+        # Items are shared read-only views of the cached day; build a
+        # per-request overlay on top instead of modifying them
         if not isinstance(item, dict):
             return item
             
-        # Extract year from text if available
+        # The year was parsed once at ingest (negative for BCE)
         text = item.get("text", "")
-        year_match = None
-        for word in text.split():
-            if word.isdigit() and len(word) == 4 and 0 <= int(word) <= 2024:
-                year_match = int(word)
-                break
         
         return {
             **item,
-            "year_extracted": year_match,
+            "year_extracted": item.get("year"),
             "thumbnail": item.get("thumbnail", {}),
             "extract": item.get("extract", text[:200] + "..." if len(text) > 200 else text),
             "content_urls": item.get("content_urls", {}),
-            "category_info": {
-                "importance": random.choice(["high", "medium", "low"]),
-                "region": random.choice(["Europe", "Asia", "Americas", "Africa", "Global"]),
-                "theme": random.choice(["Politics", "Science", "Culture", "War", "Discovery"])
-            }
+            # Region and theme from the item's text and linked pages
+            "category_info": facets.category_info(item)
         }
     
     # Process all categories
@@ -450,8 +398,8 @@ def generate_timeline_html(historical_data: dict, current_date: str) -> str:
                     <div class="event-title">${{event.text || 'Historical Event'}}</div>
                     <div class="event-description">${{event.extract || event.text || 'No description available'}}</div>
                     <div class="event-actions">
-                        <button class="action-btn" onclick="toggleFavorite('${{event.text || ''}}')">
-                            ${{favorites.includes(event.text) ? '❤️ Favorited' : '🤍 Add to Favorites'}}
+                        <button class="action-btn" onclick="toggleFavorite('${{event.id || ''}}')">
+                            ${{favorites.includes(event.id) ? '❤️ Favorited' : '🤍 Add to Favorites'}}
                         </button>
                         ${{event.content_urls && event.content_urls.desktop ? 
                             `<button class="action-btn" onclick="window.open('${{event.content_urls.desktop.page}}', '_blank')">📖 Read More</button>` : ''
@@ -470,11 +418,11 @@ def generate_timeline_html(historical_data: dict, current_date: str) -> str:
             renderEvents(filter);
         }}
 
-        function toggleFavorite(eventText) {{
-            if (favorites.includes(eventText)) {{
-                favorites = favorites.filter(f => f !== eventText);
+        function toggleFavorite(eventId) {{
+            if (favorites.includes(eventId)) {{
+                favorites = favorites.filter(f => f !== eventId);
             }} else {{
-                favorites.push(eventText);
+                favorites.push(eventId);
             }}
             renderEvents(currentFilter); // Re-render to update button states
         }}
@@ -495,9 +443,11 @@ def generate_timeline_html(historical_data: dict, current_date: str) -> str:
 </html>
     '''
 
+@asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("🚀 Enhanced Apps SDK MCP Server (ULTIMATE FIX V2) starting up...")
-    yield
+    async with lifecycle.running():
+        yield
     logger.info("👋 Enhanced Apps SDK MCP Server shutting down...")
 
 # Create FastAPI app
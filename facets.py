@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+"""
+Bitmap-indexed faceted queries over the whole corpus
+
+Every item in the corpus store (see corpus_store.py) has a fixed position, its
+ordinal, in calendar order. For each facet value the index keeps one Python
+int with bit n set when item n has that value:
+
+    category  selected, events, births, deaths, holidays
+    era       ancient, medieval, renaissance, modern, contemporary (groups of
+              the display eras of records.historical_era)
+    region    europe, asia, americas, africa, oceania
+    theme     politics, war, science, arts, exploration, religion, sports, disaster
+
+Years are kept as a bit-sliced index: one bitmap per bit of the (offset) year,
+so any year range is answered with a couple of dozen bitwise operations,
+whatever its width.
+
+query() turns a facet combination into bitmaps (several values of one facet
+are ORed), and the planner ANDs them smallest first, stopping as soon as
+nothing is left. Only the items on the requested page are then read from the
+store. Regions and themes are keyword matches on the item text and its linked
+pages' titles and descriptions; they are computed once by classify() when the
+store is built. The Apps SDK servers use the same classify() and matches() on
+live days, so their focus filters agree with query_history.
+
+The bitmaps take about a second to build for a full year of real data, so
+servers build them in a worker thread at startup (see start()); otherwise they
+are built on the first query. They take under a megabyte.
+
+License: MIT
+"""
+
+import asyncio
+import logging
+import random
+import re
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import corpus
+import corpus_store
+import records
+
+logger = logging.getLogger("historical-facts-facets")
+
+MAX_QUERY_RESULTS = 100
+
+# Each era groups display eras of records.historical_era, so an item's era
+# facet always agrees with the era label the Apps SDK servers show for it
+ERAS = ("ancient", "medieval", "renaissance", "modern", "contemporary")
+_ERA_OF_LABEL = {
+    "Before Common Era": "ancient",
+    "Ancient Times": "ancient",
+    "Medieval Period": "medieval",
+    "16th Century": "renaissance",
+    "17th Century": "renaissance",
+    "18th Century": "modern",
+    "19th Century": "modern",
+    "20th Century": "contemporary",
+    "21st Century": "contemporary",
+}
+
+REGIONS = ("europe", "asia", "americas", "africa", "oceania")
+THEMES = ("politics", "war", "science", "arts", "exploration", "religion", "sports", "disaster")
+
+# Place names are matched case-sensitively, so "Turkey" is a country but "turkey" is not
+_REGION_KEYWORDS = {
+    "europe": (
+        "Europe", "European", "France", "French", "Paris", "Germany", "German", "Berlin", "Prussia",
+        "Prussian", "England", "English", "Britain", "British", "United Kingdom", "London", "Scotland",
+        "Scottish", "Ireland", "Irish", "Wales", "Welsh", "Italy", "Italian", "Rome", "Venice",
+        "Florence", "Spain", "Spanish", "Madrid", "Portugal", "Portuguese", "Lisbon", "Netherlands",
+        "Dutch", "Amsterdam", "Belgium", "Belgian", "Brussels", "Austria", "Austrian", "Vienna",
+        "Habsburg", "Hungary", "Hungarian", "Poland", "Polish", "Warsaw", "Russia", "Russian",
+        "Moscow", "Soviet", "Ukraine", "Ukrainian", "Sweden", "Swedish", "Norway", "Norwegian",
+        "Denmark", "Danish", "Finland", "Finnish", "Greece", "Greek", "Athens", "Switzerland",
+        "Swiss", "Czech", "Czechoslovakia", "Prague", "Serbia", "Serbian", "Yugoslavia", "Croatia",
+        "Romania", "Bulgaria", "Byzantine", "Constantinople", "Holy Roman Empire", "Vatican",
+    ),
+    "asia": (
+        "Asia", "Asian", "China", "Chinese", "Beijing", "Shanghai", "Japan", "Japanese", "Tokyo",
+        "Korea", "Korean", "India", "Delhi", "Mumbai", "Bombay", "Calcutta", "Pakistan",
+        "Bangladesh", "Vietnam", "Vietnamese", "Thailand", "Siam", "Cambodia", "Laos", "Burma",
+        "Myanmar", "Indonesia", "Indonesian", "Philippines", "Philippine", "Malaysia", "Singapore",
+        "Mongol", "Mongolia", "Mongolian", "Tibet", "Afghanistan", "Iran", "Iranian", "Persia",
+        "Persian", "Iraq", "Baghdad", "Syria", "Syrian", "Israel", "Israeli", "Jerusalem",
+        "Palestine", "Lebanon", "Saudi Arabia", "Ottoman", "Turkey", "Turkish", "Istanbul",
+        "Sri Lanka", "Nepal", "Taiwan", "Hong Kong", "Mughal",
+    ),
+    "americas": (
+        "America", "American", "United States", "U.S.", "Canada", "Canadian", "Mexico", "Mexican",
+        "Brazil", "Brazilian", "Argentina", "Chile", "Peru", "Colombia", "Venezuela", "Cuba",
+        "Cuban", "Haiti", "Jamaica", "Caribbean", "Washington", "New York", "California", "Texas",
+        "Boston", "Chicago", "Virginia", "Philadelphia", "Confederate", "Aztec", "Inca", "Maya",
+        "Quebec", "Ontario", "Panama", "Massachusetts",
+    ),
+    "africa": (
+        "Africa", "African", "Egypt", "Egyptian", "Cairo", "Ethiopia", "Ethiopian", "Nigeria",
+        "Kenya", "Morocco", "Algeria", "Algerian", "Tunisia", "Libya", "Sudan", "Congo", "Ghana",
+        "Zimbabwe", "Rhodesia", "Uganda", "Rwanda", "Senegal", "Angola", "Mozambique", "Zulu",
+        "Carthage", "Somalia", "Tanzania", "Madagascar",
+    ),
+    "oceania": (
+        "Oceania", "Australia", "Australian", "Sydney", "Melbourne", "New Zealand", "Fiji",
+        "Samoa", "Tonga", "Hawaii", "Papua", "Polynesia", "Micronesia", "Tasmania", "Māori", "Maori",
+    ),
+}
+
+_THEME_KEYWORDS = {
+    "politics": (
+        "election", "elected", "president", "prime minister", "parliament", "congress", "senate",
+        "treaty", "constitution", "independence", "king", "queen", "emperor", "empress",
+        "coronation", "crowned", "revolution", "government", "monarch", "dynasty", "republic",
+        "referendum", "politician", "statesman", "abdicates", "abdicated",
+    ),
+    "war": (
+        "war", "battle", "army", "armies", "invasion", "invades", "invaded", "siege", "troops",
+        "military", "navy", "naval", "bombing", "attack", "surrender", "surrenders", "armistice",
+        "offensive", "fleet", "soldiers", "general", "admiral",
+    ),
+    "science": (
+        "scientist", "physicist", "chemist", "mathematician", "biologist", "astronomer",
+        "discovers", "discovered", "discovery", "invention", "invented", "inventor", "patent",
+        "experiment", "vaccine", "Nobel", "laboratory", "theory", "telescope", "spacecraft",
+        "satellite", "rocket", "astronaut", "cosmonaut", "computer", "physician", "engineer",
+    ),
+    "arts": (
+        "painter", "artist", "composer", "musician", "singer", "songwriter", "actor", "actress",
+        "writer", "novelist", "poet", "playwright", "author", "film", "album", "opera",
+        "symphony", "novel", "premiere", "premieres", "painting", "museum", "theatre", "theater",
+        "band", "song", "sculptor", "architect", "director",
+    ),
+    "exploration": (
+        "explorer", "expedition", "voyage", "navigator", "circumnavigation", "first ascent",
+        "landing", "lands", "colony", "colonists", "settlers", "sails", "sailed",
+    ),
+    "religion": (
+        "church", "pope", "bishop", "saint", "religious", "Christian", "Catholic", "Protestant",
+        "Islam", "Islamic", "Muslim", "Jewish", "Buddhist", "Hindu", "temple", "mosque",
+        "cathedral", "monastery", "crusade", "theologian", "archbishop",
+    ),
+    "sports": (
+        "Olympic", "Olympics", "football", "baseball", "basketball", "cricket", "tennis",
+        "championship", "World Cup", "athlete", "footballer", "cricketer", "boxer", "racing driver",
+        "golfer", "sprinter",
+    ),
+    "disaster": (
+        "earthquake", "hurricane", "typhoon", "cyclone", "tsunami", "flood", "fire", "eruption",
+        "volcano", "explosion", "crash", "crashes", "shipwreck", "sinks", "sank", "famine",
+        "epidemic", "pandemic", "disaster", "collapses", "derailment",
+    ),
+}
+
+
+def _keyword_pattern(keywords: Sequence[str], flags: int = 0) -> "re.Pattern[str]":
+    # Longest first, so "New Zealand" is tried before shorter overlapping names
+    alternatives = "|".join(re.escape(word) for word in sorted(keywords, key=len, reverse=True))
+    return re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)", flags)
+
+
+_REGION_PATTERNS = tuple(_keyword_pattern(_REGION_KEYWORDS[region]) for region in REGIONS)
+_THEME_PATTERNS = tuple(_keyword_pattern(_THEME_KEYWORDS[theme], re.IGNORECASE) for theme in THEMES)
+
+FACETS = ("category", "era", "region", "theme")
+FACET_VALUES = {
+    "category": records.CATEGORIES,
+    "era": ERAS,
+    "region": REGIONS,
+    "theme": THEMES,
+}
+
+FacetValue = Union[None, str, Sequence[str]]
+
+
+def era_of(year: Optional[int]) -> Optional[str]:
+    """Era facet value of a year (negative for BCE); None for undated items"""
+    label = records.historical_era(year)
+    return _ERA_OF_LABEL[label] if label is not None else None
+
+
+def _mask(patterns: Sequence["re.Pattern[str]"], text: str) -> int:
+    return sum(1 << bit for bit, pattern in enumerate(patterns) if pattern.search(text))
+
+
+def classify(text: str, page_texts: Iterable[Optional[str]] = ()) -> Tuple[int, int]:
+    """
+    (regions, themes) bitmasks of an item from its text and its pages' titles
+    and descriptions; bit n stands for REGIONS[n] / THEMES[n].
+    """
+    combined = " | ".join([text or "", *(part.replace("_", " ") for part in page_texts if part)])
+    return _mask(_REGION_PATTERNS, combined), _mask(_THEME_PATTERNS, combined)
+
+
+def classify_item(item: Union[records.ItemRecord, Dict[str, Any]]) -> Tuple[int, int]:
+    """classify() for an ItemRecord or an upstream-shaped item dict"""
+    if isinstance(item, records.ItemRecord):
+        pages = [(page.label, page.description) for page in item.pages]
+        text = item.text
+    else:
+        pages = [(page.get("displaytitle") or page.get("title"), page.get("description"))
+                 for page in item.get("pages") or () if isinstance(page, dict)]
+        text = item.get("text") or ""
+    return classify(text, [part for pair in pages for part in pair])
+
+
+def names(mask: int, values: Sequence[str]) -> List[str]:
+    """Facet values whose bits are set in a regions or themes bitmask"""
+    return [value for bit, value in enumerate(values) if mask >> bit & 1]
+
+
+def category_info(item: Union[records.ItemRecord, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Apps SDK category_info of an item: its first region ("Global" if none) and
+    theme, every matched value, and an importance from how many pages it links
+    """
+    regions, themes = classify_item(item)
+    region_names, theme_names = names(regions, REGIONS), names(themes, THEMES)
+    pages = len(item.pages) if isinstance(item, records.ItemRecord) else len(item.get("pages") or ())
+    return {
+        "importance": "high" if pages >= 3 else "medium" if pages == 2 else "low",
+        "region": region_names[0].title() if region_names else "Global",
+        "theme": theme_names[0].title() if theme_names else "General",
+        "regions": region_names,
+        "themes": theme_names,
+    }
+
+
+def _as_tuple(facet: str, value: FacetValue) -> Tuple[str, ...]:
+    # One value, a list, or a comma-separated string (from query parameters)
+    if value is None:
+        return ()
+    chosen = tuple(part.strip().lower() for part in (value.split(",") if isinstance(value, str) else value)
+                   if part and part.strip())
+    unknown = [part for part in chosen if part not in FACET_VALUES[facet]]
+    if unknown:
+        raise ValueError(f"Unknown {facet} {', '.join(unknown)}; "
+                         f"expected one of {', '.join(FACET_VALUES[facet])}")
+    return chosen
+
+
+def describe(category: FacetValue = None, era: FacetValue = None, region: FacetValue = None,
+             theme: FacetValue = None, year_from: Optional[int] = None, year_to: Optional[int] = None) -> str:
+    """Readable summary of a facet combination, e.g. theme war, region europe, 1800 to 1900"""
+    chosen = {"category": category, "era": era, "region": region, "theme": theme}
+    parts = [f"{facet} {' or '.join(_as_tuple(facet, chosen[facet]))}" for facet in FACETS
+             if _as_tuple(facet, chosen[facet])]
+    if year_from is not None and year_to is not None:
+        parts.append(f"{records.format_year(year_from)} to {records.format_year(year_to)}")
+    elif year_from is not None:
+        parts.append(f"from {records.format_year(year_from)}")
+    elif year_to is not None:
+        parts.append(f"up to {records.format_year(year_to)}")
+    return ", ".join(parts) or "any facet"
+
+
+def filters(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Facet filters from tool arguments or query parameters (unknown keys are ignored)"""
+    chosen: Dict[str, Any] = {facet: arguments.get(facet) for facet in FACETS}
+    for bound in ("year_from", "year_to"):
+        value = arguments.get(bound)
+        chosen[bound] = None if value in (None, "") else int(value)
+    return chosen
+
+
+def focus_filters(focus_category: Optional[str] = None, time_period: Optional[str] = None,
+                  focus_region: Optional[str] = None) -> Dict[str, str]:
+    """
+    Facet filters for the Apps SDK tools' focus arguments. focus_category is
+    a feed category or a theme; "all", "any" and "world" add no filter.
+    """
+    chosen = {}
+    if focus_category in records.CATEGORIES:
+        chosen["category"] = focus_category
+    elif focus_category in THEMES:
+        chosen["theme"] = focus_category
+    if time_period in ERAS:
+        chosen["era"] = time_period
+    if focus_region in REGIONS:
+        chosen["region"] = focus_region
+    return chosen
+
+
+def matches(item: Union[records.ItemRecord, Dict[str, Any]], category: FacetValue = None,
+            era: FacetValue = None, region: FacetValue = None, theme: FacetValue = None,
+            year_from: Optional[int] = None, year_to: Optional[int] = None) -> bool:
+    """Whether a single item satisfies a facet combination, with query()'s semantics"""
+    if isinstance(item, records.ItemRecord):
+        item_category, year = item.category, item.year
+    else:
+        item_category, year = item.get("category"), item.get("year")
+    categories = _as_tuple("category", category)
+    if categories and item_category is not None and item_category not in categories:
+        return False
+    eras = _as_tuple("era", era)
+    if eras and era_of(year) not in eras:
+        return False
+    if year_from is not None or year_to is not None:
+        if year is None:
+            return False
+        if (year_from is not None and year < year_from) or (year_to is not None and year > year_to):
+            return False
+    regions, themes = _as_tuple("region", region), _as_tuple("theme", theme)
+    if regions or themes:
+        region_mask, theme_mask = classify_item(item)
+        if regions and not any(region_mask >> REGIONS.index(value) & 1 for value in regions):
+            return False
+        if themes and not any(theme_mask >> THEMES.index(value) & 1 for value in themes):
+            return False
+    return True
+
+
+def _bitmap(ordinals: Iterable[int], size: int) -> int:
+    # Setting bits in a buffer and converting once is linear; ORing 1 << n into
+    # a growing int would copy it for every item
+    buffer = bytearray((size + 7) // 8)
+    for ordinal in ordinals:
+        buffer[ordinal >> 3] |= 1 << (ordinal & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def _ordinals(bits: int, limit: int, offset: int = 0) -> List[int]:
+    """Positions of the set bits, lowest first, skipping `offset` of them"""
+    found = []
+    while bits and len(found) < limit:
+        lowest = bits & -bits
+        if offset:
+            offset -= 1
+        else:
+            found.append(lowest.bit_length() - 1)
+        bits ^= lowest
+    return found
+
+
+class FacetResult(NamedTuple):
+    """A page of query matches, the total count, and the planner's steps"""
+    total: int
+    items: List[corpus_store.DatedItem]
+    plan: List[Tuple[str, int]]
+
+
+class FacetIndex:
+    """Per-value bitmaps and a bit-sliced year index over every item in the store"""
+
+    def __init__(self, rows: Iterable[Tuple[int, int, str, Optional[int], int, int]]):
+        self.rowids = array("q")
+        self.day_ids = array("H")
+        # Ordinals grouped by the few distinct raw values, expanded to facet values below
+        by_category: Dict[str, List[int]] = {}
+        by_year: Dict[int, List[int]] = {}
+        by_regions: Dict[int, List[int]] = {}
+        by_themes: Dict[int, List[int]] = {}
+        for ordinal, (rowid, day_id, category, year, regions, themes) in enumerate(rows):
+            self.rowids.append(rowid)
+            self.day_ids.append(day_id)
+            by_category.setdefault(category, []).append(ordinal)
+            if year is not None:
+                by_year.setdefault(year, []).append(ordinal)
+            if regions:
+                by_regions.setdefault(regions, []).append(ordinal)
+            if themes:
+                by_themes.setdefault(themes, []).append(ordinal)
+
+        members: Dict[Tuple[str, str], List[int]] = {("category", category): ordinals
+                                                     for category, ordinals in by_category.items()}
+        for year, ordinals in by_year.items():
+            members.setdefault(("era", era_of(year)), []).extend(ordinals)
+        for facet, values, groups in (("region", REGIONS, by_regions), ("theme", THEMES, by_themes)):
+            for mask, ordinals in groups.items():
+                for value in names(mask, values):
+                    members.setdefault((facet, value), []).extend(ordinals)
+
+        size = len(self.rowids)
+        self.size = size
+        self.all = (1 << size) - 1
+        self.bitmaps = {key: _bitmap(ordinals, size) for key, ordinals in members.items()}
+        self.counts = {key: len(ordinals) for key, ordinals in members.items()}
+
+        # Bit-sliced years: slice n holds bit n of (year - min_year) for every dated item
+        self.min_year = min(by_year, default=0)
+        self.max_year = max(by_year, default=-1)
+        width = (self.max_year - self.min_year).bit_length()
+        self.dated = _bitmap((ordinal for ordinals in by_year.values() for ordinal in ordinals), size)
+        self.year_slices = [
+            _bitmap((ordinal for year, ordinals in by_year.items() if (year - self.min_year) >> bit & 1
+                     for ordinal in ordinals), size)
+            for bit in range(width)
+        ]
+
+    def value(self, facet: str, value: str) -> int:
+        return self.bitmaps.get((facet, value), 0)
+
+    def _greater_than(self, offset: int) -> Tuple[int, int]:
+        """(greater than, equal to) bitmaps of dated items against an offset year"""
+        greater, equal = 0, self.dated
+        for bit in reversed(range(len(self.year_slices))):
+            year_slice = self.year_slices[bit]
+            if offset >> bit & 1:
+                equal &= year_slice
+            else:
+                greater |= equal & year_slice
+                equal &= ~year_slice
+        return greater, equal
+
+    def year_range(self, year_from: Optional[int], year_to: Optional[int]) -> int:
+        """Items dated within [year_from, year_to]; either end may be open"""
+        low = self.min_year if year_from is None else max(year_from, self.min_year)
+        high = self.max_year if year_to is None else min(year_to, self.max_year)
+        if low > high:
+            return 0
+        bits = self.dated
+        if low > self.min_year:
+            greater, equal = self._greater_than(low - self.min_year)
+            bits &= greater | equal
+        if high < self.max_year:
+            greater, _ = self._greater_than(high - self.min_year)
+            bits &= ~greater
+        return bits
+
+    def plan(self, category: FacetValue = None, era: FacetValue = None, region: FacetValue = None,
+             theme: FacetValue = None, year_from: Optional[int] = None,
+             year_to: Optional[int] = None) -> List[Tuple[str, int]]:
+        """(label, bitmap) terms to intersect, most selective first"""
+        chosen = {"category": _as_tuple("category", category), "era": _as_tuple("era", era),
+                  "region": _as_tuple("region", region), "theme": _as_tuple("theme", theme)}
+        terms = []
+        for facet in FACETS:
+            if chosen[facet]:
+                bits = 0
+                for value in chosen[facet]:
+                    bits |= self.value(facet, value)
+                terms.append((f"{facet}={'|'.join(chosen[facet])}", bits))
+        if not chosen["category"]:
+            # Selected items repeat events of the same day, so they only show up when asked for
+            terms.append(("category!=selected", self.all & ~self.value("category", "selected")))
+        if year_from is not None or year_to is not None:
+            span = f"{'' if year_from is None else year_from}..{'' if year_to is None else year_to}"
+            terms.append((f"year={span}", self.year_range(year_from, year_to)))
+        return sorted(terms, key=lambda term: term[1].bit_count())
+
+    def match(self, **filters: Any) -> Tuple[int, List[Tuple[str, int]]]:
+        """Bitmap of items matching a facet combination, and (term, matches left) per step"""
+        bits = self.all
+        steps = []
+        for label, term in self.plan(**filters):
+            bits &= term
+            steps.append((label, bits.bit_count()))
+            if not bits:
+                break
+        return bits, steps
+
+    def date_of(self, ordinal: int) -> Tuple[int, int]:
+        return corpus.all_dates()[self.day_ids[ordinal]]
+
+
+_index: Optional[FacetIndex] = None
+_counters = {
+    "queries": 0,
+    "query_seconds": 0.0,
+}
+
+
+def index() -> FacetIndex:
+    """
+    The facet index, built from the corpus store on first use.
+
+    Raises:
+        LookupError: if there is no corpus store
+    """
+    global _index
+    if _index is None:
+        started = time.perf_counter()
+        _index = FacetIndex(corpus_store.facet_rows())
+        logger.info(f"Built facet bitmaps for {_index.size} items in "
+                    f"{time.perf_counter() - started:.2f}s")
+    return _index
+
+
+async def start() -> None:
+    """Build the bitmaps in a worker thread before serving (called from lifecycle.running())"""
+    try:
+        await asyncio.to_thread(index)
+    except LookupError:
+        logger.info("No corpus store; facet queries are unavailable until one is built")
+    except Exception as e:
+        logger.warning(f"Could not build facet bitmaps at startup: {e}")
+
+
+def reset() -> None:
+    """Drop the bitmaps, e.g. after the store was rebuilt"""
+    global _index
+    _index = None
+
+
+def query(category: FacetValue = None, era: FacetValue = None, region: FacetValue = None,
+          theme: FacetValue = None, year_from: Optional[int] = None, year_to: Optional[int] = None,
+          limit: int = 20, offset: int = 0) -> FacetResult:
+    """
+    Items from every day of the corpus matching a facet combination, in calendar order.
+
+    Each facet takes one value or a list of alternatives; unset facets match
+    everything. Without a category, selected items are left out.
+
+    Raises:
+        LookupError: if there is no corpus store
+        ValueError: for an unknown facet value
+    """
+    facet_index = index()
+    limit = max(1, min(int(limit), MAX_QUERY_RESULTS))
+    started = time.perf_counter()
+    bits, steps = facet_index.match(category=category, era=era, region=region, theme=theme,
+                                    year_from=year_from, year_to=year_to)
+    ordinals = _ordinals(bits, limit, max(0, int(offset)))
+    _counters["queries"] += 1
+    _counters["query_seconds"] += time.perf_counter() - started
+    items = corpus_store.items_by_rowid([facet_index.rowids[ordinal] for ordinal in ordinals])
+    return FacetResult(bits.bit_count(), items, steps)
+
+
+def random_date(**filters: Any) -> Optional[Tuple[int, int]]:
+    """
+    (month, day) of a random item matching a facet combination, or None if
+    nothing matches or there is no corpus store.
+    """
+    try:
+        facet_index = index()
+    except (LookupError, ValueError):
+        return None
+    bits, _ = facet_index.match(**filters)
+    if not bits:
+        return None
+    # The next match at or after a random position, wrapping around
+    start = random.randrange(facet_index.size)
+    after = bits >> start
+    ordinal = start + (after & -after).bit_length() - 1 if after else (bits & -bits).bit_length() - 1
+    return facet_index.date_of(ordinal)
+
+
+def metrics() -> Dict[str, Any]:
+    """Facet index counters for health and metrics endpoints"""
+    queries = _counters["queries"]
+    return {
+        "items": _index.size if _index is not None else None,
+        "bitmaps": (len(_index.bitmaps) + len(_index.year_slices) + 1) if _index is not None else 0,
+        "queries": queries,
+        "avg_query_us": round(1e6 * _counters["query_seconds"] / queries, 1) if queries else None,
+    }
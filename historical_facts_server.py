@@ -10,12 +10,21 @@ Author: romantic_franklin
 License: MIT
 """
 
+import argparse
 import asyncio
 import logging
-from datetime import datetime, date
-from typing import Any, Sequence
+import sys
+from datetime import date
+from typing import Any, Sequence, Union
 import json
-import httpx
+
+import corpus
+import corpus_store
+import day_cache
+import facets
+import lifecycle
+import records
+import rollover
 
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
@@ -39,45 +48,35 @@ logger = logging.getLogger("historical-facts-mcp")
 # Initialize the MCP server
 server = Server("historical-facts-mcp")
 
-# Wikipedia On This Day API base URL
-WIKI_API_BASE = "https://api.wikimedia.org/feed/v1/wikipedia/en/onthisday"
-
 
-async def fetch_historical_events(month: int, day: int, event_type: str = "all") -> dict:
+async def fetch_historical_events(month: int, day: int) -> records.DayRecord:
     """
     Fetch historical events from Wikipedia's On This Day API
     
     Args:
         month: Month (1-12)
         day: Day (1-31)
-        event_type: Type of events to fetch ('all', 'events', 'births', 'deaths', 'holidays')
     
     Returns:
-        Dictionary containing the API response
+        The shared day record with every category (read-only)
     """
-    url = f"{WIKI_API_BASE}/{event_type}/{month:02d}/{day:02d}"
-    
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            return response.json()
+        return await day_cache.get_record(month, day, timeout=30.0)
     except Exception as e:
         logger.error(f"Error fetching data from Wikipedia API: {e}")
         raise
 
 
-def format_historical_event(event: dict) -> str:
+def format_historical_event(event: records.ItemRecord) -> str:
     """Format a single historical event for display"""
-    text = event.get('text', 'No description available')
-    year = event.get('year', 'Unknown year')
+    text = event.text or 'No description available'
+    year = event.year if event.year is not None else 'Unknown year'
     
     # Get additional context from pages if available
-    pages = event.get('pages', [])
-    if pages:
-        main_page = pages[0]
-        title = main_page.get('displaytitle', main_page.get('title', ''))
-        extract = main_page.get('extract', '')
+    main_page = event.primary_page
+    if main_page:
+        title = main_page.label
+        extract = main_page.extract or ''
         
         if extract:
             # Limit extract length for readability
@@ -87,16 +86,15 @@ def format_historical_event(event: dict) -> str:
     return f"**{year}**: {text}"
 
 
-def format_birth_death_event(event: dict, event_type: str) -> str:
+def format_birth_death_event(event: records.ItemRecord, event_type: str) -> str:
     """Format births or deaths events"""
-    text = event.get('text', 'No description available')
-    year = event.get('year', 'Unknown year')
+    text = event.text or 'No description available'
+    year = event.year if event.year is not None else 'Unknown year'
     
-    pages = event.get('pages', [])
-    if pages:
-        main_page = pages[0]
-        title = main_page.get('displaytitle', main_page.get('title', ''))
-        extract = main_page.get('extract', '')
+    main_page = event.primary_page
+    if main_page:
+        title = main_page.label
+        extract = main_page.extract or ''
         
         if extract:
             # Limit extract length for readability  
@@ -108,6 +106,56 @@ def format_birth_death_event(event: dict, event_type: str) -> str:
     return f"{icon} **{year}**: {text}"
 
 
+def format_dated_items(header: Sequence[str],
+                       items: Sequence[Union[corpus_store.DatedItem, corpus_store.SearchHit]]) -> str:
+    """Format items that each carry their own date (search, year, entity and query results) under a header"""
+    response_parts = [*header, ""]
+    for fact in items:
+        response_parts.append(f"### {fact.month}/{fact.day} ({fact.item.category})")
+        if fact.item.category in ["births", "deaths"]:
+            response_parts.append(format_birth_death_event(fact.item, fact.item.category))
+        else:
+            response_parts.append(format_historical_event(fact.item))
+        response_parts.append("")
+    return "\n".join(response_parts)
+
+
+def format_search_results(query: str, hits: Sequence[corpus_store.SearchHit]) -> str:
+    """Format ranked search matches, each under the date it happened on"""
+    if not hits:
+        return f"No historical facts match \"{query}\"."
+    return format_dated_items([f"# Historical Facts matching \"{query}\""], hits)
+
+
+def format_year_results(year: int, facts: Sequence[corpus_store.DatedItem]) -> str:
+    """Format a year's facts in calendar order, each under its date"""
+    label = records.format_year(year)
+    if not facts:
+        return f"No historical facts found for the year {label}."
+    return format_dated_items([f"# Historical Facts from {label}"], facts)
+
+
+def format_entity_results(title: str, facts: corpus_store.EntityFacts) -> str:
+    """Format the facts linking an entity's pages in calendar order, each under its date"""
+    if not facts.titles:
+        return f"No Wikipedia page called \"{title}\" is linked from any historical fact."
+    return format_dated_items([
+        f"# Historical Facts about {', '.join(facts.titles)}",
+        f"*{facts.total} facts link {'this page' if len(facts.titles) == 1 else 'these pages'}; showing {len(facts.items)}*"
+    ], facts.items)
+
+
+def format_query_results(description: str, result: facets.FacetResult, offset: int = 0) -> str:
+    """Format a page of faceted query matches in calendar order, each under its date"""
+    if not result.items:
+        return f"No historical facts match {description}." if not result.total else \
+            f"No more historical facts match {description} ({result.total} in total)."
+    return format_dated_items([
+        f"# Historical Facts: {description}",
+        f"*{result.total} matches; showing {offset + 1}-{offset + len(result.items)}*"
+    ], result.items)
+
+
 @server.list_tools()
 async def handle_list_tools() -> list[Tool]:
     """
@@ -154,6 +202,10 @@ async def handle_list_tools() -> list[Tool]:
                         "enum": ["all", "events", "births", "deaths", "holidays"],
                         "default": "all", 
                         "description": "Type of historical facts to retrieve"
+                    },
+                    "timezone": {
+                        "type": "string",
+                        "description": "IANA timezone of the user, e.g. \"America/New_York\", so \"today\" is their date (default: server time)"
                     }
                 },
                 "required": [],
@@ -175,6 +227,135 @@ async def handle_list_tools() -> list[Tool]:
                 "required": [],
             },
         ),
+        Tool(
+            name="search_historical_facts",
+            description="Search every day of the year for historical facts mentioning people, places or topics (e.g. \"moon landing\", \"Marie Curie\"). Returns the best matches with their dates.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "Words to search for"
+                    },
+                    "category": {
+                        "type": "string",
+                        "enum": ["events", "births", "deaths", "holidays", "selected"],
+                        "description": "Only return facts of this type (default: all but selected)"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "maximum": corpus_store.MAX_SEARCH_RESULTS,
+                        "default": 10,
+                        "description": "Maximum number of results"
+                    }
+                },
+                "required": ["query"],
+            },
+        ),
+        Tool(
+            name="get_facts_for_year",
+            description="Get what happened in a given year (e.g. 1969), across every day of the calendar. Returns events, births and deaths from that year in date order.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "year": {
+                        "type": "integer",
+                        "description": "Year, negative for BCE (e.g. -44)"
+                    },
+                    "category": {
+                        "type": "string",
+                        "enum": ["events", "births", "deaths", "holidays", "selected"],
+                        "description": "Only return facts of this type (default: all but selected)"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "maximum": corpus_store.MAX_YEAR_RESULTS,
+                        "default": 20,
+                        "description": "Maximum number of results"
+                    }
+                },
+                "required": ["year"],
+            },
+        ),
+        Tool(
+            name="query_history",
+            description="Query every day of the year by any combination of facets: type of fact, era, world region, theme and year range (e.g. wars in Europe from 1800 to 1900). Returns matches in calendar order with the total count.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "category": {
+                        "type": "array",
+                        "items": {"type": "string", "enum": list(records.CATEGORIES)},
+                        "description": "Types of fact to include (default: all but selected)"
+                    },
+                    "era": {
+                        "type": "array",
+                        "items": {"type": "string", "enum": list(facets.ERAS)},
+                        "description": "Eras: ancient (before 1000), medieval (1000-1499), renaissance (1500-1699), modern (1700-1899), contemporary (1900 on)"
+                    },
+                    "region": {
+                        "type": "array",
+                        "items": {"type": "string", "enum": list(facets.REGIONS)},
+                        "description": "World regions the fact mentions"
+                    },
+                    "theme": {
+                        "type": "array",
+                        "items": {"type": "string", "enum": list(facets.THEMES)},
+                        "description": "Themes of the fact"
+                    },
+                    "year_from": {
+                        "type": "integer",
+                        "description": "Earliest year, negative for BCE"
+                    },
+                    "year_to": {
+                        "type": "integer",
+                        "description": "Latest year, negative for BCE"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "maximum": facets.MAX_QUERY_RESULTS,
+                        "default": 20,
+                        "description": "Maximum number of results"
+                    },
+                    "offset": {
+                        "type": "integer",
+                        "minimum": 0,
+                        "default": 0,
+                        "description": "Number of matches to skip, for paging"
+                    }
+                },
+                "required": [],
+            },
+        ),
+        Tool(
+            name="get_facts_about_entity",
+            description="Get every historical fact, on any day of the year, that links the Wikipedia page of a person, place or thing (e.g. \"Napoleon\", \"Moon\"). Names are matched ignoring case, accents and underscores. Returns facts in date order.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "title": {
+                        "type": "string",
+                        "description": "Wikipedia page title or name, e.g. \"Napoleon\" or \"Marie_Curie\""
+                    },
+                    "category": {
+                        "type": "string",
+                        "enum": ["events", "births", "deaths", "holidays", "selected"],
+                        "description": "Only return facts of this type (default: all but selected)"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "maximum": corpus_store.MAX_ENTITY_RESULTS,
+                        "default": 20,
+                        "description": "Maximum number of results"
+                    }
+                },
+                "required": ["title"],
+            },
+        ),
     ]
 
 
@@ -208,46 +389,49 @@ async def handle_call_tool(name: str, arguments: dict[str, Any] | None) -> list[
                     text=f"Error: Invalid date {month}/{day}. Please provide a valid month (1-12) and day."
                 )]
             
-            data = await fetch_historical_events(month, day, event_type)
+            data = await fetch_historical_events(month, day)
             
             # Format the response
             response_parts = []
             response_parts.append(f"# Historical Facts for {month}/{day}")
             response_parts.append("")
+            if data.stale:
+                response_parts.append(day_cache.STALE_NOTICE)
+                response_parts.append("")
             
             # Process different types of events
             if event_type == "all":
                 # Events
-                if "events" in data and data["events"]:
+                if data.items("events"):
                     response_parts.append("## 📅 Historical Events")
-                    for event in data["events"][:3]:  # Limit to 3 events
+                    for event in data.items("events")[:3]:  # Limit to 3 events
                         response_parts.append(format_historical_event(event))
                         response_parts.append("")
                 
                 # Births
-                if "births" in data and data["births"]:
+                if data.items("births"):
                     response_parts.append("## 🎂 Notable Births")
-                    for birth in data["births"][:2]:  # Limit to 2 births
+                    for birth in data.items("births")[:2]:  # Limit to 2 births
                         response_parts.append(format_birth_death_event(birth, "births"))
                         response_parts.append("")
                 
                 # Deaths
-                if "deaths" in data and data["deaths"]:
+                if data.items("deaths"):
                     response_parts.append("## ⚰️ Notable Deaths")
-                    for death in data["deaths"][:2]:  # Limit to 2 deaths
+                    for death in data.items("deaths")[:2]:  # Limit to 2 deaths
                         response_parts.append(format_birth_death_event(death, "deaths"))
                         response_parts.append("")
                 
                 # Holidays
-                if "holidays" in data and data["holidays"]:
+                if data.items("holidays"):
                     response_parts.append("## 🎉 Holidays & Observances")
-                    for holiday in data["holidays"][:2]:  # Limit to 2 holidays
+                    for holiday in data.items("holidays")[:2]:  # Limit to 2 holidays
                         response_parts.append(format_historical_event(holiday))
                         response_parts.append("")
             
             else:
                 # Specific event type
-                if event_type in data and data[event_type]:
+                if data.items(event_type):
                     event_title = {
                         "events": "📅 Historical Events", 
                         "births": "🎂 Notable Births",
@@ -257,7 +441,7 @@ async def handle_call_tool(name: str, arguments: dict[str, Any] | None) -> list[
                     
                     response_parts.append(f"## {event_title}")
                     
-                    for event in data[event_type][:5]:  # Show up to 5 events
+                    for event in data.items(event_type)[:5]:  # Show up to 5 events
                         if event_type in ["births", "deaths"]:
                             response_parts.append(format_birth_death_event(event, event_type))
                         else:
@@ -269,40 +453,43 @@ async def handle_call_tool(name: str, arguments: dict[str, Any] | None) -> list[
             return [TextContent(type="text", text="\n".join(response_parts))]
         
         elif name == "get_todays_historical_facts":
-            today = datetime.now()
+            today = rollover.today(arguments.get("timezone"))
             event_type = arguments.get("event_type", "all")
             
-            data = await fetch_historical_events(today.month, today.day, event_type)
+            data = await fetch_historical_events(today.month, today.day)
             
             # Format the response
             response_parts = []
             response_parts.append(f"# What Happened on This Day ({today.month}/{today.day})")
             response_parts.append("")
+            if data.stale:
+                response_parts.append(day_cache.STALE_NOTICE)
+                response_parts.append("")
             
             # Process the same way as get_historical_facts
             if event_type == "all":
                 # Events
-                if "events" in data and data["events"]:
+                if data.items("events"):
                     response_parts.append("## 📅 Historical Events")
-                    for event in data["events"][:3]:  
+                    for event in data.items("events")[:3]:  
                         response_parts.append(format_historical_event(event))
                         response_parts.append("")
                 
                 # Births
-                if "births" in data and data["births"]:
+                if data.items("births"):
                     response_parts.append("## 🎂 Notable Births")
-                    for birth in data["births"][:2]:  
+                    for birth in data.items("births")[:2]:  
                         response_parts.append(format_birth_death_event(birth, "births"))
                         response_parts.append("")
                 
                 # Deaths  
-                if "deaths" in data and data["deaths"]:
+                if data.items("deaths"):
                     response_parts.append("## ⚰️ Notable Deaths")
-                    for death in data["deaths"][:2]:  
+                    for death in data.items("deaths")[:2]:  
                         response_parts.append(format_birth_death_event(death, "deaths"))
                         response_parts.append("")
             else:
-                if event_type in data and data[event_type]:
+                if data.items(event_type):
                     event_title = {
                         "events": "📅 Historical Events",
                         "births": "🎂 Notable Births", 
@@ -312,7 +499,7 @@ async def handle_call_tool(name: str, arguments: dict[str, Any] | None) -> list[
                     
                     response_parts.append(f"## {event_title}")
                     
-                    for event in data[event_type][:5]:
+                    for event in data.items(event_type)[:5]:
                         if event_type in ["births", "deaths"]:
                             response_parts.append(format_birth_death_event(event, event_type))
                         else:
@@ -332,15 +519,18 @@ async def handle_call_tool(name: str, arguments: dict[str, Any] | None) -> list[
             
             event_type = arguments.get("event_type", "events")
             
-            data = await fetch_historical_events(month, day, event_type)
+            data = await fetch_historical_events(month, day)
             
             response_parts = []
             response_parts.append(f"# Random Historical Fact ({month}/{day})")
             response_parts.append("")
+            if data.stale:
+                response_parts.append(day_cache.STALE_NOTICE)
+                response_parts.append("")
             
-            if event_type in data and data[event_type]:
+            if data.items(event_type):
                 # Pick a random event from the results
-                random_event = random.choice(data[event_type])
+                random_event = random.choice(data.items(event_type))
                 
                 event_title = {
                     "events": "📅 Random Historical Event",
@@ -360,6 +550,37 @@ async def handle_call_tool(name: str, arguments: dict[str, Any] | None) -> list[
             
             return [TextContent(type="text", text="\n".join(response_parts))]
         
+        elif name == "search_historical_facts":
+            query = (arguments.get("query") or "").strip()
+            if not query:
+                return [TextContent(type="text", text="Error: query is a required parameter.")]
+            
+            hits = corpus_store.search(query, arguments.get("category"), arguments.get("limit", 10))
+            return [TextContent(type="text", text=format_search_results(query, hits))]
+        
+        elif name == "get_facts_for_year":
+            year = arguments.get("year")
+            if year is None:
+                return [TextContent(type="text", text="Error: year is a required parameter.")]
+            
+            year = int(year)
+            facts = corpus_store.facts_for_year(year, arguments.get("category"), arguments.get("limit", 20))
+            return [TextContent(type="text", text=format_year_results(year, facts))]
+        
+        elif name == "query_history":
+            filters = facets.filters(arguments)
+            offset = max(0, int(arguments.get("offset", 0)))
+            result = facets.query(limit=arguments.get("limit", 20), offset=offset, **filters)
+            return [TextContent(type="text", text=format_query_results(facets.describe(**filters), result, offset))]
+        
+        elif name == "get_facts_about_entity":
+            title = (arguments.get("title") or "").strip()
+            if not title:
+                return [TextContent(type="text", text="Error: title is a required parameter.")]
+            
+            facts = corpus_store.facts_about_entity(title, arguments.get("category"), arguments.get("limit", 20))
+            return [TextContent(type="text", text=format_entity_results(title, facts))]
+        
         else:
             return [TextContent(
                 type="text",
@@ -376,14 +597,46 @@ async def handle_call_tool(name: str, arguments: dict[str, Any] | None) -> list[
 
 async def main():
     """Main entry point for the server."""
-    # Run the server using stdin/stdout streams
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            server.create_initialization_options()
-        )
+    # Run the server using stdin/stdout streams, sharing one upstream client
+    async with lifecycle.running():
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(
+                read_stream,
+                write_stream,
+                server.create_initialization_options()
+            )
 
 
-if __name__ == "__main__":
+def cli():
+    """Console entry point: run the stdio server, or build an offline corpus and its search index."""
+    parser = argparse.ArgumentParser(
+        prog="historical-facts-mcp",
+        description="Historical Facts MCP server (runs over stdio by default)"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("serve", help="run the MCP server over stdio (default)")
+    corpus.add_build_arguments(subparsers.add_parser(
+        "build-corpus",
+        help="fetch all 366 days into a local corpus for offline corpus mode"
+    ))
+    corpus.add_pack_arguments(subparsers.add_parser(
+        "pack-corpus",
+        help="write the memory-mappable binary copy of an existing corpus"
+    ))
+    corpus_store.add_build_arguments(subparsers.add_parser(
+        "build-search-index",
+        help="load a corpus into the SQLite store behind search_historical_facts"
+    ))
+    args = parser.parse_args()
+
+    if args.command == "build-corpus":
+        sys.exit(corpus.run_build(args))
+    if args.command == "pack-corpus":
+        sys.exit(corpus.run_pack(args))
+    if args.command == "build-search-index":
+        sys.exit(corpus_store.run_build(args))
     asyncio.run(main())
+
+
+if __name__ == "__main__":
+    cli()
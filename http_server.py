@@ -9,25 +9,44 @@ externally and integrated with web-based AI applications.
 import asyncio
 import json
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 import httpx
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
 
+import corpus_store
+import day_cache
+import facets
+import lifecycle
+import prefetch
+import records
+import rollover
+import upstream
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("historical-facts-http")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the shared upstream client for the lifetime of the app"""
+    async with lifecycle.running():
+        yield
+
+
 app = FastAPI(
     title="Historical Facts MCP Server",
     description="A fun API that provides historical facts from events that happened on the same date in history",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Add CORS middleware for web integration
@@ -39,19 +58,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Wikipedia On This Day API base URL
-WIKI_API_BASE = "https://api.wikimedia.org/feed/v1/wikipedia/en/onthisday"
-
 
 async def fetch_historical_events(month: int, day: int, event_type: str = "all") -> dict:
     """Fetch historical events from Wikipedia's On This Day API"""
-    url = f"{WIKI_API_BASE}/{event_type}/{month:02d}/{day:02d}"
-    
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            return response.json()
+        return await day_cache.get_feed(event_type, month, day, timeout=30.0)
     except Exception as e:
         logger.error(f"Error fetching data from Wikipedia API: {e}")
         raise HTTPException(status_code=500, detail=f"Error fetching historical data: {str(e)}")
@@ -65,6 +76,7 @@ def format_historical_event(event: dict) -> dict:
     # Get additional context from pages if available
     pages = event.get('pages', [])
     formatted_event = {
+        "id": event.get('id'),
         "year": year,
         "text": text,
         "pages": []
@@ -83,6 +95,17 @@ def format_historical_event(event: dict) -> dict:
     return formatted_event
 
 
+def conditional_response(request: Request, payload: dict) -> Response:
+    """304 if the client already holds this version of the payload, else the JSON with its ETag"""
+    response = JSONResponse(payload)
+    # The payload has no per-response fields, so its rendered body is the version
+    etag = records.response_etag(response.body)
+    if records.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return response
+
+
 @app.get("/", tags=["Info"])
 async def root():
     """Root endpoint with basic information"""
@@ -94,6 +117,10 @@ async def root():
             "/historical-facts/{month}/{day}",
             "/historical-facts/today",
             "/historical-facts/random",
+            "/historical-facts/search?q={query}",
+            "/historical-facts/year/{year}",
+            "/historical-facts/query?region={region}&theme={theme}&year_from={year}",
+            "/historical-facts/entity/{title}",
             "/docs"
         ],
         "github": "https://github.com/oscar-fern-labs/historical-facts-mcp-server"
@@ -103,14 +130,77 @@ async def root():
 @app.get("/health", tags=["Health"])
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "upstream": upstream.metrics(),
+        "cache": day_cache.metrics(),
+        "rollover": rollover.metrics(),
+        "prefetch": prefetch.metrics(),
+        "search": corpus_store.metrics(),
+        "facets": facets.metrics()
+    }
+
+
+# Declared before /{month}/{day}, which would otherwise match /year/{year} and /entity/{title}
+@app.get("/historical-facts/year/{year}", tags=["Historical Facts"])
+async def get_facts_for_year(year: int, category: Optional[str] = None, limit: int = 20):
+    """
+    Get historical facts from one year, across every day of the calendar, in date order
+    
+    - **year**: Year, negative for BCE (e.g. 1969 or -44)
+    - **category**: Only return this type ("events", "births", "deaths", "holidays", "selected")
+    - **limit**: Maximum number of results (1-200)
+    """
+    try:
+        facts = corpus_store.facts_for_year(year, category, limit)
+    except LookupError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return {
+        "year": year,
+        "count": len(facts),
+        "results": [
+            {"date": f"{fact.month:02d}/{fact.day:02d}", "event_type": fact.item.category,
+             **format_historical_event(fact.item.to_dict())}
+            for fact in facts
+        ]
+    }
+
+
+@app.get("/historical-facts/entity/{title:path}", tags=["Historical Facts"])
+async def get_facts_about_entity(title: str, category: Optional[str] = None, limit: int = 20):
+    """
+    Get historical facts from every day of the year that link a Wikipedia page, in date order
+    
+    - **title**: Page title or name, e.g. "Napoleon" (case, accents and underscores are ignored)
+    - **category**: Only return this type ("events", "births", "deaths", "holidays", "selected")
+    - **limit**: Maximum number of results (1-200)
+    """
+    try:
+        facts = corpus_store.facts_about_entity(title, category, limit)
+    except LookupError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return {
+        "title": title,
+        "pages": facts.titles,
+        "total": facts.total,
+        "count": len(facts.items),
+        "results": [
+            {"date": f"{fact.month:02d}/{fact.day:02d}", "event_type": fact.item.category,
+             **format_historical_event(fact.item.to_dict())}
+            for fact in facts.items
+        ]
+    }
 
 
 @app.get("/historical-facts/{month}/{day}", tags=["Historical Facts"])
 async def get_historical_facts(
     month: int,
     day: int,
-    event_type: str = "all"
+    event_type: str = "all",
+    request: Request = None
 ):
     """
     Get historical facts for a specific date
@@ -141,6 +231,7 @@ async def get_historical_facts(
     # Format the response
     response = {
         "date": f"{month:02d}/{day:02d}",
+        "stale": day_cache.is_stale(data),
         "event_types": []
     }
     
@@ -168,18 +259,25 @@ async def get_historical_facts(
                 "events": formatted_events
             })
     
-    return response
+    if request is None:
+        return response
+    
+    return conditional_response(request, response)
 
 
 @app.get("/historical-facts/today", tags=["Historical Facts"])
-async def get_todays_historical_facts(event_type: str = "all"):
+async def get_todays_historical_facts(event_type: str = "all", timezone: Optional[str] = None,
+                                     request: Request = None):
     """
     Get historical facts for today's date
     
     - **event_type**: Type of events ("all", "events", "births", "deaths", "holidays")
+    - **timezone**: IANA timezone of the client, e.g. "America/Chicago" (or the X-Timezone header; default: server time)
     """
-    today = datetime.now()
-    return await get_historical_facts(today.month, today.day, event_type)
+    if timezone is None and request is not None:
+        timezone = request.headers.get(rollover.TIMEZONE_HEADER)
+    today = rollover.today(timezone)
+    return await get_historical_facts(today.month, today.day, event_type, request)
 
 
 @app.get("/historical-facts/random", tags=["Historical Facts"])
@@ -207,6 +305,7 @@ async def get_random_historical_fact(event_type: str = "events"):
         return {
             "date": f"{month:02d}/{day:02d}",
             "event_type": event_type,
+            "stale": day_cache.is_stale(data),
             "fact": format_historical_event(random_event)
         }
     else:
@@ -218,6 +317,69 @@ async def get_random_historical_fact(event_type: str = "events"):
         }
 
 
+@app.get("/historical-facts/search", tags=["Historical Facts"])
+async def search_historical_facts(q: str, category: Optional[str] = None, limit: int = 10):
+    """
+    Search every day of the year for historical facts, best matches first
+    
+    - **q**: Words to search for, e.g. "moon landing"
+    - **category**: Only return this type ("events", "births", "deaths", "holidays", "selected")
+    - **limit**: Maximum number of results (1-50)
+    """
+    try:
+        hits = corpus_store.search(q, category, limit)
+    except LookupError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return {
+        "query": q,
+        "count": len(hits),
+        "results": [
+            {"date": f"{hit.month:02d}/{hit.day:02d}", "event_type": hit.item.category,
+             "score": round(hit.score, 3), **format_historical_event(hit.item.to_dict())}
+            for hit in hits
+        ]
+    }
+
+
+@app.get("/historical-facts/query", tags=["Historical Facts"])
+async def query_history(request: Request, limit: int = 20, offset: int = 0):
+    """
+    Query every day of the year by facets, matches in calendar order
+    
+    - **category**: Types of fact ("events", "births", "deaths", "holidays", "selected")
+    - **era**: "ancient", "medieval", "renaissance", "modern", "contemporary"
+    - **region**: "europe", "asia", "americas", "africa", "oceania"
+    - **theme**: "politics", "war", "science", "arts", "exploration", "religion", "sports", "disaster"
+    - **year_from** / **year_to**: Year range, negative for BCE
+    - **limit** / **offset**: Page of matches (limit 1-100)
+    
+    Several values of one facet are comma-separated and match any of them,
+    e.g. `?region=europe,asia&theme=war&year_from=1800`.
+    """
+    try:
+        return facet_query_results(facets.filters(dict(request.query_params)), limit, offset)
+    except LookupError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def facet_query_results(filters: Dict[str, Any], limit: int, offset: int) -> Dict[str, Any]:
+    """Run a faceted query and format its page of matches"""
+    result = facets.query(limit=limit, offset=offset, **filters)
+    return {
+        "filters": {key: value for key, value in filters.items() if value is not None},
+        "total": result.total,
+        "count": len(result.items),
+        "results": [
+            {"date": f"{fact.month:02d}/{fact.day:02d}", "event_type": fact.item.category,
+             **format_historical_event(fact.item.to_dict())}
+            for fact in result.items
+        ]
+    }
+
+
 # MCP-compatible endpoint for tool integration
 @app.post("/mcp/call-tool", tags=["MCP"])
 async def mcp_call_tool(request: Dict[str, Any]):
@@ -243,7 +405,7 @@ async def mcp_call_tool(request: Dict[str, Any]):
         
         elif tool_name == "get_todays_historical_facts":
             event_type = arguments.get("event_type", "all")
-            result = await get_todays_historical_facts(event_type)
+            result = await get_todays_historical_facts(event_type, arguments.get("timezone"))
             return {"result": result}
         
         elif tool_name == "get_random_historical_fact":
@@ -251,6 +413,35 @@ async def mcp_call_tool(request: Dict[str, Any]):
             result = await get_random_historical_fact(event_type)
             return {"result": result}
         
+        elif tool_name == "search_historical_facts":
+            query = arguments.get("query")
+            if not query:
+                return {"error": "query is a required parameter"}
+            
+            result = await search_historical_facts(query, arguments.get("category"), arguments.get("limit", 10))
+            return {"result": result}
+        
+        elif tool_name == "get_facts_for_year":
+            year = arguments.get("year")
+            if year is None:
+                return {"error": "year is a required parameter"}
+            
+            result = await get_facts_for_year(int(year), arguments.get("category"), arguments.get("limit", 20))
+            return {"result": result}
+        
+        elif tool_name == "get_facts_about_entity":
+            title = arguments.get("title")
+            if not title:
+                return {"error": "title is a required parameter"}
+            
+            result = await get_facts_about_entity(title, arguments.get("category"), arguments.get("limit", 20))
+            return {"result": result}
+        
+        elif tool_name == "query_history":
+            result = facet_query_results(facets.filters(arguments), arguments.get("limit", 20),
+                                         arguments.get("offset", 0))
+            return {"result": result}
+        
         else:
             return {"error": f"Unknown tool: {tool_name}"}
             
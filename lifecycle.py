@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Process lifecycle for the Historical Facts servers
+
+All servers share the same background resources: the pooled upstream client,
+the workers that refresh stale cached days, the speculative prefetcher (see
+prefetch.py) and the task that prewarms each new "today" before midnight (see
+rollover.py). The facet bitmaps (see facets.py) are built before serving.
+lifecycle.running() starts them and tears them down in reverse order,
+so a FastAPI lifespan or the stdio main() only needs a single `async with`.
+In corpus mode the corpus is loaded up front and no upstream connections are
+warmed, since date tools never leave the process. Otherwise the upstream
+backend (live, corpus file or local fake, see backends.py) is selected first.
+
+License: MIT
+"""
+
+import logging
+from contextlib import asynccontextmanager
+
+import backends
+import corpus
+import day_cache
+import facets
+import prefetch
+import rollover
+import upstream
+
+logger = logging.getLogger("historical-facts-lifecycle")
+
+
+@asynccontextmanager
+async def running():
+    """Start shared resources for the lifetime of a server process"""
+    if not corpus.active():
+        backends.install()
+        await upstream.start_client()
+        await day_cache.start_refresher()
+        await prefetch.start()
+    await facets.start()
+    await rollover.start()
+    try:
+        yield
+    finally:
+        await rollover.stop()
+        await prefetch.stop()
+        await day_cache.stop_refresher()
+        await upstream.close_client()
+        logger.info("Shared upstream resources released")
@@ -9,6 +9,11 @@ endpoint for ChatGPT Desktop integration. This server supports:
 2. /mcp endpoint for ChatGPT Desktop connection
 3. Proper MCP protocol over HTTP
 
+tools/call results for a date are rendered and JSON-encoded once per day
+record and kept as bytes; repeat calls only splice in the JSON-RPC id. The
+number of cached results is set by HISTORICAL_FACTS_RESULT_CACHE_SIZE
+(default 512, 0 disables).
+
 Author: suspicious_kowalevski
 License: MIT
 """
@@ -16,12 +21,12 @@ License: MIT
 import asyncio
 import json
 import logging
+from collections import OrderedDict
 from datetime import datetime, date
-from typing import Any, Dict, List, Union
-import httpx
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware  
 from fastapi.responses import JSONResponse, StreamingResponse
 import uvicorn
@@ -31,8 +36,14 @@ import sys
 import os
 sys.path.append(os.path.dirname(__file__))
 
-# Wikipedia On This Day API base URL
-WIKI_API_BASE = "https://api.wikimedia.org/feed/v1/wikipedia/en/onthisday"
+import corpus_store
+import day_cache
+import facets
+import lifecycle
+import prefetch
+import records
+import rollover
+import upstream
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -42,39 +53,44 @@ logger = logging.getLogger("historical-facts-mcp-http")
 async def fetch_historical_events(month: int, day: int, event_type: str = "all") -> dict:
     """Fetch historical events from Wikipedia's On This Day API"""
     try:
-        if event_type == "all":
-            url = f"{WIKI_API_BASE}/all/{month:02d}/{day:02d}"
-        else:
-            url = f"{WIKI_API_BASE}/{event_type}/{month:02d}/{day:02d}"
+        logger.info(f"Fetching {event_type} for {month:02d}/{day:02d}")
         
-        logger.info(f"Fetching from: {url}")
+        data = await day_cache.get_feed(event_type, month, day, timeout=10.0)
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
-            
-            logger.info(f"Successfully fetched data for {month}/{day}, type: {event_type}")
-            return data
+        logger.info(f"Successfully fetched data for {month}/{day}, type: {event_type}")
+        return data
             
     except Exception as e:
         logger.error(f"Error fetching historical events: {e}")
         return {}
 
 
-def format_historical_event(event: dict) -> str:
+async def fetch_day_record(month: int, day: int, background: bool = False) -> records.DayRecord:
+    """
+    Fetch the shared (read-only) day record that the MCP tool formatters read.
+    
+    background marks fetches made by the server itself (see day_cache.get_record()).
+    """
+    try:
+        return await day_cache.get_record(month, day, timeout=10.0, background=background)
+    except Exception as e:
+        logger.error(f"Error fetching historical events: {e}")
+        return records.DayRecord(month, day, {})
+
+
+def format_historical_event(event: records.ItemRecord) -> str:
     """Format a historical event for display."""
-    year = event.get("year", "Unknown")
-    text = event.get("text", "No description available")
+    year = event.year if event.year is not None else "Unknown"
+    text = event.text or "No description available"
     
     # Get Wikipedia links if available
-    links = event.get("pages", [])
+    links = event.pages
     wikipedia_links = []
     if links:
         for link in links[:2]:  # Limit to first 2 links
-            title = link.get("displaytitle", link.get("title", ""))
+            title = link.label
             if title:
-                wikipedia_links.append(f"[{title}](https://en.wikipedia.org/wiki/{link.get('title', '').replace(' ', '_')})")
+                wikipedia_links.append(f"[{title}](https://en.wikipedia.org/wiki/{link.title.replace(' ', '_')})")
     
     formatted = f"**{year}**: {text}"
     if wikipedia_links:
@@ -83,19 +99,19 @@ def format_historical_event(event: dict) -> str:
     return formatted
 
 
-def format_birth_death_event(event: dict, event_type: str) -> str:
+def format_birth_death_event(event: records.ItemRecord, event_type: str) -> str:
     """Format a birth/death event for display."""
-    year = event.get("year", "Unknown")
-    text = event.get("text", "No description available")
+    year = event.year if event.year is not None else "Unknown"
+    text = event.text or "No description available"
     
     # Get Wikipedia links if available
-    links = event.get("pages", [])
+    links = event.pages
     wikipedia_links = []
     if links:
         for link in links[:1]:  # Limit to first link for births/deaths
-            title = link.get("displaytitle", link.get("title", ""))
+            title = link.label
             if title:
-                wikipedia_links.append(f"[{title}](https://en.wikipedia.org/wiki/{link.get('title', '').replace(' ', '_')})")
+                wikipedia_links.append(f"[{title}](https://en.wikipedia.org/wiki/{link.title.replace(' ', '_')})")
     
     icon = "🎂" if event_type == "births" else "⚰️"
     formatted = f"**{year}**: {text} {icon}"
@@ -106,41 +122,96 @@ def format_birth_death_event(event: dict, event_type: str) -> str:
     return formatted
 
 
-async def process_mcp_tool_call(tool_name: str, arguments: dict) -> list:
-    """Process MCP tool calls and return results."""
+def format_dated_items(header: List[str],
+                       items: List[Union[corpus_store.DatedItem, corpus_store.SearchHit]]) -> str:
+    """Format items that each carry their own date (search, year, entity and query results) under a header."""
+    response_parts = [*header, ""]
+    for fact in items:
+        response_parts.append(f"### {fact.month}/{fact.day} ({fact.item.category})")
+        if fact.item.category in ["births", "deaths"]:
+            response_parts.append(format_birth_death_event(fact.item, fact.item.category))
+        else:
+            response_parts.append(format_historical_event(fact.item))
+        response_parts.append("")
+    return "\n".join(response_parts)
+
+
+def format_search_results(query: str, hits: List[corpus_store.SearchHit]) -> str:
+    """Format ranked search matches, each under the date it happened on."""
+    if not hits:
+        return f"No historical facts match \"{query}\"."
+    return format_dated_items([f"# Historical Facts matching \"{query}\""], hits)
+
+
+def format_year_results(year: int, facts: List[corpus_store.DatedItem]) -> str:
+    """Format a year's facts in calendar order, each under its date."""
+    label = records.format_year(year)
+    if not facts:
+        return f"No historical facts found for the year {label}."
+    return format_dated_items([f"# Historical Facts from {label}"], facts)
+
+
+def format_entity_results(title: str, facts: corpus_store.EntityFacts) -> str:
+    """Format the facts linking an entity's pages in calendar order, each under its date."""
+    if not facts.titles:
+        return f"No Wikipedia page called \"{title}\" is linked from any historical fact."
+    return format_dated_items([
+        f"# Historical Facts about {', '.join(facts.titles)}",
+        f"*{facts.total} facts link {'this page' if len(facts.titles) == 1 else 'these pages'}; showing {len(facts.items)}*"
+    ], facts.items)
+
+
+def format_query_results(description: str, result: facets.FacetResult, offset: int = 0) -> str:
+    """Format a page of faceted query matches in calendar order, each under its date."""
+    if not result.items:
+        return f"No historical facts match {description}." if not result.total else \
+            f"No more historical facts match {description} ({result.total} in total)."
+    return format_dated_items([
+        f"# Historical Facts: {description}",
+        f"*{result.total} matches; showing {offset + 1}-{offset + len(result.items)}*"
+    ], result.items)
+
+
+async def process_mcp_tool_call(tool_name: str, arguments: dict,
+                                data: Optional[records.DayRecord] = None) -> list:
+    """Process MCP tool calls and return results; data is the day record if already fetched."""
     try:
         if tool_name == "get_historical_facts":
             month = arguments["month"]
             day = arguments["day"]
             event_type = arguments.get("event_type", "all")
             
-            data = await fetch_historical_events(month, day, event_type)
+            if data is None:
+                data = await fetch_day_record(month, day)
             
             response_parts = []
             response_parts.append(f"# Historical Facts for {month}/{day}")
             response_parts.append("")
+            if data.stale:
+                response_parts.append(day_cache.STALE_NOTICE)
+                response_parts.append("")
             
             if event_type == "all":
                 # Show a summary of all types
-                if "events" in data and data["events"]:
+                if data.items("events"):
                     response_parts.append("## 📅 Historical Events")
-                    for event in data["events"][:3]:  
+                    for event in data.items("events")[:3]:  
                         response_parts.append(format_historical_event(event))
                         response_parts.append("")
                 
-                if "births" in data and data["births"]:
+                if data.items("births"):
                     response_parts.append("## 🎂 Notable Births")
-                    for birth in data["births"][:2]:  
+                    for birth in data.items("births")[:2]:  
                         response_parts.append(format_birth_death_event(birth, "births"))
                         response_parts.append("")
                 
-                if "deaths" in data and data["deaths"]:
+                if data.items("deaths"):
                     response_parts.append("## ⚰️ Notable Deaths")
-                    for death in data["deaths"][:2]:  
+                    for death in data.items("deaths")[:2]:  
                         response_parts.append(format_birth_death_event(death, "deaths"))
                         response_parts.append("")
             else:
-                if event_type in data and data[event_type]:
+                if data.items(event_type):
                     event_title = {
                         "events": "📅 Historical Events",
                         "births": "🎂 Notable Births", 
@@ -150,7 +221,7 @@ async def process_mcp_tool_call(tool_name: str, arguments: dict) -> list:
                     
                     response_parts.append(f"## {event_title}")
                     
-                    for event in data[event_type][:5]:
+                    for event in data.items(event_type)[:5]:
                         if event_type in ["births", "deaths"]:
                             response_parts.append(format_birth_death_event(event, event_type))
                         else:
@@ -162,38 +233,41 @@ async def process_mcp_tool_call(tool_name: str, arguments: dict) -> list:
             return [{"type": "text", "text": "\n".join(response_parts)}]
         
         elif tool_name == "get_todays_historical_facts":
-            today = date.today()
-            month = today.month
-            day = today.day
+            if data is None:
+                today = rollover.today(arguments.get("timezone"))
+                data = await fetch_day_record(today.month, today.day)
+            month = data.month
+            day = data.day
             event_type = arguments.get("event_type", "all")
             
-            data = await fetch_historical_events(month, day, event_type)
-            
             response_parts = []
             response_parts.append(f"# Today in History ({month}/{day})")
             response_parts.append("")
+            if data.stale:
+                response_parts.append(day_cache.STALE_NOTICE)
+                response_parts.append("")
             
             if event_type == "all":
                 # Show a summary of all types
-                if "events" in data and data["events"]:
+                if data.items("events"):
                     response_parts.append("## 📅 Historical Events")
-                    for event in data["events"][:3]:  
+                    for event in data.items("events")[:3]:  
                         response_parts.append(format_historical_event(event))
                         response_parts.append("")
                 
-                if "births" in data and data["births"]:
+                if data.items("births"):
                     response_parts.append("## 🎂 Notable Births")
-                    for birth in data["births"][:2]:  
+                    for birth in data.items("births")[:2]:  
                         response_parts.append(format_birth_death_event(birth, "births"))
                         response_parts.append("")
                 
-                if "deaths" in data and data["deaths"]:
+                if data.items("deaths"):
                     response_parts.append("## ⚰️ Notable Deaths")
-                    for death in data["deaths"][:2]:  
+                    for death in data.items("deaths")[:2]:  
                         response_parts.append(format_birth_death_event(death, "deaths"))
                         response_parts.append("")
             else:
-                if event_type in data and data[event_type]:
+                if data.items(event_type):
                     event_title = {
                         "events": "📅 Historical Events",
                         "births": "🎂 Notable Births", 
@@ -203,7 +277,7 @@ async def process_mcp_tool_call(tool_name: str, arguments: dict) -> list:
                     
                     response_parts.append(f"## {event_title}")
                     
-                    for event in data[event_type][:5]:
+                    for event in data.items(event_type)[:5]:
                         if event_type in ["births", "deaths"]:
                             response_parts.append(format_birth_death_event(event, event_type))
                         else:
@@ -223,15 +297,18 @@ async def process_mcp_tool_call(tool_name: str, arguments: dict) -> list:
             
             event_type = arguments.get("event_type", "events")
             
-            data = await fetch_historical_events(month, day, event_type)
+            data = await fetch_day_record(month, day)
             
             response_parts = []
             response_parts.append(f"# Random Historical Fact ({month}/{day})")
             response_parts.append("")
+            if data.stale:
+                response_parts.append(day_cache.STALE_NOTICE)
+                response_parts.append("")
             
-            if event_type in data and data[event_type]:
+            if data.items(event_type):
                 # Pick a random event from the results
-                random_event = random.choice(data[event_type])
+                random_event = random.choice(data.items(event_type))
                 
                 event_title = {
                     "events": "📅 Random Historical Event",
@@ -251,6 +328,37 @@ async def process_mcp_tool_call(tool_name: str, arguments: dict) -> list:
             
             return [{"type": "text", "text": "\n".join(response_parts)}]
         
+        elif tool_name == "search_historical_facts":
+            query = (arguments.get("query") or "").strip()
+            if not query:
+                return [{"type": "text", "text": "Error: query is a required parameter."}]
+            
+            hits = corpus_store.search(query, arguments.get("category"), arguments.get("limit", 10))
+            return [{"type": "text", "text": format_search_results(query, hits)}]
+        
+        elif tool_name == "get_facts_for_year":
+            year = arguments.get("year")
+            if year is None:
+                return [{"type": "text", "text": "Error: year is a required parameter."}]
+            
+            year = int(year)
+            facts = corpus_store.facts_for_year(year, arguments.get("category"), arguments.get("limit", 20))
+            return [{"type": "text", "text": format_year_results(year, facts)}]
+        
+        elif tool_name == "query_history":
+            filters = facets.filters(arguments)
+            offset = max(0, int(arguments.get("offset", 0)))
+            result = facets.query(limit=arguments.get("limit", 20), offset=offset, **filters)
+            return [{"type": "text", "text": format_query_results(facets.describe(**filters), result, offset)}]
+        
+        elif tool_name == "get_facts_about_entity":
+            title = (arguments.get("title") or "").strip()
+            if not title:
+                return [{"type": "text", "text": "Error: title is a required parameter."}]
+            
+            facts = corpus_store.facts_about_entity(title, arguments.get("category"), arguments.get("limit", 20))
+            return [{"type": "text", "text": format_entity_results(title, facts)}]
+        
         else:
             return [{"type": "text", "text": f"Unknown tool: {tool_name}"}]
     
@@ -259,6 +367,99 @@ async def process_mcp_tool_call(tool_name: str, arguments: dict) -> list:
         return [{"type": "text", "text": f"Error: {str(e)}"}]
 
 
+# Pre-serialized tools/call results. Key: (tool, month, day, event_type, stale);
+# value: the categories of the day record the result was rendered from, used as
+# its version, and the UTF-8 JSON of the `result` member
+RESULT_CACHE_SIZE = int(os.environ.get("HISTORICAL_FACTS_RESULT_CACHE_SIZE", "512"))
+_result_cache: "OrderedDict[tuple, Tuple[Mapping, bytes]]" = OrderedDict()
+_result_counters = {"hits": 0, "misses": 0}
+
+# Tools whose result depends only on the date and arguments
+CACHEABLE_TOOLS = ("get_historical_facts", "get_todays_historical_facts")
+
+
+def encode_json(content: Any) -> bytes:
+    """UTF-8 JSON encoded the way JSONResponse does it"""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+async def cached_tool_result(tool_name: str, arguments: dict) -> Optional[bytes]:
+    """
+    Serialized `result` of a cacheable tools/call, rendered once per day record.
+    
+    Calls with arguments the tool would reject are left to process_mcp_request,
+    which reports the error.
+    
+    Returns:
+        JSON bytes, or None if the call is not cacheable
+    """
+    if RESULT_CACHE_SIZE <= 0 or tool_name not in CACHEABLE_TOOLS:
+        return None
+    event_type = arguments.get("event_type", "all")
+    if not isinstance(event_type, str) or event_type not in ("all", *records.CATEGORIES):
+        return None
+    if tool_name == "get_historical_facts":
+        month, day = arguments.get("month"), arguments.get("day")
+        if not isinstance(month, int) or not isinstance(day, int):
+            return None
+        try:
+            date(2024, month, day)  # Use 2024 as it's a leap year to handle Feb 29
+        except ValueError:
+            return None
+    else:
+        timezone = arguments.get("timezone")
+        if timezone is not None and not isinstance(timezone, str):
+            return None
+        today = rollover.today(timezone)
+        month, day = today.month, today.day
+    return await render_cached(tool_name, month, day, event_type, arguments)
+
+
+async def render_cached(tool_name: str, month: int, day: int, event_type: str,
+                        arguments: dict, background: bool = False) -> bytes:
+    """Serialized result of a tool for a date, from the cache or rendered now"""
+    data = await fetch_day_record(month, day, background=background)
+    key = (tool_name, month, day, event_type, data.stale)
+    cached = _result_cache.get(key)
+    # Records are immutable and replaced on refresh, so an entry rendered from
+    # the same categories is still current
+    if cached is not None and cached[0] is data.categories:
+        _result_cache.move_to_end(key)
+        _result_counters["hits"] += 1
+        return cached[1]
+    
+    _result_counters["misses"] += 1
+    content = await process_mcp_tool_call(tool_name, arguments, data)
+    result = encode_json({"content": content})
+    if data.categories:  # never cache the empty record returned on fetch errors
+        _result_cache[key] = (data.categories, result)
+        _result_cache.move_to_end(key)
+        while len(_result_cache) > RESULT_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+    return result
+
+
+async def prewarm_results(month: int, day: int) -> None:
+    """Render the default date results ahead of a date becoming "today" somewhere"""
+    if RESULT_CACHE_SIZE > 0:
+        for tool_name in CACHEABLE_TOOLS:
+            await render_cached(tool_name, month, day, "all", {"month": month, "day": day},
+                                background=True)
+
+
+rollover.add_prewarm_hook(prewarm_results)
+
+
+def rpc_result_response(request_id: Any, result: bytes) -> Response:
+    """JSON-RPC response around a pre-serialized result"""
+    body = b'{"jsonrpc":"2.0","id":' + encode_json(request_id) + b',"result":' + result + b"}"
+    return Response(content=body, media_type="application/json")
+
+
+def result_cache_metrics() -> Dict[str, Any]:
+    return {**_result_counters, "entries": len(_result_cache), "max_entries": RESULT_CACHE_SIZE}
+
+
 async def process_mcp_request(request_data: Dict) -> Dict:
     """Process MCP request using JSON-RPC protocol."""
     try:
@@ -346,6 +547,10 @@ async def process_mcp_request(request_data: Dict) -> Dict:
                                 "description": "Type of events to get",
                                 "enum": ["events", "births", "deaths", "holidays", "all"],
                                 "default": "all"
+                            },
+                            "timezone": {
+                                "type": "string",
+                                "description": "IANA timezone of the user, e.g. \"Asia/Tokyo\", so \"today\" is their date (default: server time)"
                             }
                         },
                         "required": []
@@ -366,6 +571,135 @@ async def process_mcp_request(request_data: Dict) -> Dict:
                         },
                         "required": []
                     }
+                },
+                {
+                    "name": "search_historical_facts",
+                    "description": "Search every day of the year for historical facts mentioning people, places or topics (e.g. \"moon landing\", \"Marie Curie\"). Returns the best matches with their dates.",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": {
+                            "query": {
+                                "type": "string",
+                                "description": "Words to search for"
+                            },
+                            "category": {
+                                "type": "string",
+                                "description": "Only return facts of this type (default: all but selected)",
+                                "enum": ["events", "births", "deaths", "holidays", "selected"]
+                            },
+                            "limit": {
+                                "type": "integer",
+                                "description": "Maximum number of results",
+                                "minimum": 1,
+                                "maximum": corpus_store.MAX_SEARCH_RESULTS,
+                                "default": 10
+                            }
+                        },
+                        "required": ["query"]
+                    }
+                },
+                {
+                    "name": "get_facts_for_year",
+                    "description": "Get what happened in a given year (e.g. 1969), across every day of the calendar. Returns events, births and deaths from that year in date order.",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": {
+                            "year": {
+                                "type": "integer",
+                                "description": "Year, negative for BCE (e.g. -44)"
+                            },
+                            "category": {
+                                "type": "string",
+                                "description": "Only return facts of this type (default: all but selected)",
+                                "enum": ["events", "births", "deaths", "holidays", "selected"]
+                            },
+                            "limit": {
+                                "type": "integer",
+                                "description": "Maximum number of results",
+                                "minimum": 1,
+                                "maximum": corpus_store.MAX_YEAR_RESULTS,
+                                "default": 20
+                            }
+                        },
+                        "required": ["year"]
+                    }
+                },
+                {
+                    "name": "query_history",
+                    "description": "Query every day of the year by any combination of facets: type of fact, era, world region, theme and year range (e.g. wars in Europe from 1800 to 1900). Returns matches in calendar order with the total count.",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": {
+                            "category": {
+                                "type": "array",
+                                "items": {"type": "string", "enum": list(records.CATEGORIES)},
+                                "description": "Types of fact to include (default: all but selected)"
+                            },
+                            "era": {
+                                "type": "array",
+                                "items": {"type": "string", "enum": list(facets.ERAS)},
+                                "description": "Eras: ancient (before 1000), medieval (1000-1499), renaissance (1500-1699), modern (1700-1899), contemporary (1900 on)"
+                            },
+                            "region": {
+                                "type": "array",
+                                "items": {"type": "string", "enum": list(facets.REGIONS)},
+                                "description": "World regions the fact mentions"
+                            },
+                            "theme": {
+                                "type": "array",
+                                "items": {"type": "string", "enum": list(facets.THEMES)},
+                                "description": "Themes of the fact"
+                            },
+                            "year_from": {
+                                "type": "integer",
+                                "description": "Earliest year, negative for BCE"
+                            },
+                            "year_to": {
+                                "type": "integer",
+                                "description": "Latest year, negative for BCE"
+                            },
+                            "limit": {
+                                "type": "integer",
+                                "minimum": 1,
+                                "maximum": facets.MAX_QUERY_RESULTS,
+                                "default": 20,
+                                "description": "Maximum number of results"
+                            },
+                            "offset": {
+                                "type": "integer",
+                                "minimum": 0,
+                                "default": 0,
+                                "description": "Number of matches to skip, for paging"
+                            }
+                        },
+                        "required": []
+                    }
+                },
+                {
+                    "name": "get_facts_about_entity",
+                    "description": "Get every historical fact, on any day of the year, that links the Wikipedia page of a person, place or thing (e.g. \"Napoleon\", \"Moon\"). Names are matched ignoring case, accents and underscores. Returns facts in date order.",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": {
+                            "title": {
+                                "type": "string",
+                                "description": "Wikipedia page title or name, e.g. \"Napoleon\" or \"Marie_Curie\""
+                            },
+                            "category": {
+                                "type": "string",
+                                "description": "Only return facts of this type (default: all but selected)",
+                                "enum": ["events", "births", "deaths", "holidays", "selected"]
+                            },
+                            "limit": {
+                                "type": "integer",
+                                "description": "Maximum number of results",
+                                "minimum": 1,
+                                "maximum": corpus_store.MAX_ENTITY_RESULTS,
+                                "default": 20
+                            }
+                        },
+                        "required": ["title"]
+                    }
                 }
             ]
             
@@ -449,7 +783,8 @@ async def process_mcp_request(request_data: Dict) -> Dict:
 async def lifespan(app: FastAPI):
     """Lifespan manager for FastAPI app."""
     logger.info("Starting Historical Facts MCP HTTP Server...")
-    yield
+    async with lifecycle.running():
+        yield
     logger.info("Shutting down Historical Facts MCP HTTP Server...")
 
 
@@ -482,6 +817,18 @@ async def handle_mcp_request(request: Request):
         
         logger.info(f"MCP request: {request_data}")
         
+        # Repeat tools/call for a date: send the cached bytes with this request's id
+        if isinstance(request_data, dict) and request_data.get("method") == "tools/call":
+            params = request_data.get("params") or {}
+            arguments = dict(params.get("arguments") or {})
+            # The timezone header is the default for tools that answer for "today"
+            if request.headers.get(rollover.TIMEZONE_HEADER):
+                arguments.setdefault("timezone", request.headers[rollover.TIMEZONE_HEADER])
+                request_data["params"] = {**params, "arguments": arguments}
+            result = await cached_tool_result(params.get("name"), arguments)
+            if result is not None:
+                return rpc_result_response(request_data.get("id", 1), result)
+        
         # Process the MCP request
         response = await process_mcp_request(request_data)
         
@@ -531,6 +878,10 @@ async def root():
                 "today": "/historical-facts/today", 
                 "date": "/historical-facts/{month}/{day}",
                 "random": "/historical-facts/random",
+                "search": "/historical-facts/search?q={query}",
+                "year": "/historical-facts/year/{year}",
+                "query": "/historical-facts/query?region={region}&theme={theme}&year_from={year}",
+                "entity": "/historical-facts/entity/{title}",
                 "docs": "/docs"
             }
         },
@@ -539,7 +890,11 @@ async def root():
         "tools": [
             "get_historical_facts",
             "get_todays_historical_facts",
-            "get_random_historical_fact"
+            "get_random_historical_fact",
+            "search_historical_facts",
+            "get_facts_for_year",
+            "query_history",
+            "get_facts_about_entity"
         ]
     }
 
@@ -547,24 +902,129 @@ async def root():
 @app.get("/health")
 async def health():
     """Health check endpoint."""
-    return {"status": "ok", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "ok",
+        "timestamp": datetime.now().isoformat(),
+        "upstream": upstream.metrics(),
+        "cache": day_cache.metrics(),
+        "result_cache": result_cache_metrics(),
+        "rollover": rollover.metrics(),
+        "prefetch": prefetch.metrics(),
+        "search": corpus_store.metrics(),
+        "facets": facets.metrics()
+    }
+
+
+def conditional_response(request: Request, payload: dict, data: dict) -> Response:
+    """
+    Answer with 304 if the client already holds this data, else the JSON with an ETag.
+    
+    The ETag covers the day data as served (IDs and every field, so upstream
+    edits to an extract or thumbnail change it), not the per-response timestamp.
+    """
+    etag = records.response_etag(json.dumps(data, ensure_ascii=False).encode("utf-8"), payload["date"])
+    if records.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(payload, headers={"ETag": etag})
 
 
 @app.get("/historical-facts/today")
-async def get_today_facts(event_type: str = "all"):
-    """Get historical facts for today."""
-    today = date.today()
+async def get_today_facts(request: Request, event_type: str = "all", timezone: Optional[str] = None):
+    """Get historical facts for today in the client's timezone (query or X-Timezone header)."""
+    today = rollover.today(timezone or request.headers.get(rollover.TIMEZONE_HEADER))
     data = await fetch_historical_events(today.month, today.day, event_type)
     
-    return {
+    return conditional_response(request, {
         "date": f"{today.month}/{today.day}",
         "data": data,
+        "stale": day_cache.is_stale(data),
+        "timestamp": datetime.now().isoformat()
+    }, data)
+
+
+@app.get("/historical-facts/search")
+async def search_historical_facts(q: str, category: Optional[str] = None, limit: int = 10):
+    """Search every day of the corpus for facts matching free text, best matches first."""
+    try:
+        hits = corpus_store.search(q, category, limit)
+    except LookupError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return {
+        "query": q,
+        "results": [
+            {"date": f"{hit.month}/{hit.day}", "category": hit.item.category,
+             "score": round(hit.score, 3), **hit.item.to_dict()}
+            for hit in hits
+        ],
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.get("/historical-facts/query")
+async def query_history(request: Request, limit: int = 20, offset: int = 0):
+    """Facts from every day matching category, era, region, theme and year_from/year_to (comma-separate alternatives)."""
+    try:
+        filters = facets.filters(dict(request.query_params))
+        result = facets.query(limit=limit, offset=offset, **filters)
+    except LookupError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "filters": {key: value for key, value in filters.items() if value is not None},
+        "total": result.total,
+        "plan": [{"term": term, "matches": matches} for term, matches in result.plan],
+        "results": [
+            {"date": f"{fact.month}/{fact.day}", "category": fact.item.category, **fact.item.to_dict()}
+            for fact in result.items
+        ],
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+# Declared before /{month}/{day}, which would otherwise match /year/{year} and /entity/{title}
+@app.get("/historical-facts/entity/{title:path}")
+async def get_facts_about_entity(title: str, category: Optional[str] = None, limit: int = 20):
+    """Get facts from every day that link a Wikipedia page, matched ignoring case, accents and underscores."""
+    try:
+        facts = corpus_store.facts_about_entity(title, category, limit)
+    except LookupError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return {
+        "title": title,
+        "pages": facts.titles,
+        "total": facts.total,
+        "results": [
+            {"date": f"{fact.month}/{fact.day}", "category": fact.item.category, **fact.item.to_dict()}
+            for fact in facts.items
+        ],
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.get("/historical-facts/year/{year}")
+async def get_facts_for_year(year: int, category: Optional[str] = None, limit: int = 20):
+    """Get facts from one year (negative for BCE) across the whole corpus, in calendar order."""
+    try:
+        facts = corpus_store.facts_for_year(year, category, limit)
+    except LookupError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return {
+        "year": year,
+        "results": [
+            {"date": f"{fact.month}/{fact.day}", "category": fact.item.category, **fact.item.to_dict()}
+            for fact in facts
+        ],
         "timestamp": datetime.now().isoformat()
     }
 
 
 @app.get("/historical-facts/{month}/{day}")
-async def get_historical_facts(month: int, day: int, event_type: str = "all"):
+async def get_historical_facts(request: Request, month: int, day: int, event_type: str = "all"):
     """Get historical facts for a specific date."""
     if month < 1 or month > 12:
         raise HTTPException(status_code=400, detail="Month must be between 1 and 12")
@@ -573,11 +1033,12 @@ async def get_historical_facts(month: int, day: int, event_type: str = "all"):
     
     data = await fetch_historical_events(month, day, event_type)
     
-    return {
+    return conditional_response(request, {
         "date": f"{month}/{day}",
         "data": data,
+        "stale": day_cache.is_stale(data),
         "timestamp": datetime.now().isoformat()
-    }
+    }, data)
 
 
 @app.get("/historical-facts/random")
@@ -593,6 +1054,7 @@ async def get_random_fact(event_type: str = "events"):
     return {
         "date": f"{month}/{day}",
         "data": data,
+        "stale": day_cache.is_stale(data),
         "random": True,
         "timestamp": datetime.now().isoformat()
     }
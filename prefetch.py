@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Speculative prefetch of the dates a client is likely to ask for next
+
+Users step through the calendar a day at a time, and the Apps SDK servers
+recommend dates 1, 7 and 30 days ahead. After a date is served to a client,
+its calendar neighbours and those recommended dates are queued for a
+low-priority background fetch, so the follow-up request is a cache hit.
+
+Prefetching never competes with live requests. A single worker (by default)
+drains a bounded queue at background priority in the upstream scheduler, and
+it only fetches while the upstream rate limiter has more than a reserve of
+spare tokens. When the queue is full, new dates
+are dropped. Days that are already cached and fresh are skipped. Nothing is
+prefetched in corpus mode, where every day is already in memory.
+
+Settings are read from the environment:
+
+    HISTORICAL_FACTS_PREFETCH_CONCURRENCY  prefetch workers (default 1, 0 disables)
+    HISTORICAL_FACTS_PREFETCH_QUEUE        maximum queued dates (default 64)
+    HISTORICAL_FACTS_PREFETCH_RESERVE      fraction of the rate limiter burst left for
+                                           client requests (default 0.5)
+
+License: MIT
+"""
+
+import asyncio
+import logging
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import day_cache
+import upstream
+
+logger = logging.getLogger("historical-facts-prefetch")
+
+# Day before and after, then the related dates the Apps SDK servers recommend
+PREFETCH_OFFSETS = (1, -1, 7, 30)
+RECOMMENDED_OFFSETS = (1, 7, 30)
+
+# Leap year, so Feb 29 is a valid date and every calendar step stays in range
+_CALENDAR_YEAR = 2024
+_CALENDAR_DAYS = 366
+
+
+def shift_date(month: int, day: int, days: int) -> Tuple[int, int]:
+    """(month, day) `days` after a date, wrapping around the year (Feb 29 included)"""
+    start = date(_CALENDAR_YEAR, 1, 1)
+    index = ((date(_CALENDAR_YEAR, month, day) - start).days + days) % _CALENDAR_DAYS
+    shifted = start + timedelta(days=index)
+    return shifted.month, shifted.day
+
+
+def prefetch_dates(month: int, day: int) -> List[Tuple[int, int]]:
+    """Dates to warm after serving (month, day), most likely next request first"""
+    dates = []
+    for offset in PREFETCH_OFFSETS:
+        shifted = shift_date(month, day, offset)
+        if shifted not in dates:
+            dates.append(shifted)
+    return dates
+
+
+class PrefetchQueue:
+    """Low-priority workers that warm dates a client is likely to visit next"""
+
+    def __init__(self, concurrency: int, max_queued: int, reserve: float):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.reserve = reserve
+        self._queue: "Optional[asyncio.Queue[Tuple[int, int]]]" = None
+        self._pending: Set[Tuple[int, int]] = set()
+        self._workers: List[asyncio.Task] = []
+        self.counters = {
+            "scheduled": 0,
+            "prefetched": 0,
+            "already_cached": 0,
+            "dropped": 0,
+            "deferred": 0,
+            "failed": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self) -> None:
+        """Start the prefetch workers on the running event loop"""
+        if self.running or self.concurrency <= 0:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        logger.info(f"Speculative prefetch started ({self.concurrency} workers)")
+
+    async def stop(self) -> None:
+        """Cancel the workers; queued dates are dropped"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._pending.clear()
+
+    def schedule(self, month: int, day: int) -> None:
+        """Queue the dates around (month, day); called when a client is served that date"""
+        if not self.running:
+            return
+        for target in prefetch_dates(month, day):
+            if target in self._pending:
+                continue
+            if len(self._pending) >= self.max_queued:
+                self.counters["dropped"] += 1
+                continue
+            self._pending.add(target)
+            self._queue.put_nowait(target)
+            self.counters["scheduled"] += 1
+
+    async def _wait_for_headroom(self) -> None:
+        # Leave the limiter's reserve to client requests; poll at the refill rate.
+        # The bucket never holds more than burst, so a full bucket is always enough
+        limiter = upstream.limiter
+        threshold = min(limiter.burst, limiter.burst * self.reserve + 1)
+        while limiter.available() < threshold:
+            self.counters["deferred"] += 1
+            await asyncio.sleep(max(0.05, 1.0 / upstream.limiter.rate))
+
+    async def _worker(self) -> None:
+        upstream.set_priority(upstream.BACKGROUND)
+        while True:
+            month, day = await self._queue.get()
+            try:
+                await self._wait_for_headroom()
+                if await day_cache.warm(month, day):
+                    self.counters["prefetched"] += 1
+                else:
+                    self.counters["already_cached"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.counters["failed"] += 1
+                logger.debug(f"Prefetching {month:02d}/{day:02d} failed: {e}")
+            finally:
+                self._pending.discard((month, day))
+                self._queue.task_done()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "queued": len(self._pending),
+            "workers": len(self._workers),
+        }
+
+
+prefetcher = PrefetchQueue(
+    concurrency=upstream.env_int("HISTORICAL_FACTS_PREFETCH_CONCURRENCY", 1),
+    max_queued=upstream.env_int("HISTORICAL_FACTS_PREFETCH_QUEUE", 64),
+    reserve=upstream.env_float("HISTORICAL_FACTS_PREFETCH_RESERVE", 0.5),
+)
+
+day_cache.add_served_hook(prefetcher.schedule)
+
+
+async def start() -> None:
+    """Start prefetching (called from lifecycle.running())"""
+    prefetcher.start()
+
+
+async def stop() -> None:
+    await prefetcher.stop()
+
+
+def metrics() -> Dict[str, Any]:
+    """Prefetch counters for health and metrics endpoints"""
+    return prefetcher.metrics()
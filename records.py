@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Compact in-memory model of On This Day data
+
+Upstream payloads are deeply nested dicts carrying many fields no server
+reads (revisions, namespaces, HTML extracts, ...). A day is converted once, at
+ingest, into slotted DayRecord / ItemRecord / PageRecord objects that keep
+only what the servers use: integer years, interned category names and page
+titles, and tuples instead of lists. Formatters read these records directly;
+to_dict() rebuilds the upstream-shaped subset for JSON responses.
+
+Derived display fields (historical era, summaries, extract previews) and each
+item's stable ID, a hash of (date, category, year, text), are also computed
+once at ingest. Only "years ago", which changes with the calendar, is
+computed when asked for.
+
+Records are shared by every request and are read-only: attributes cannot be
+reassigned, and to_dict() without a field selection returns a cached
+FrozenDict view. Per-request fields such as is_favorite go in an overlay
+(ItemRecord.overlay()) that references the shared data instead of copying it.
+
+License: MIT
+"""
+
+import hashlib
+import sys
+from datetime import date
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+# Feed categories carried by the upstream `all` payload
+CATEGORIES = ("selected", "events", "births", "deaths", "holidays")
+
+SUMMARY_LENGTH = 150
+EXTRACT_PREVIEW_LENGTH = 200
+
+
+def parse_year(value: Any) -> Optional[int]:
+    """Upstream years as int (negative for BCE); None for undated items such as holidays"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        text = value.strip().upper()
+        bce = text.endswith(("BC", "BCE"))
+        digits = text.rstrip("BCE ").strip()
+        if digits.lstrip("-").isdigit():
+            year = int(digits)
+            return -abs(year) if bce else year
+    return None
+
+
+def historical_era(year: Optional[int]) -> Optional[str]:
+    """Historical era of a year (negative years are BCE)"""
+    if year is None:
+        return None
+    if year >= 2000:
+        return "21st Century"
+    elif year >= 1900:
+        return "20th Century"
+    elif year >= 1800:
+        return "19th Century"
+    elif year >= 1700:
+        return "18th Century"
+    elif year >= 1600:
+        return "17th Century"
+    elif year >= 1500:
+        return "16th Century"
+    elif year >= 1000:
+        return "Medieval Period"
+    elif year > 0:
+        return "Ancient Times"
+    else:
+        return "Before Common Era"
+
+
+def format_year(year: Optional[int]) -> Optional[str]:
+    """Display form of a year, e.g. 1969 or 44 BCE"""
+    if year is None:
+        return None
+    return f"{-year} BCE" if year < 0 else str(year)
+
+
+def years_ago(year: int, current_year: Optional[int] = None) -> int:
+    """Years between a year and now; there is no year 0 between 1 BCE and 1 CE"""
+    current_year = current_year or date.today().year
+    return current_year - year - (1 if year < 0 < current_year else 0)
+
+
+def time_ago(year: Optional[int], current_year: Optional[int] = None) -> Optional[str]:
+    """Human-readable distance from now, e.g. 50+ years ago"""
+    if year is None:
+        return None
+    elapsed = years_ago(year, current_year)
+    if elapsed < 10:
+        return f"{elapsed} years ago"
+    elif elapsed < 100:
+        return f"{elapsed // 10 * 10}+ years ago"
+    elif elapsed < 1000:
+        return f"{elapsed // 100} centuries ago"
+    else:
+        return f"{elapsed // 1000}+ millennia ago"
+
+
+def item_id(month: int, day: int, category: str, year: Optional[int], text: str) -> str:
+    """Stable ID of an item: the same event gets the same ID on every call and restart"""
+    key = f"{month:02d}-{day:02d}\0{category}\0{year}\0{text}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def response_etag(body: bytes, *variant: Any) -> str:
+    """
+    Weak ETag for a response from its JSON body (variant: anything else it depends on).
+
+    The body holds the item IDs and every field served (extracts, thumbnails,
+    URLs, ...), so the tag changes whenever upstream changes any of them.
+    """
+    digest = hashlib.blake2b(body, digest_size=12)
+    for part in variant:
+        digest.update(b"\0")
+        digest.update(str(part).encode("utf-8"))
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header value lists etag.
+
+    Uses the weak comparison GET requires: W/ prefixes are ignored and whole
+    tags are compared, and "*" matches any current representation.
+    """
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _truncate(text: Optional[str], length: int) -> str:
+    if not text:
+        return ""
+    return text[:length] + "..." if len(text) > length else text
+
+
+def _intern(value: Any) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else None
+
+
+class FrozenDict(dict):
+    """
+    A dict that cannot be modified, for JSON views shared between requests.
+
+    It is still a dict, so json.dumps() and FastAPI serialize it unchanged, and
+    {**view, ...} or copy() give a plain dict to build on.
+    """
+
+    __slots__ = ()
+
+    def _read_only(self, *args: Any, **kwargs: Any) -> None:
+        raise TypeError("shared record views are read-only; build an overlay instead")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+
+def _freeze(value: Any) -> Any:
+    """Read-only copy of a JSON-shaped value: dicts become FrozenDicts, lists tuples"""
+    if isinstance(value, dict) and not isinstance(value, FrozenDict):
+        return FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class _ReadOnly:
+    """Base for shared records: each slot is assigned once, then fixed"""
+
+    __slots__ = ()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if hasattr(self, name):
+            raise AttributeError(f"{type(self).__name__}.{name} is read-only")
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__}.{name} is read-only")
+
+
+class PageRecord(_ReadOnly):
+    """A Wikipedia page linked from an item"""
+
+    __slots__ = ("title", "displaytitle", "description", "extract", "extract_preview",
+                 "thumbnail", "thumbnail_width", "thumbnail_height", "image",
+                 "url", "mobile_url", "_view")
+
+    def __init__(self, title: str, displaytitle: Optional[str] = None,
+                 description: Optional[str] = None, extract: Optional[str] = None,
+                 thumbnail: Optional[str] = None, thumbnail_width: Optional[int] = None,
+                 thumbnail_height: Optional[int] = None, image: Optional[str] = None,
+                 url: Optional[str] = None, mobile_url: Optional[str] = None):
+        self.title = title
+        self.displaytitle = displaytitle
+        self.description = description
+        self.extract = extract
+        self.extract_preview = _truncate(extract, EXTRACT_PREVIEW_LENGTH)
+        self.thumbnail = thumbnail
+        self.thumbnail_width = thumbnail_width
+        self.thumbnail_height = thumbnail_height
+        self.image = image
+        self.url = url
+        self.mobile_url = mobile_url
+
+    @property
+    def label(self) -> str:
+        """Display title if upstream sent one, otherwise the page title"""
+        return self.displaytitle or self.title
+
+    @classmethod
+    def from_dict(cls, page: Dict[str, Any]) -> "PageRecord":
+        thumbnail = page.get("thumbnail") or {}
+        urls = page.get("content_urls") or {}
+        title = page.get("title") or ""
+        displaytitle = page.get("displaytitle")
+        return cls(
+            title=sys.intern(title),
+            # Usually identical to the title; share the string when it is
+            displaytitle=None if displaytitle in (None, title) else displaytitle,
+            description=page.get("description"),
+            extract=page.get("extract"),
+            thumbnail=thumbnail.get("source"),
+            thumbnail_width=thumbnail.get("width"),
+            thumbnail_height=thumbnail.get("height"),
+            image=(page.get("originalimage") or {}).get("source"),
+            url=(urls.get("desktop") or {}).get("page"),
+            mobile_url=(urls.get("mobile") or {}).get("page"),
+        )
+
+    def to_dict(self, fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        Upstream-shaped dict of the fields kept on the record.
+
+        Without fields this is the shared read-only view, built on first use.
+        """
+        if fields is None:
+            try:
+                return self._view
+            except AttributeError:
+                self._view = _freeze(self._build_dict())
+                return self._view
+        page = self._build_dict()
+        return {field: page[field] for field in fields if field in page}
+
+    def _build_dict(self) -> Dict[str, Any]:
+        page: Dict[str, Any] = {"title": self.title, "displaytitle": self.label}
+        if self.description is not None:
+            page["description"] = self.description
+        if self.extract is not None:
+            page["extract"] = self.extract
+        if self.thumbnail:
+            page["thumbnail"] = {"source": self.thumbnail, "width": self.thumbnail_width,
+                                 "height": self.thumbnail_height}
+        if self.image:
+            page["originalimage"] = {"source": self.image}
+        if self.url or self.mobile_url:
+            page["content_urls"] = {"desktop": {"page": self.url}, "mobile": {"page": self.mobile_url}}
+        return page
+
+
+class ItemRecord(_ReadOnly):
+    """One event, birth, death, holiday or selected item"""
+
+    __slots__ = ("id", "category", "year", "text", "pages", "era", "summary", "_view")
+
+    def __init__(self, id: str, category: str, year: Optional[int], text: str,
+                 pages: Tuple[PageRecord, ...] = ()):
+        self.id = id
+        self.category = category
+        self.year = year
+        self.text = text
+        self.pages = pages
+        self.era = historical_era(year)
+        self.summary = _truncate(text, SUMMARY_LENGTH)
+
+    @property
+    def primary_page(self) -> Optional[PageRecord]:
+        return self.pages[0] if self.pages else None
+
+    @property
+    def year_label(self) -> Optional[str]:
+        return format_year(self.year)
+
+    def time_ago(self, current_year: Optional[int] = None) -> Optional[str]:
+        """How long ago the item happened; computed per call since it depends on today"""
+        return time_ago(self.year, current_year)
+
+    @classmethod
+    def from_dict(cls, month: int, day: int, category: str, item: Dict[str, Any]) -> "ItemRecord":
+        year = parse_year(item.get("year"))
+        text = item.get("text") or ""
+        return cls(
+            id=item_id(month, day, category, year, text),
+            category=sys.intern(category),
+            year=year,
+            text=text,
+            pages=tuple(PageRecord.from_dict(page) for page in item.get("pages") or ()
+                        if isinstance(page, dict)),
+        )
+
+    def to_dict(self, fields: Optional[Sequence[str]] = None,
+                page_fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        Upstream-shaped dict of the item, optionally limited to some fields.
+
+        Without fields or page_fields this is the shared read-only view, built
+        on first use; pages are then a tuple of page views.
+        """
+        if fields is None and page_fields is None:
+            try:
+                return self._view
+            except AttributeError:
+                self._view = _freeze(self._build_dict(None, None))
+                return self._view
+        return self._build_dict(fields, page_fields)
+
+    def overlay(self, **fields: Any) -> Dict[str, Any]:
+        """
+        Per-request dict of the item: the shared view plus request-specific
+        fields (is_favorite, ...). Nested values are shared, not copied.
+        """
+        return {**self.to_dict(), **fields}
+
+    def _build_dict(self, fields: Optional[Sequence[str]],
+                    page_fields: Optional[Sequence[str]]) -> Dict[str, Any]:
+        item: Dict[str, Any] = {}
+        if fields is None or "id" in fields:
+            item["id"] = self.id
+        if fields is None or "text" in fields:
+            item["text"] = self.text
+        if self.year is not None and (fields is None or "year" in fields):
+            item["year"] = self.year
+        if fields is None or "pages" in fields:
+            item["pages"] = [page.to_dict(page_fields) for page in self.pages]
+        return item
+
+
+class DayRecord(_ReadOnly):
+    """Every category of one date, converted once from an `all` payload"""
+
+    __slots__ = ("month", "day", "categories", "stale")
+
+    def __init__(self, month: int, day: int, categories: Mapping[str, Tuple[ItemRecord, ...]],
+                 stale: bool = False):
+        self.month = month
+        self.day = day
+        self.categories = (categories if isinstance(categories, MappingProxyType)
+                           else MappingProxyType(dict(categories)))
+        self.stale = stale
+
+    @classmethod
+    def from_payload(cls, month: int, day: int, payload: Dict[str, Any]) -> "DayRecord":
+        categories = {}
+        for category, items in payload.items():
+            if isinstance(items, list):
+                # Upstream occasionally lists the same item twice; keep the first
+                unique: Dict[str, ItemRecord] = {}
+                for item in items:
+                    if isinstance(item, dict):
+                        record = ItemRecord.from_dict(month, day, category, item)
+                        unique.setdefault(record.id, record)
+                categories[sys.intern(category)] = tuple(unique.values())
+        return cls(month, day, categories)
+
+    def items(self, category: str) -> Tuple[ItemRecord, ...]:
+        """Items of one category (empty if upstream had none)"""
+        return self.categories.get(category, ())
+
+    def marked_stale(self) -> "DayRecord":
+        """The same day flagged as served because upstream failed; items are shared, not copied"""
+        return DayRecord(self.month, self.day, self.categories, stale=True)
+
+    def to_dict(self, categories: Optional[Iterable[str]] = None, limit: Optional[int] = None,
+                fields: Optional[Sequence[str]] = None,
+                page_fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        Build an upstream-shaped payload from the record.
+
+        Args:
+            categories: Categories to include (default: all of CATEGORIES)
+            limit: Maximum items per category
+            fields: Item keys to keep
+            page_fields: Keys to keep on each of an item's pages
+
+        Returns:
+            {category: [item, ...]}; the dict and lists are the caller's, the
+            items are shared read-only views unless fields narrow them
+        """
+        payload = {}
+        for category in (CATEGORIES if categories is None else categories):
+            items = self.items(category)
+            if limit is not None:
+                items = items[:limit]
+            payload[category] = [item.to_dict(fields, page_fields) for item in items]
+        return payload
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Timezone-aware "today" and midnight rollover prewarming
+
+"Today" depends on where the client is: at any instant two (sometimes three)
+calendar dates are current somewhere between UTC-12 and UTC+14. Tools that
+answer for today accept an IANA timezone (a `timezone` tool argument, or the
+X-Timezone header on the HTTP servers) and resolve the date with today().
+
+While a server runs, a background task keeps every live date, plus any date
+about to start somewhere, pinned in the day cache's memory tier and
+prewarmed: the day is fetched and converted to records, and render hooks
+registered by the server (see add_prewarm_hook()) build their cached
+results. Each new date is ready before its first midnight, so the first
+request of the day is not a cache miss.
+
+Settings are read from the environment:
+
+    HISTORICAL_FACTS_TIMEZONE          timezone used when a client sends none
+                                       (default: the server's local time)
+    HISTORICAL_FACTS_PREWARM_LEAD      seconds before a date starts anywhere that it
+                                       is prewarmed (default 900)
+    HISTORICAL_FACTS_PREWARM_INTERVAL  seconds between checks of the live dates (default 600)
+
+License: MIT
+"""
+
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import day_cache
+import upstream
+
+logger = logging.getLogger("historical-facts-rollover")
+
+# HTTP header clients may use instead of the `timezone` tool argument
+TIMEZONE_HEADER = "X-Timezone"
+
+# Civil time spans UTC-12 (Baker Island) to UTC+14 (Line Islands)
+EARLIEST_OFFSET = timedelta(hours=-12)
+LATEST_OFFSET = timedelta(hours=14)
+
+DEFAULT_TIMEZONE = os.environ.get("HISTORICAL_FACTS_TIMEZONE") or None
+PREWARM_LEAD = upstream.env_float("HISTORICAL_FACTS_PREWARM_LEAD", 900.0)
+PREWARM_INTERVAL = upstream.env_float("HISTORICAL_FACTS_PREWARM_INTERVAL", 600.0)
+
+PrewarmHook = Callable[[int, int], Awaitable[Any]]
+
+_hooks: List[PrewarmHook] = []
+_task: Optional[asyncio.Task] = None
+_counters = {
+    "runs": 0,
+    "days_prewarmed": 0,
+    "failures": 0,
+}
+_live: List[Tuple[int, int]] = []
+_last_run: Optional[str] = None
+
+
+@lru_cache(maxsize=256)
+def _zone(name: str) -> Optional[tzinfo]:
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown timezone {name!r}; using the server default")
+        return None
+
+
+def resolve_timezone(name: Optional[str] = None) -> Optional[tzinfo]:
+    """tzinfo for an IANA name (or HISTORICAL_FACTS_TIMEZONE); None means server local time"""
+    name = (name or DEFAULT_TIMEZONE or "").strip()
+    return _zone(name) if name else None
+
+
+def today(tz_name: Optional[str] = None, now: Optional[datetime] = None) -> date:
+    """The current date in a client's timezone (server default if None or unknown)"""
+    tz = resolve_timezone(tz_name)
+    if now is None:
+        return datetime.now(tz).date() if tz else date.today()
+    return now.astimezone(tz).date()
+
+
+def live_dates(now: Optional[datetime] = None, lead: float = 0.0) -> List[Tuple[int, int]]:
+    """
+    (month, day) of every date that is today somewhere on Earth, plus those
+    starting within `lead` seconds, and the server's own today.
+    """
+    now = now or datetime.now(timezone.utc)
+    current = (now + EARLIEST_OFFSET).date()
+    last = (now + LATEST_OFFSET + timedelta(seconds=lead)).date()
+    dates = []
+    while current <= last:
+        dates.append((current.month, current.day))
+        current += timedelta(days=1)
+    local = today(now=now)
+    if (local.month, local.day) not in dates:
+        dates.append((local.month, local.day))
+    return dates
+
+
+def seconds_until_next_date(now: Optional[datetime] = None) -> float:
+    """Seconds until a new date starts somewhere (midnight at UTC+14)"""
+    now = now or datetime.now(timezone.utc)
+    easternmost = now + LATEST_OFFSET
+    midnight = datetime.combine(easternmost.date() + timedelta(days=1), datetime.min.time(),
+                                tzinfo=easternmost.tzinfo)
+    return (midnight - easternmost).total_seconds()
+
+
+def add_prewarm_hook(hook: PrewarmHook) -> None:
+    """Register an async hook(month, day) run for every prewarmed date, e.g. to render results"""
+    _hooks.append(hook)
+
+
+async def prewarm(now: Optional[datetime] = None) -> List[Tuple[int, int]]:
+    """Pin and warm every live date; returns the dates"""
+    global _live, _last_run
+    dates = live_dates(now, lead=PREWARM_LEAD)
+    day_cache.pin_days(dates)
+    for month, day in dates:
+        try:
+            await day_cache.get_record(month, day, background=True)
+            for hook in _hooks:
+                await hook(month, day)
+            _counters["days_prewarmed"] += 1
+        except Exception as e:
+            _counters["failures"] += 1
+            logger.warning(f"Prewarming {month:02d}/{day:02d} failed: {e}")
+    _counters["runs"] += 1
+    _live = dates
+    _last_run = datetime.now(timezone.utc).isoformat()
+    return dates
+
+
+async def _run() -> None:
+    upstream.set_priority(upstream.BACKGROUND)
+    while True:
+        await prewarm()
+        # Wake up `lead` seconds before the next date starts, or just after it
+        # if we are already inside that window
+        until_next = seconds_until_next_date()
+        delay = until_next - PREWARM_LEAD if until_next > PREWARM_LEAD else until_next + 1.0
+        await asyncio.sleep(max(1.0, min(PREWARM_INTERVAL, delay)))
+
+
+async def start() -> None:
+    """Start the prewarm task (called from lifecycle.running())"""
+    global _task
+    if _task is None and PREWARM_INTERVAL > 0:
+        _task = asyncio.create_task(_run())
+        logger.info(f"Rollover prewarm started (lead {PREWARM_LEAD:.0f}s)")
+
+
+async def stop() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
+
+
+def metrics() -> Dict[str, Any]:
+    """Prewarm counters for health and metrics endpoints"""
+    return {
+        **_counters,
+        "live_dates": [f"{month:02d}/{day:02d}" for month, day in _live],
+        "last_run": _last_run,
+        "next_date_in": round(seconds_until_next_date()),
+    }
@@ -15,15 +15,28 @@ setup(
     author_email="romantic_franklin@fern.ai",
     url="https://github.com/oscar-fern-labs/historical-facts-mcp-server",
     packages=find_packages(),
+    py_modules=[
+        "backends",
+        "corpus",
+        "corpus_store",
+        "day_cache",
+        "facets",
+        "historical_facts_server",
+        "lifecycle",
+        "prefetch",
+        "records",
+        "rollover",
+        "upstream",
+    ],
     python_requires=">=3.10",
     install_requires=[
         "mcp>=1.16.0",
-        "httpx>=0.28.0",
+        "httpx[http2]>=0.28.0",
         "python-dateutil>=2.9.0"
     ],
     entry_points={
         "console_scripts": [
-            "historical-facts-mcp=historical_facts_server:main",
+            "historical-facts-mcp=historical_facts_server:cli",
         ],
     },
     classifiers=[
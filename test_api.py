@@ -1,39 +1,43 @@
 #!/usr/bin/env python3
 """
 Test script to verify Wikipedia API functionality
+
+Set HISTORICAL_FACTS_UPSTREAM=fake (or corpus) to check an offline backend
+instead of the live API (see backends.py).
 """
 import asyncio
-import httpx
 import json
 
+import backends
+import upstream
+
 
 async def test_wikipedia_api():
     """Test the Wikipedia On This Day API"""
-    url = "https://api.wikimedia.org/feed/v1/wikipedia/en/onthisday/all/01/15"
+    backend = backends.install()
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
-            
-            print("✅ Wikipedia API is working!")
-            print(f"📅 Events found: {len(data.get('events', []))}")
-            print(f"🎂 Births found: {len(data.get('births', []))}")
-            print(f"⚰️ Deaths found: {len(data.get('deaths', []))}")
-            print(f"🎉 Holidays found: {len(data.get('holidays', []))}")
-            
-            # Show a sample event
-            if data.get('events'):
-                sample_event = data['events'][0]
-                print(f"\n📚 Sample event: {sample_event.get('text', 'No text')}")
-                print(f"🗓️ Year: {sample_event.get('year', 'Unknown')}")
-            
-            return True
-            
+        data = json.loads(await upstream.fetch_onthisday_body("all", 1, 15))
+        
+        print(f"✅ Wikipedia API is working! (backend: {backend})")
+        print(f"📅 Events found: {len(data.get('events', []))}")
+        print(f"🎂 Births found: {len(data.get('births', []))}")
+        print(f"⚰️ Deaths found: {len(data.get('deaths', []))}")
+        print(f"🎉 Holidays found: {len(data.get('holidays', []))}")
+        
+        # Show a sample event
+        if data.get('events'):
+            sample_event = data['events'][0]
+            print(f"\n📚 Sample event: {sample_event.get('text', 'No text')}")
+            print(f"🗓️ Year: {sample_event.get('year', 'Unknown')}")
+        
+        return True
+        
     except Exception as e:
         print(f"❌ Error testing Wikipedia API: {e}")
         return False
+    finally:
+        await upstream.close_client()
 
 
 if __name__ == "__main__":
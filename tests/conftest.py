@@ -0,0 +1,117 @@
+"""
+Shared fixtures: a full-year corpus and corpus store built from the bundled
+fixtures through the fake Wikimedia backend (see backends.py), so tests run
+the same build path as `historical-facts-mcp build-corpus` without the network.
+
+The fake spreads its few fixture days over all 366 dates. One extra day is a
+copy of 01-15 with every year negated, so the corpus also holds BCE items.
+
+fake_upstream gives a test its own small day cache with upstream requests
+answered by the fake backend.
+"""
+
+import asyncio
+import copy
+import os
+
+import httpx
+import pytest
+
+import backends
+import corpus
+import corpus_store
+import day_cache
+import facets
+import upstream
+
+BCE_DAY = "03-15"
+
+
+def _bce_copy(payload: dict) -> dict:
+    payload = copy.deepcopy(payload)
+    for items in payload.values():
+        for item in items:
+            if isinstance(item.get("year"), int):
+                item["year"] = -item["year"]
+    return payload
+
+
+@pytest.fixture(scope="session")
+def fake_days() -> dict:
+    """Fixture payloads keyed "MM-DD", plus the BCE day"""
+    days = dict(backends.PayloadStore.from_path(backends.FIXTURES_DIR).days)
+    days[BCE_DAY] = _bce_copy(days["01-15"])
+    return days
+
+
+@pytest.fixture(scope="session")
+def corpus_file(tmp_path_factory, fake_days) -> str:
+    """A JSON corpus of all 366 days fetched from the fake backend"""
+    path = str(tmp_path_factory.mktemp("corpus") / "historical-facts-corpus.json")
+    fake = backends.FakeWikimedia(backends.PayloadStore(fake_days, fallback=True))
+    limiter = upstream.limiter
+    upstream.limiter = upstream.AdaptiveRateLimiter(max_rate=1e6, burst=1e6)
+    upstream.set_transport(httpx.ASGITransport(app=fake))
+
+    async def build() -> bool:
+        try:
+            return await corpus.build_corpus(path, concurrency=16, retries=1)
+        finally:
+            await upstream.close_client()
+
+    try:
+        assert asyncio.run(build())
+    finally:
+        upstream.set_transport(None)
+        upstream.limiter = limiter
+    return path
+
+
+@pytest.fixture(scope="session")
+def store(corpus_file):
+    """The corpus store for corpus_file, opened by corpus_store and facets"""
+    path = corpus_store.build_index(corpus_file)
+    previous = os.environ.get("HISTORICAL_FACTS_SEARCH_INDEX")
+    os.environ["HISTORICAL_FACTS_SEARCH_INDEX"] = path
+    corpus_store.close()
+    facets.reset()
+    yield path
+    corpus_store.close()
+    facets.reset()
+    if previous is None:
+        del os.environ["HISTORICAL_FACTS_SEARCH_INDEX"]
+    else:
+        os.environ["HISTORICAL_FACTS_SEARCH_INDEX"] = previous
+
+
+class FakeTransport(httpx.AsyncBaseTransport):
+    """The fake backend, counting requests; answers 503 while failing is set"""
+
+    def __init__(self):
+        fake = backends.FakeWikimedia(backends.PayloadStore.from_path(backends.FIXTURES_DIR, fallback=True))
+        self.fake = httpx.ASGITransport(app=fake)
+        self.failing = False
+        self.requests = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.failing:
+            return httpx.Response(503, content=b'{"title":"Scripted error."}')
+        return await self.fake.handle_async_request(request)
+
+
+@pytest.fixture
+def fake_upstream(monkeypatch, tmp_path):
+    """A fresh two-entry cache with a disk tier, and upstream answered by the fake backend"""
+    monkeypatch.delenv("HISTORICAL_FACTS_CORPUS", raising=False)
+    monkeypatch.setenv("HISTORICAL_FACTS_MAX_RETRIES", "0")
+    monkeypatch.setenv("HISTORICAL_FACTS_HEDGE_PERCENTILE", "0")
+    monkeypatch.setattr(upstream, "limiter", upstream.AdaptiveRateLimiter(max_rate=100.0, burst=100.0))
+    monkeypatch.setattr(upstream, "_breakers", {})
+    monkeypatch.setattr(day_cache, "cache", day_cache.TieredCache(
+        max_entries=2, directory=str(tmp_path / "cache"), default_ttl=60.0, max_stale=3600.0))
+    monkeypatch.setattr(day_cache, "refresher", day_cache.RefreshQueue(1))
+    transport = FakeTransport()
+    upstream.set_transport(transport)
+    yield transport
+    upstream.set_transport(None)
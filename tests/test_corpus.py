@@ -0,0 +1,74 @@
+"""Tests for the corpus files (corpus.py)"""
+
+import pytest
+
+import corpus
+import records
+
+
+@pytest.fixture(scope="module")
+def packed(corpus_file, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("binary") / "historical-facts-corpus.bin")
+    with open(path, "wb") as f:
+        f.write(corpus.pack(corpus.read_corpus(corpus_file)))
+    return path
+
+
+def test_corpus_has_every_day(corpus_file):
+    days = corpus.read_corpus(corpus_file)["days"]
+    assert sorted(days) == sorted(corpus.day_key(month, day) for month, day in corpus.all_dates())
+    assert len(days) == 366
+
+
+def test_binary_corpus_round_trip(corpus_file, packed):
+    source = corpus.read_corpus(corpus_file)
+    assert corpus.BinaryCorpus.is_binary(packed)
+    assert not corpus.BinaryCorpus.is_binary(corpus_file)
+
+    # A small decode cache, so the walk over the year also evicts days
+    binary = corpus.BinaryCorpus(packed, decoded_days=8)
+    try:
+        assert len(binary) == 366
+        assert binary.metadata == {key: value for key, value in source.items() if key != "days"}
+        for month, day in corpus.all_dates():
+            expected = records.DayRecord.from_payload(month, day, source["days"][corpus.day_key(month, day)])
+            record = binary.record(month, day)
+            assert (record.month, record.day) == (month, day)
+            assert record.to_dict() == expected.to_dict()
+            assert binary.record(month, day) is record
+    finally:
+        binary.close()
+
+
+def test_read_corpus_accepts_binary(corpus_file, packed):
+    source = corpus.read_corpus(corpus_file)
+    unpacked = corpus.read_corpus(packed)
+    assert unpacked["days"].keys() == source["days"].keys()
+    for key, payload in unpacked["days"].items():
+        month, day = (int(part) for part in key.split("-"))
+        assert records.DayRecord.from_payload(month, day, payload).to_dict() == \
+            records.DayRecord.from_payload(month, day, source["days"][key]).to_dict()
+    # Packing the unpacked corpus gives the same file
+    with open(packed, "rb") as f:
+        assert corpus.pack(unpacked) == f.read()
+
+
+def test_missing_day_is_absent(corpus_file, tmp_path):
+    source = corpus.read_corpus(corpus_file)
+    del source["days"]["02-29"]
+    path = tmp_path / "partial.bin"
+    path.write_bytes(corpus.pack(source))
+    binary = corpus.BinaryCorpus(str(path))
+    try:
+        assert len(binary) == 365
+        assert binary.record(2, 29) is None
+        assert binary.record(3, 1) is not None
+    finally:
+        binary.close()
+
+
+def test_rejects_other_files(corpus_file, tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(corpus.BINARY_MAGIC + b"\xff" * 32)
+    with pytest.raises(ValueError):
+        corpus.BinaryCorpus(str(path))
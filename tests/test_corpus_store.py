@@ -0,0 +1,144 @@
+"""Tests for the SQLite corpus store (corpus_store.py)"""
+
+import pytest
+
+import corpus
+import corpus_store
+import records
+
+
+def _keys(hits):
+    return [(hit.month, hit.day, hit.item.id, round(hit.score, 6)) for hit in hits]
+
+
+def test_search_requires_every_word(store):
+    hits = corpus_store.search("Napoleon crowned", limit=50)
+    assert hits
+    for hit in hits:
+        text = hit.item.text.lower()
+        assert "napoleon" in text and "crowned" in text
+    assert [hit.score for hit in hits] == sorted((hit.score for hit in hits), reverse=True)
+
+
+def test_search_falls_back_to_any_word(store):
+    # No item mentions both, so every word is tried on its own
+    hits = corpus_store.search("Mercator Garibaldi", limit=50)
+    assert hits
+    assert all("mercator" in hit.item.text.lower() or "garibaldi" in hit.item.text.lower() for hit in hits)
+    assert _keys(corpus_store.search("Mercator zzyzx", limit=20)) == _keys(corpus_store.search("Mercator", limit=20))
+
+
+def test_search_category_filter(store):
+    hits = corpus_store.search("Napoleon", category="selected", limit=20)
+    assert hits and all(hit.item.category == "selected" for hit in hits)
+    # Selected items are left out unless asked for
+    assert all(hit.item.category != "selected" for hit in corpus_store.search("Napoleon", limit=50))
+
+
+def test_search_limit_is_capped(store):
+    assert len(corpus_store.search("the", limit=10_000)) == corpus_store.MAX_SEARCH_RESULTS
+
+
+@pytest.mark.parametrize("query, words", [
+    ('"Austerlitz', "Austerlitz"),
+    ('Austerlitz"', "Austerlitz"),
+    ('"Battle of" Austerlitz', "Battle of Austerlitz"),
+    ("NEAR(Battle Austerlitz)", "near Battle Austerlitz"),
+    ("Napoleon AND", "Napoleon and"),
+    ("-Napoleon", "Napoleon"),
+    ("text:Napoleon", "text Napoleon"),
+    ("Napoleon^", "Napoleon"),
+])
+def test_search_treats_fts_syntax_as_words(store, query, words):
+    hits = corpus_store.search(query, limit=20)
+    assert hits
+    assert _keys(hits) == _keys(corpus_store.search(words, limit=20))
+
+
+@pytest.mark.parametrize("query", ["", "*", '""', "()", "NEAR(", "^-:"])
+def test_search_without_words_matches_nothing(store, query):
+    assert corpus_store.search(query) == []
+
+
+def test_prefix_wildcard_is_not_expanded(store):
+    assert corpus_store.match_expression("Austerl*") == '"austerl"'
+    assert corpus_store.search("Austerl*") == []
+
+
+def _dated_items(corpus_file):
+    source = corpus.read_corpus(corpus_file)["days"]
+    for month, day in corpus.all_dates():
+        record = records.DayRecord.from_payload(month, day, source[corpus.day_key(month, day)])
+        for category in records.CATEGORIES:
+            for item in record.items(category):
+                yield month, day, item
+
+
+@pytest.mark.parametrize("year", [1805, 1776, -69, -1919, 1])
+def test_facts_for_year_matches_the_corpus(store, corpus_file, year):
+    expected = [(month, day, item.id) for month, day, item in _dated_items(corpus_file)
+                if item.year == year and item.category != "selected"]
+    facts = corpus_store.facts_for_year(year, limit=corpus_store.MAX_YEAR_RESULTS)
+    keys = [(fact.month, fact.day, fact.item.id) for fact in facts]
+    # The first matches in calendar order; the order within a day is not specified
+    assert [key[:2] for key in keys] == [key[:2] for key in expected][:corpus_store.MAX_YEAR_RESULTS]
+    assert set(keys) <= set(expected)
+    assert all(fact.item.year == year for fact in facts)
+
+
+def test_facts_for_year_category(store):
+    facts = corpus_store.facts_for_year(1804, category="selected", limit=50)
+    assert facts and all(fact.item.category == "selected" for fact in facts)
+
+
+def test_missing_store_raises_lookup_error(monkeypatch, tmp_path):
+    monkeypatch.setenv("HISTORICAL_FACTS_SEARCH_INDEX", str(tmp_path / "missing.sqlite"))
+    corpus_store.close()
+    try:
+        with pytest.raises(LookupError):
+            corpus_store.search("Napoleon")
+    finally:
+        corpus_store.close()
+
+
+@pytest.mark.parametrize("name, key", [
+    ("Napoleon", "napoleon"),
+    ("NAPOLÉON", "napoleon"),
+    ("Napoleon_III", "napoleon iii"),
+    ("<i>Napoléon III</i>", "napoleon iii"),
+    ("Napoleon_(emperor)", "napoleon emperor"),
+    ("Molière", "moliere"),
+    ("Straße", "strasse"),
+    ("Ｎａｐｏｌｅｏｎ", "napoleon"),
+    ("  Rosa   Luxemburg ", "rosa luxemburg"),
+    ("Martin_Luther_King_Jr.", "martin luther king jr"),
+    ("AC/DC", "ac dc"),
+    ("Tom &amp; Jerry", "tom jerry"),
+    ("Alice&#39;s_Adventures_in_Wonderland", "alice s adventures in wonderland"),
+    ("", ""),
+    ("()", ""),
+])
+def test_entity_key(name, key):
+    assert corpus_store.entity_key(name) == key
+
+
+def test_entity_keys_add_disambiguation_aliases():
+    assert corpus_store.entity_keys("Mercury_(planet)") == {("mercury planet", 0), ("mercury", 1)}
+    assert corpus_store.entity_keys("Napoleon_III", "<i>Napoléon III</i>") == {("napoleon iii", 0)}
+    # A title without disambiguation is never also listed as an alias of itself
+    assert corpus_store.entity_keys("Napoleon") == {("napoleon", 0)}
+    assert corpus_store.entity_keys("") == set()
+
+
+@pytest.mark.parametrize("name", ["Napoleon", "napoleon", "NAPOLÉON", "Napoleon_(emperor)", " napoleon "])
+def test_facts_about_entity_normalizes_names(store, name):
+    facts = corpus_store.facts_about_entity(name, limit=5)
+    assert facts.titles == ["Napoleon"]
+    assert facts.total and len(facts.items) == 5
+    assert all(any(page.title == "Napoleon" for page in fact.item.pages) for fact in facts.items)
+
+
+def test_facts_about_entity_prefers_exact_titles(store):
+    assert corpus_store.facts_about_entity("Napoleon III").titles == ["Napoleon III"]
+    assert corpus_store.facts_about_entity("Independence Day").titles == ["Independence Day (United States)"]
+    assert corpus_store.facts_about_entity("Nobody in particular") == corpus_store.EntityFacts([], 0, [])
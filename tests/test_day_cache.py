@@ -0,0 +1,240 @@
+"""Tests for the tiered day cache (day_cache.py) against the fake backend"""
+
+import asyncio
+import os
+
+import httpx
+import pytest
+
+import day_cache
+import upstream
+
+
+def run(coro):
+    async def go():
+        try:
+            return await coro
+        finally:
+            await day_cache.stop_refresher()
+            await upstream.close_client()
+
+    return asyncio.run(go())
+
+
+def expire(month, day):
+    """Move a cached day past its TTL, within max_stale"""
+    entry = day_cache.cache._memory[day_cache.cache_key(month, day)]
+    entry.expires_at -= 120.0
+
+
+# ---------------------------------------------------------------------------
+# Stale flag
+# ---------------------------------------------------------------------------
+
+def test_expired_entry_refreshed_inline_is_not_stale(fake_upstream):
+    async def go():
+        await day_cache.get_record(1, 15)
+        expire(1, 15)
+        return await day_cache.get_record(1, 15)
+
+    assert not run(go()).stale
+    assert fake_upstream.requests == 2
+
+
+def test_expired_entry_with_refresh_queued_is_not_stale(fake_upstream):
+    async def go():
+        await day_cache.get_record(1, 15)
+        expire(1, 15)
+        await day_cache.start_refresher()
+        record = await day_cache.get_record(1, 15)
+        # Served at once, before the queued refresh has run
+        assert fake_upstream.requests == 1
+        await day_cache.refresher._queue.join()
+        return record
+
+    assert not run(go()).stale
+    assert fake_upstream.requests == 2
+    assert day_cache.refresher.metrics()["refreshed"] == 1
+
+
+def test_failed_refresh_marks_the_record_stale(fake_upstream):
+    async def go():
+        await day_cache.get_record(1, 15)
+        expire(1, 15)
+        fake_upstream.failing = True
+        inline = await day_cache.get_record(1, 15)
+        await day_cache.start_refresher()
+        queued = await day_cache.get_record(1, 15)
+        await day_cache.refresher._queue.join()
+        after_failure = await day_cache.get_record(1, 15)
+        await day_cache.refresher._queue.join()
+        fake_upstream.failing = False
+        await day_cache.get_record(1, 15)
+        await day_cache.refresher._queue.join()
+        recovered = await day_cache.get_record(1, 15)
+        return inline, queued, after_failure, recovered
+
+    inline, queued, after_failure, recovered = run(go())
+    assert inline.stale
+    # Not known to be failing until its background refresh fails
+    assert not queued.stale
+    assert after_failure.stale
+    assert not recovered.stale
+
+
+def test_last_known_good_copy_is_stale(fake_upstream):
+    async def go():
+        await day_cache.get_record(1, 15)
+        key = day_cache.cache_key(1, 15)
+        # Too old to serve while refreshing; only a fallback may use it
+        await day_cache.cache.put(key, day_cache.cache._memory[key].body, ttl=-7200.0)
+        fake_upstream.failing = True
+        return await day_cache.get_day(1, 15)
+
+    data = run(go())
+    assert day_cache.is_stale(data)
+    assert day_cache.cache.counters["fallbacks"] == 1
+
+
+# ---------------------------------------------------------------------------
+# Tiers and expiry
+# ---------------------------------------------------------------------------
+
+def test_evicted_day_is_read_back_from_disk(fake_upstream):
+    async def go():
+        first = await day_cache.get_record(1, 1)
+        await day_cache.get_record(1, 2)
+        await day_cache.get_record(1, 3)
+        assert day_cache.cache_key(1, 1) not in day_cache.cache._memory
+        return first, await day_cache.get_record(1, 1)
+
+    first, again = run(go())
+    assert fake_upstream.requests == 3
+    assert again.to_dict() == first.to_dict()
+    counters = day_cache.cache.counters
+    assert counters["evictions"] == 2
+    assert counters["disk_hits"] == 1
+    assert counters["misses"] == 3
+
+
+def test_disk_tier_survives_a_restart(fake_upstream, monkeypatch):
+    run(day_cache.get_record(1, 15))
+    restarted = day_cache.TieredCache(max_entries=2, directory=day_cache.cache.directory,
+                                      default_ttl=60.0, max_stale=3600.0)
+    monkeypatch.setattr(day_cache, "cache", restarted)
+    assert run(day_cache.get_record(1, 15)).items("events")
+    assert fake_upstream.requests == 1
+    assert restarted.counters["disk_hits"] == 1
+
+
+def test_entries_expire_after_max_stale(fake_upstream):
+    key = day_cache.cache_key(1, 15)
+
+    async def go():
+        await day_cache.get_record(1, 15)
+        body = day_cache.cache._memory[key].body
+        # Within max_stale: served, counted as a stale hit
+        await day_cache.cache.put(key, body, ttl=-10.0)
+        assert await day_cache.cache.get(key) is not None
+        # Past it: a miss, and the next lookup fetches again
+        await day_cache.cache.put(key, body, ttl=-7200.0)
+        assert await day_cache.cache.get(key) is None
+        await day_cache.get_record(1, 15)
+
+    run(go())
+    counters = day_cache.cache.counters
+    assert counters["stale_hits"] == 1
+    assert counters["expired"] == 2
+    assert fake_upstream.requests == 2
+    assert day_cache.cache._memory[key].is_fresh()
+
+
+class BodyTransport(httpx.AsyncBaseTransport):
+    """Answers every request with a fixed 200 body"""
+
+    def __init__(self, body):
+        self.body = body
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=self.body)
+
+
+@pytest.mark.parametrize("body", [b'{"events": [{"text": "Trunc', b"[1, 2, 3]", b"<html>Bad gateway</html>", b""])
+def test_undecodable_body_is_not_stored(fake_upstream, body):
+    upstream.set_transport(BodyTransport(body))
+    with pytest.raises(httpx.DecodingError):
+        run(day_cache.get_record(1, 15))
+    assert day_cache.cache.counters["rejected"] == 1
+    assert day_cache.cache.counters["stores"] == 0
+    assert not day_cache.cache._memory
+    assert not os.path.exists(day_cache.cache.directory) or not os.listdir(day_cache.cache.directory)
+
+
+def test_undecodable_refresh_keeps_the_cached_copy(fake_upstream):
+    key = day_cache.cache_key(1, 15)
+
+    async def go():
+        good = await day_cache.get_record(1, 15)
+        expire(1, 15)
+        body = day_cache.cache._memory[key].body
+        upstream.set_transport(BodyTransport(b'{"events": ['))
+        await upstream.close_client()
+        served = await day_cache.get_record(1, 15)
+        return good, served, body
+
+    good, served, body = run(go())
+    assert served.stale
+    assert served.to_dict() == good.to_dict()
+    assert day_cache.cache.counters["rejected"] == 1
+    assert day_cache.cache._read_disk(key).body == body
+
+
+# ---------------------------------------------------------------------------
+# Conditional revalidation
+# ---------------------------------------------------------------------------
+
+def test_not_modified_renews_without_decoding(fake_upstream):
+    key = day_cache.cache_key(1, 15)
+
+    async def go():
+        first = await day_cache.get_record(1, 15)
+        entry = day_cache.cache._memory[key]
+        assert entry.etag
+        expire(1, 15)
+
+        def no_decoding(*args):
+            raise AssertionError("a 304 must not decode the body again")
+
+        with pytest.MonkeyPatch.context() as patch:
+            patch.setattr(day_cache.records.DayRecord, "from_payload", no_decoding)
+            patch.setattr(day_cache.json, "loads", no_decoding)
+            renewed = await day_cache.get_record(1, 15)
+        return first, entry, renewed
+
+    first, entry, renewed = run(go())
+    assert renewed is first
+    assert not renewed.stale
+    assert fake_upstream.requests == 2
+    counters = day_cache.cache.counters
+    assert counters["revalidated"] == 1
+    assert counters["bytes_saved"] == len(entry.body)
+    renewed_entry = day_cache.cache._memory[key]
+    assert renewed_entry.is_fresh()
+    assert renewed_entry.body is entry.body and renewed_entry.etag == entry.etag
+    # The disk tier has the new expiry too
+    assert day_cache.cache._read_disk(key).expires_at == renewed_entry.expires_at
+
+
+def test_changed_day_is_downloaded_again(fake_upstream):
+    key = day_cache.cache_key(1, 15)
+
+    async def go():
+        await day_cache.get_record(1, 15)
+        entry = day_cache.cache._memory[key]
+        # A validator upstream no longer knows: the full body comes back
+        await day_cache.cache.put(key, entry.body, ttl=-10.0, etag='"outdated"')
+        return await day_cache.get_record(1, 15)
+
+    assert run(go()).items("events")
+    assert day_cache.cache.counters["revalidated"] == 0
+    assert day_cache.cache._memory[key].etag != '"outdated"'
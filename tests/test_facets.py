@@ -0,0 +1,151 @@
+"""Tests for the bitmap facet index (facets.py), checked against a brute-force scan of the corpus"""
+
+import asyncio
+import random
+
+import pytest
+
+import corpus
+import corpus_store
+import facets
+import records
+
+
+@pytest.fixture(scope="module")
+def items(store, corpus_file):
+    """(month, day, item, regions, themes) of every corpus item, in calendar order"""
+    source = corpus.read_corpus(corpus_file)["days"]
+    scanned = []
+    for month, day in corpus.all_dates():
+        record = records.DayRecord.from_payload(month, day, source[corpus.day_key(month, day)])
+        for category in records.CATEGORIES:
+            for item in record.items(category):
+                scanned.append((month, day, item, *facets.classify_item(item)))
+    return scanned
+
+
+def brute_force(items, category=None, era=None, region=None, theme=None, year_from=None, year_to=None):
+    matches = []
+    for month, day, item, regions, themes in items:
+        if category is None and item.category == "selected":
+            continue
+        if category is not None and item.category not in category:
+            continue
+        if era is not None and facets.era_of(item.year) not in era:
+            continue
+        if region is not None and not set(region) & set(facets.names(regions, facets.REGIONS)):
+            continue
+        if theme is not None and not set(theme) & set(facets.names(themes, facets.THEMES)):
+            continue
+        if (year_from is not None or year_to is not None) and item.year is None:
+            continue
+        if year_from is not None and item.year < year_from:
+            continue
+        if year_to is not None and item.year > year_to:
+            continue
+        matches.append((month, day, item.id))
+    return matches
+
+
+def _keys(result):
+    return [(fact.month, fact.day, fact.item.id) for fact in result.items]
+
+
+def test_corpus_has_bce_items(items):
+    assert any(item.year is not None and item.year < 0 for _, _, item, _, _ in items)
+    assert facets.index().min_year < 0
+
+
+def test_year_ranges_match_brute_force(items):
+    rng = random.Random(24)
+    years = sorted({item.year for _, _, item, _, _ in items if item.year is not None})
+    # Stored years and their neighbours exercise the slice boundaries
+    edges = [edge for year in years for edge in (year - 1, year, year + 1)] + [-1, 0, 1]
+
+    def bound():
+        roll = rng.random()
+        if roll < 0.1:
+            return None
+        return rng.choice(edges) if roll < 0.6 else rng.randint(-2100, 2100)
+
+    for _ in range(500):
+        year_from, year_to = bound(), bound()
+        expected = brute_force(items, year_from=year_from, year_to=year_to)
+        result = facets.query(year_from=year_from, year_to=year_to, limit=facets.MAX_QUERY_RESULTS)
+        assert result.total == len(expected), (year_from, year_to)
+        assert _keys(result) == expected[:facets.MAX_QUERY_RESULTS], (year_from, year_to)
+
+
+@pytest.mark.parametrize("year_from, year_to", [
+    (-1919, -1919), (-2000, -1), (-69, 69), (None, -1), (-1, None), (69, 69), (0, 0), (5, -5),
+])
+def test_bce_year_ranges(items, year_from, year_to):
+    result = facets.query(year_from=year_from, year_to=year_to, limit=1)
+    assert result.total == len(brute_force(items, year_from=year_from, year_to=year_to))
+
+
+def test_combinations_match_brute_force(items):
+    rng = random.Random(2024)
+
+    def pick(values):
+        return None if rng.random() < 0.5 else rng.sample(values, rng.randint(1, 2))
+
+    for _ in range(300):
+        filters = {
+            "category": pick(records.CATEGORIES),
+            "era": pick(facets.ERAS),
+            "region": pick(facets.REGIONS),
+            "theme": pick(facets.THEMES),
+            "year_from": rng.choice([None, -2000, -69, 0, 1500, 1800]),
+            "year_to": rng.choice([None, -1, 69, 1805, 1950]),
+        }
+        expected = brute_force(items, **filters)
+        result = facets.query(**filters, limit=10)
+        assert result.total == len(expected), filters
+        assert _keys(result) == expected[:10], filters
+
+
+def test_pages_cover_every_match(items):
+    expected = brute_force(items, category=("events",), year_from=-2000, year_to=1900)
+    seen = []
+    for offset in range(0, len(expected) + 7, 7):
+        seen.extend(_keys(facets.query(category="events", year_from=-2000, year_to=1900,
+                                       limit=7, offset=offset)))
+    assert seen == expected
+
+
+def test_era_of_bce_years():
+    assert facets.era_of(-3000) == "ancient"
+    assert facets.era_of(-1) == "ancient"
+    assert facets.era_of(999) == "ancient"
+    assert facets.era_of(1000) == "medieval"
+    assert facets.era_of(None) is None
+
+
+def test_era_facet_agrees_with_the_item_era(items):
+    # The Apps SDK servers show item.era; the era filter must select the same items
+    for _, _, item, _, _ in items:
+        if item.year is not None:
+            assert facets._ERA_OF_LABEL[item.era] == facets.era_of(item.year)
+            assert facets.matches(item, era=facets.era_of(item.year))
+    assert set(facets._ERA_OF_LABEL.values()) == set(facets.ERAS)
+
+
+def test_start_builds_the_bitmaps(store, monkeypatch):
+    facets.reset()
+    asyncio.run(facets.start())
+    assert facets._index is not None
+    # Without a store the server still starts
+    monkeypatch.setattr(facets, "_index", None)
+    monkeypatch.setenv("HISTORICAL_FACTS_SEARCH_INDEX", "/nonexistent/historical-facts.sqlite")
+    corpus_store.close()
+    try:
+        asyncio.run(facets.start())
+        assert facets._index is None
+    finally:
+        corpus_store.close()
+
+
+def test_unknown_value_is_rejected(store):
+    with pytest.raises(ValueError):
+        facets.query(region="atlantis")
@@ -0,0 +1,118 @@
+"""Tests for the pre-serialized tools/call result cache (mcp_http_server.py)"""
+
+import asyncio
+import json
+from collections import OrderedDict
+
+import httpx
+import pytest
+
+import day_cache
+import mcp_http_server
+import upstream
+
+
+@pytest.fixture
+def results(monkeypatch, fake_upstream):
+    """An empty result cache; returns its counters"""
+    monkeypatch.setattr(mcp_http_server, "_result_cache", OrderedDict())
+    monkeypatch.setattr(mcp_http_server, "_result_counters", {"hits": 0, "misses": 0})
+    return mcp_http_server._result_counters
+
+
+def call(arguments, request_id=1, name="get_historical_facts"):
+    return {"jsonrpc": "2.0", "id": request_id, "method": "tools/call",
+            "params": {"name": name, "arguments": arguments}}
+
+
+def post(*messages, between=None):
+    """POST each message to /mcp in one event loop; between() runs after the first"""
+    async def go():
+        transport = httpx.ASGITransport(app=mcp_http_server.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                responses = []
+                for message in messages:
+                    responses.append(await client.post("/mcp", json=message))
+                    if between is not None and len(responses) == 1:
+                        await between()
+                return responses
+        finally:
+            await upstream.close_client()
+
+    return asyncio.run(go())
+
+
+def test_repeat_call_is_served_from_the_cache(results):
+    first, second = post(call({"month": 1, "day": 15}, 1), call({"month": 1, "day": 15}, 2))
+    assert results == {"hits": 1, "misses": 1}
+    assert first.status_code == second.status_code == 200
+    assert first.json()["result"] == second.json()["result"]
+    assert "Historical Facts for 1/15" in first.json()["result"]["content"][0]["text"]
+
+
+@pytest.mark.parametrize("request_id", [7, "abc-\"quoted\"", None, {"nested": [1, 2]}])
+def test_cached_result_carries_the_request_id(results, request_id):
+    _, response = post(call({"month": 1, "day": 15}, 1), call({"month": 1, "day": 15}, request_id))
+    assert results["hits"] == 1
+    body = response.json()
+    assert body["jsonrpc"] == "2.0"
+    assert body["id"] == request_id
+
+
+def test_replaced_record_is_rendered_again(results):
+    key = day_cache.cache_key(1, 15)
+
+    async def replace():
+        payload = json.loads(day_cache.cache._memory[key].body)
+        payload["events"][0]["text"] = "A replacement event."
+        await day_cache.cache.put(key, json.dumps(payload).encode("utf-8"))
+
+    first, second = post(call({"month": 1, "day": 15}), call({"month": 1, "day": 15}), between=replace)
+    assert results == {"hits": 0, "misses": 2}
+    assert "A replacement event." not in first.text
+    assert "A replacement event." in second.json()["result"]["content"][0]["text"]
+
+
+@pytest.mark.parametrize("arguments", [
+    {"month": 1, "day": 15, "event_type": ["events"]},
+    {"month": 1, "day": 15, "event_type": {"events": True}},
+    {"month": 1, "day": 15, "event_type": "wars"},
+    {"month": 2, "day": 30},
+    {"month": 13, "day": 1},
+    {"month": "1", "day": 15},
+])
+def test_uncacheable_call_falls_through(results, arguments):
+    response, = post(call(arguments, 5))
+    assert response.status_code == 200
+    body = response.json()
+    assert body["id"] == 5
+    assert "result" in body or "error" in body
+    assert results == {"hits": 0, "misses": 0}
+    assert not mcp_http_server._result_cache
+
+
+def test_uncacheable_timezone_falls_through(results):
+    response, = post(call({"timezone": ["Europe/Paris"]}, 5, name="get_todays_historical_facts"))
+    assert response.status_code == 200
+    assert response.json()["id"] == 5
+    assert results == {"hits": 0, "misses": 0}
+
+
+def test_prewarming_does_not_count_as_a_visit(monkeypatch, results):
+    served = []
+    monkeypatch.setattr(day_cache, "_served_hooks", [lambda month, day: served.append((month, day))])
+
+    async def go():
+        try:
+            await mcp_http_server.prewarm_results(1, 15)
+        finally:
+            await upstream.close_client()
+
+    asyncio.run(go())
+    assert served == []
+    assert len(mcp_http_server._result_cache) == len(mcp_http_server.CACHEABLE_TOOLS)
+    # A client call is a visit, and is answered from the prewarmed result
+    post(call({"month": 1, "day": 15}))
+    assert served == [(1, 15)]
+    assert results["hits"] == 1
@@ -0,0 +1,36 @@
+"""Tests for speculative prefetch (prefetch.py)"""
+
+import asyncio
+
+import pytest
+
+import prefetch
+import upstream
+
+
+@pytest.mark.parametrize("burst, reserve", [(10.0, 0.5), (1.0, 0.5), (10.0, 0.9), (10.0, 1.0), (0.5, 0.5)])
+def test_full_bucket_is_always_enough_headroom(monkeypatch, burst, reserve):
+    monkeypatch.setattr(upstream, "limiter", upstream.AdaptiveRateLimiter(max_rate=100.0, burst=burst))
+    queue = prefetch.PrefetchQueue(concurrency=1, max_queued=8, reserve=reserve)
+    asyncio.run(asyncio.wait_for(queue._wait_for_headroom(), 1.0))
+    assert queue.counters["deferred"] == 0
+
+
+def test_prefetch_waits_while_the_reserve_is_in_use(monkeypatch):
+    limiter = upstream.AdaptiveRateLimiter(max_rate=20.0, burst=10.0)
+    monkeypatch.setattr(upstream, "limiter", limiter)
+    queue = prefetch.PrefetchQueue(concurrency=1, max_queued=8, reserve=0.5)
+    limiter._tokens = 0.0
+    # Six tokens refill in about 0.3 s
+    asyncio.run(asyncio.wait_for(queue._wait_for_headroom(), 2.0))
+    assert queue.counters["deferred"] > 0
+    assert limiter.available() >= 6.0
+
+
+@pytest.mark.parametrize("month, day, dates", [
+    (1, 15, [(1, 16), (1, 14), (1, 22), (2, 14)]),
+    (2, 28, [(2, 29), (2, 27), (3, 6), (3, 29)]),
+    (12, 31, [(1, 1), (12, 30), (1, 7), (1, 30)]),
+])
+def test_prefetch_dates(month, day, dates):
+    assert prefetch.prefetch_dates(month, day) == dates
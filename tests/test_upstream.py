@@ -0,0 +1,494 @@
+"""Tests for the upstream client's admission control and retries (upstream.py)"""
+
+import asyncio
+import gc
+import json
+import time
+from email.utils import formatdate
+
+import httpx
+import pytest
+
+import backends
+import upstream
+
+
+class ScriptedTransport(httpx.AsyncBaseTransport):
+    """Answers with scripted (status, headers) responses first, then from the fake backend"""
+
+    def __init__(self, script=()):
+        fake = backends.FakeWikimedia(backends.PayloadStore.from_path(backends.FIXTURES_DIR, fallback=True))
+        self.fake = httpx.ASGITransport(app=fake)
+        self.script = list(script)
+        self.requests = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.script:
+            status, headers = self.script.pop(0)
+            return httpx.Response(status, headers=headers, content=b'{"title":"Scripted error."}')
+        return await self.fake.handle_async_request(request)
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    """A fresh limiter and breakers per test, no hedging, and the transport reset afterwards"""
+    monkeypatch.setattr(upstream, "limiter", upstream.AdaptiveRateLimiter(max_rate=100.0, burst=100.0))
+    monkeypatch.setattr(upstream, "_breakers", {})
+    monkeypatch.setenv("HISTORICAL_FACTS_HEDGE_PERCENTILE", "0")
+    yield
+    upstream.set_transport(None)
+
+
+def fetch(transport, month=1, day=15):
+    upstream.set_transport(transport)
+
+    async def go():
+        try:
+            return await upstream.fetch_onthisday("all", month, day)
+        finally:
+            await upstream.close_client()
+
+    return asyncio.run(go())
+
+
+# ---------------------------------------------------------------------------
+# Rate limiter and Retry-After
+# ---------------------------------------------------------------------------
+
+@pytest.mark.parametrize("value, seconds", [
+    ("3", 3.0),
+    ("0.5", 0.5),
+    ("-5", 0.0),
+    ("soon", None),
+    ("", None),
+])
+def test_retry_after_seconds(value, seconds):
+    response = httpx.Response(429, headers={"Retry-After": value} if value else {})
+    assert upstream.retry_after_seconds(response) == seconds
+
+
+def test_retry_after_http_date():
+    response = httpx.Response(429, headers={"Retry-After": formatdate(time.time() + 60, usegmt=True)})
+    assert 55 <= upstream.retry_after_seconds(response) <= 60
+    response = httpx.Response(429, headers={"Retry-After": formatdate(time.time() - 60, usegmt=True)})
+    assert upstream.retry_after_seconds(response) == 0.0
+
+
+def test_throttling_halves_the_rate_and_blocks_every_caller():
+    limiter = upstream.AdaptiveRateLimiter(max_rate=8.0, burst=10.0, min_rate=1.0)
+    limiter.on_throttled(30.0)
+    assert limiter.rate == 4.0
+    assert limiter.available() == 0.0
+    assert not limiter.try_acquire()
+    assert limiter.metrics()["blocked_for"] > 29
+    for _ in range(5):
+        limiter.on_throttled(None)
+    assert limiter.rate == 1.0
+    limiter.on_success()
+    assert limiter.rate > 1.0
+
+
+def test_acquire_gives_up_when_retry_after_outlasts_the_deadline():
+    limiter = upstream.AdaptiveRateLimiter(max_rate=100.0, burst=10.0)
+    limiter.on_throttled(30.0)
+
+    async def acquire():
+        with pytest.raises(upstream.UpstreamDeadlineExceeded):
+            await limiter.acquire(time.monotonic() + 1.0)
+
+    started = time.monotonic()
+    asyncio.run(acquire())
+    assert time.monotonic() - started < 0.5
+    # The reserved token was handed back
+    assert limiter._tokens == pytest.approx(10.0, abs=0.5)
+
+
+def test_acquire_waits_out_retry_after():
+    limiter = upstream.AdaptiveRateLimiter(max_rate=100.0, burst=10.0)
+    limiter.on_throttled(0.2)
+    started = time.monotonic()
+    asyncio.run(limiter.acquire(time.monotonic() + 5.0))
+    assert time.monotonic() - started >= 0.19
+
+
+def test_fetch_honours_retry_after(monkeypatch):
+    monkeypatch.setenv("HISTORICAL_FACTS_MAX_RETRIES", "3")
+    transport = ScriptedTransport([(429, {"Retry-After": "0.3"})])
+    throttled = upstream.metrics()["throttled"]
+    started = time.monotonic()
+    response = fetch(transport)
+    assert time.monotonic() - started >= 0.29
+    assert transport.requests == 2
+    assert json.loads(response.body)["events"]
+    assert upstream.metrics()["throttled"] == throttled + 1
+    assert upstream.limiter.rate < upstream.limiter.max_rate
+
+
+def test_fetch_stops_when_retry_after_passes_the_deadline(monkeypatch):
+    monkeypatch.setenv("HISTORICAL_FACTS_RETRY_DEADLINE", "1")
+    transport = ScriptedTransport([(429, {"Retry-After": "30"})])
+    started = time.monotonic()
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        fetch(transport)
+    assert error.value.response.status_code == 429
+    assert time.monotonic() - started < 1.0
+    assert transport.requests == 1
+    # Every later caller waits for the pause too
+    assert upstream.limiter.available() == 0.0
+    assert upstream.limiter.metrics()["blocked_for"] > 25
+
+
+# ---------------------------------------------------------------------------
+# Circuit breaker
+# ---------------------------------------------------------------------------
+
+def open_breaker(reset_timeout=0.05):
+    breaker = upstream.CircuitBreaker("example.org", failure_threshold=2, reset_timeout=reset_timeout)
+    breaker.before_request()
+    breaker.record_failure()
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = upstream.CircuitBreaker("example.org", failure_threshold=2, reset_timeout=60.0)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(upstream.CircuitOpenError):
+        breaker.before_request()
+    assert breaker.metrics()["rejected"] == 1
+    assert breaker.metrics()["times_opened"] == 1
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.before_request() is True
+    assert breaker.state == "half_open"
+    with pytest.raises(upstream.CircuitOpenError):
+        breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.before_request() is False
+    assert breaker.before_request() is False
+
+
+def test_failed_probe_reopens():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.before_request() is True
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.metrics()["times_opened"] == 2
+    with pytest.raises(upstream.CircuitOpenError):
+        breaker.before_request()
+
+
+def test_released_probe_can_be_claimed_again():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.before_request() is True
+    breaker.release_probe()
+    assert breaker.state == "half_open"
+    assert breaker.before_request() is True
+
+
+def test_abandoned_probe_does_not_wedge_the_circuit():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    assert breaker.before_request() is True
+    # The probe never reports back; after another reset_timeout a new one may go
+    time.sleep(0.06)
+    assert breaker.before_request() is True
+
+
+def test_open_circuit_fails_fast_without_contacting_upstream(monkeypatch):
+    monkeypatch.setenv("HISTORICAL_FACTS_MAX_RETRIES", "0")
+    monkeypatch.setenv("HISTORICAL_FACTS_BREAKER_FAILURES", "2")
+    monkeypatch.setenv("HISTORICAL_FACTS_BREAKER_RESET", "60")
+    transport = ScriptedTransport([(503, {}), (503, {})])
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError):
+            fetch(transport)
+    with pytest.raises(upstream.CircuitOpenError):
+        fetch(transport)
+    assert transport.requests == 2
+    assert upstream.metrics()["circuits"][upstream.breaker_for(upstream.WIKI_API_BASE).host]["state"] == "open"
+
+
+def test_probe_closes_the_circuit(monkeypatch):
+    monkeypatch.setenv("HISTORICAL_FACTS_MAX_RETRIES", "0")
+    monkeypatch.setenv("HISTORICAL_FACTS_BREAKER_FAILURES", "1")
+    monkeypatch.setenv("HISTORICAL_FACTS_BREAKER_RESET", "0.05")
+    transport = ScriptedTransport([(503, {})])
+    with pytest.raises(httpx.HTTPStatusError):
+        fetch(transport)
+    time.sleep(0.06)
+    assert json.loads(fetch(transport).body)["events"]
+    assert upstream.breaker_for(upstream.WIKI_API_BASE).state == "closed"
+
+
+def test_probe_is_released_when_admission_times_out(monkeypatch):
+    monkeypatch.setenv("HISTORICAL_FACTS_RETRY_DEADLINE", "0.5")
+    breaker = upstream.breaker_for(upstream.WIKI_API_BASE)
+    breaker.state, breaker.opened_at = "open", time.monotonic() - breaker.reset_timeout
+    # The limiter cannot admit the probe before its deadline
+    upstream.limiter.on_throttled(30.0)
+    transport = ScriptedTransport()
+    with pytest.raises(upstream.UpstreamDeadlineExceeded):
+        fetch(transport)
+    assert transport.requests == 0
+    assert breaker.state == "half_open"
+    # No probe was sent, so the next request may probe at once
+    upstream.limiter._blocked_until = 0.0
+    assert json.loads(fetch(transport).body)["events"]
+    assert breaker.state == "closed"
+
+
+def test_throttling_does_not_open_the_circuit(monkeypatch):
+    monkeypatch.setenv("HISTORICAL_FACTS_MAX_RETRIES", "0")
+    monkeypatch.setenv("HISTORICAL_FACTS_BREAKER_FAILURES", "2")
+    transport = ScriptedTransport([(429, {"Retry-After": "0"})] * 3)
+    for _ in range(3):
+        with pytest.raises(httpx.HTTPStatusError):
+            fetch(transport)
+    breaker = upstream.breaker_for(upstream.WIKI_API_BASE)
+    assert breaker.state == "closed"
+    assert breaker.metrics()["times_opened"] == 0
+    # The limiter slowed down instead
+    assert upstream.limiter.rate < upstream.limiter.max_rate
+    assert json.loads(fetch(transport).body)["events"]
+
+
+def test_throttled_probe_is_released(monkeypatch):
+    monkeypatch.setenv("HISTORICAL_FACTS_MAX_RETRIES", "0")
+    breaker = upstream.breaker_for(upstream.WIKI_API_BASE)
+    breaker.state, breaker.opened_at = "open", time.monotonic() - breaker.reset_timeout
+    transport = ScriptedTransport([(429, {"Retry-After": "0"})])
+    with pytest.raises(httpx.HTTPStatusError):
+        fetch(transport)
+    assert breaker.state == "half_open"
+    # The next request may probe at once
+    assert json.loads(fetch(transport).body)["events"]
+    assert breaker.state == "closed"
+
+
+# ---------------------------------------------------------------------------
+# Priority scheduler
+# ---------------------------------------------------------------------------
+
+def scheduler(interactive=1, background=1):
+    return upstream.PriorityScheduler({upstream.INTERACTIVE: interactive, upstream.BACKGROUND: background})
+
+
+def test_queued_interactive_work_goes_first():
+    async def run():
+        admission = scheduler(interactive=1, background=1)
+        holder = upstream.Ticket(upstream.INTERACTIVE)
+        await admission.acquire(holder)
+        order = []
+
+        async def request(priority, name):
+            ticket = upstream.Ticket(priority)
+            await admission.acquire(ticket)
+            order.append(name)
+            return ticket
+
+        interactive = asyncio.ensure_future(request(upstream.INTERACTIVE, "interactive"))
+        await asyncio.sleep(0.01)
+        background = asyncio.ensure_future(request(upstream.BACKGROUND, "background"))
+        await asyncio.sleep(0.01)
+        # Background has a free slot but waits while interactive work is queued
+        assert order == []
+        admission.release(holder)
+        await asyncio.sleep(0.01)
+        assert order == ["interactive", "background"]
+        admission.release(await interactive)
+        admission.release(await background)
+        metrics = admission.metrics()
+        assert metrics[upstream.INTERACTIVE]["active"] == metrics[upstream.BACKGROUND]["active"] == 0
+        assert metrics[upstream.BACKGROUND]["queued"] == 1
+
+    asyncio.run(run())
+
+
+def test_promoted_ticket_is_admitted_as_interactive():
+    async def run():
+        admission = scheduler(interactive=2, background=1)
+        holder = upstream.Ticket(upstream.BACKGROUND)
+        await admission.acquire(holder)
+        ticket = upstream.Ticket(upstream.BACKGROUND)
+        waiter = asyncio.ensure_future(admission.acquire(ticket))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        # A client joined the background fetch: it no longer waits for the background slot
+        admission.promote(ticket)
+        await asyncio.wait_for(waiter, 1.0)
+        assert ticket.admitted_as == upstream.INTERACTIVE
+        assert admission.metrics()[upstream.BACKGROUND]["promoted"] == 1
+
+    asyncio.run(run())
+
+
+def test_queue_deadline_leaves_no_waiter_behind():
+    async def run():
+        admission = scheduler(interactive=1)
+        holder = upstream.Ticket(upstream.INTERACTIVE)
+        await admission.acquire(holder)
+        ticket = upstream.Ticket(upstream.INTERACTIVE)
+        with pytest.raises(upstream.UpstreamDeadlineExceeded):
+            await admission.acquire(ticket, time.monotonic() + 0.05)
+        assert admission.metrics()[upstream.INTERACTIVE]["queue_depth"] == 0
+        admission.release(holder)
+        assert admission.metrics()[upstream.INTERACTIVE]["active"] == 0
+        await admission.acquire(upstream.Ticket(upstream.INTERACTIVE))
+
+    asyncio.run(run())
+
+
+def test_background_fetch_runs_at_background_priority():
+    async def run():
+        upstream.set_priority(upstream.BACKGROUND)
+        try:
+            return await upstream.fetch_onthisday("all", 7, 4)
+        finally:
+            await upstream.close_client()
+
+    upstream.set_transport(ScriptedTransport())
+    admitted = upstream.scheduler.metrics()[upstream.BACKGROUND]["admitted"]
+    assert json.loads(asyncio.run(run()).body)["events"]
+    assert upstream.scheduler.metrics()[upstream.BACKGROUND]["admitted"] == admitted + 1
+
+
+# ---------------------------------------------------------------------------
+# Hedging
+# ---------------------------------------------------------------------------
+
+class TimedTransport(httpx.AsyncBaseTransport):
+    """Answers the nth request after delays[n] seconds, or once `release` is set if that delay is None"""
+
+    def __init__(self, delays, failures=()):
+        self.delays = list(delays)
+        self.failures = set(failures)
+        self.release = asyncio.Event()
+        self.requests = 0
+        self.cancelled = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        number = self.requests
+        self.requests += 1
+        try:
+            if self.delays[number] is None:
+                await self.release.wait()
+            else:
+                await asyncio.sleep(self.delays[number])
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if number in self.failures:
+            raise httpx.ConnectError("Scripted failure", request=request)
+        return httpx.Response(200, content=f'{{"request": {number}}}'.encode())
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    """Hedging after the 95th percentile of 20 ms latencies, with room in the ratio cap"""
+    monkeypatch.setenv("HISTORICAL_FACTS_HEDGE_PERCENTILE", "95")
+    monkeypatch.setenv("HISTORICAL_FACTS_HEDGE_MAX_RATIO", "0.5")
+    tracker = upstream.LatencyTracker()
+    for _ in range(tracker.min_samples):
+        tracker.record(0.02)
+    monkeypatch.setattr(upstream, "latencies", tracker)
+    monkeypatch.setattr(upstream, "_counters", dict(upstream._counters, sent=100, hedged=0, hedge_wins=0))
+    return upstream._counters
+
+
+def send_hedged(transport, during=None):
+    async def go():
+        async with httpx.AsyncClient(transport=transport) as client:
+            sending = asyncio.ensure_future(upstream._send_hedged(client, "https://example.org/", {}, None))
+            if during is not None:
+                await during()
+            response = await sending
+            # Let cancelled copies unwind before the loop closes
+            await asyncio.sleep(0.01)
+            return response
+
+    return asyncio.run(go())
+
+
+def test_hedge_delay_follows_the_latency_percentile(hedging):
+    assert upstream.hedge_delay() == 0.02
+    # One outlier stays above the 95th percentile
+    upstream.latencies.record(5.0)
+    assert upstream.hedge_delay() == 0.02
+    # More set the percentile, capped at a multiple of the median
+    upstream.latencies.record(5.0)
+    upstream.latencies.record(5.0)
+    assert upstream.hedge_delay() == upstream.HEDGE_MEDIAN_MULTIPLE * 0.02
+
+
+def test_no_hedge_before_the_percentile(hedging):
+    transport = TimedTransport([0.0])
+    assert json.loads(send_hedged(transport).content) == {"request": 0}
+    assert transport.requests == 1
+    assert hedging["hedged"] == 0
+
+
+def test_slow_request_is_hedged_and_the_loser_cancelled(hedging):
+    transport = TimedTransport([5.0, 0.0])
+    started = time.monotonic()
+    assert json.loads(send_hedged(transport).content) == {"request": 1}
+    assert time.monotonic() - started < 1.0
+    assert transport.requests == 2
+    assert transport.cancelled == 1
+    assert hedging["hedged"] == hedging["hedge_wins"] == 1
+
+
+def test_hedges_respect_the_ratio_cap(hedging, monkeypatch):
+    monkeypatch.setenv("HISTORICAL_FACTS_HEDGE_MAX_RATIO", "0.05")
+    hedging.update(sent=20, hedged=1)
+    transport = TimedTransport([0.1])
+    assert json.loads(send_hedged(transport).content) == {"request": 0}
+    assert transport.requests == 1
+    assert hedging["hedged"] == 1
+
+
+def test_hedges_need_a_spare_limiter_token(hedging, monkeypatch):
+    monkeypatch.setattr(upstream, "limiter", upstream.AdaptiveRateLimiter(max_rate=0.1, burst=1.0))
+    upstream.limiter._tokens = 0.0
+    transport = TimedTransport([0.1])
+    assert json.loads(send_hedged(transport).content) == {"request": 0}
+    assert transport.requests == 1
+    assert hedging["hedged"] == 0
+
+
+def test_failure_finishing_with_the_winner_is_retrieved(hedging):
+    unretrieved = []
+
+    async def release_together():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unretrieved.append(context))
+        while transport.requests < 2:
+            await asyncio.sleep(0.01)
+        transport.release.set()
+
+    for _ in range(10):
+        transport = TimedTransport([None, None], failures={0})
+        assert json.loads(send_hedged(transport, release_together).content) == {"request": 1}
+        gc.collect()
+    assert unretrieved == []
+
+
+def test_every_copy_failing_raises(hedging):
+    transport = TimedTransport([0.1, 0.0], failures={0, 1})
+    with pytest.raises(httpx.ConnectError):
+        send_hedged(transport)
+    assert transport.requests == 2
+
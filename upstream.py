@@ -0,0 +1,850 @@
+#!/usr/bin/env python3
+"""
+Shared upstream client for the Wikimedia "On This Day" feed
+
+Every server in this repository talks to the same API. Opening a fresh
+httpx.AsyncClient for each tool call pays the TCP + TLS handshake to
+api.wikimedia.org every time, so this module keeps a single pooled,
+HTTP/2-capable client per process. Servers open it from their FastAPI
+lifespan (or the stdio main()) through lifecycle.running() and close it on
+shutdown.
+
+Fetches go through fetch(), which coalesces identical in-flight requests:
+when many sessions ask for the same day at once, one upstream GET is made and
+every caller awaits its result. Callers holding a cached copy pass its
+validators (ETag / Last-Modified) to make the GET conditional; a 304 comes
+back as an UpstreamResponse with not_modified set and no body.
+
+Every GET passes through a shared token-bucket rate limiter that adapts to
+upstream throttling: a 429 halves the request rate and honours Retry-After,
+and successful responses grow it back towards the configured maximum.
+Throttled, 5xx and transport failures are retried with decorrelated-jitter
+backoff, but never past the call's deadline.
+
+Each upstream host is guarded by a circuit breaker. After repeated failures
+(5xx answers and transport errors; a 429 is left to the rate limiter) it opens and calls fail fast with CircuitOpenError instead of waiting out
+their timeouts; day_cache then answers from the last-known-good cached day.
+Once the reset timeout passes, a single probe request is let through
+(half-open) and its outcome closes or re-opens the circuit.
+
+To cut tail latency, a GET that has not answered within an adaptive
+percentile of recent upstream latencies is hedged: a second identical GET is
+sent and whichever answers first wins, the other is cancelled. Hedges are
+capped to a fraction of all requests and only sent when the rate limiter has
+a token to spare, so hedging never doubles upstream load.
+
+GETs are admitted by a priority scheduler. Work done on behalf of a client
+is "interactive"; refreshes, prefetches, prewarming and corpus builds run as
+"background" (see set_priority()). Each class has its own concurrency limit,
+and a queued interactive GET is always admitted before any queued background
+one. When a client joins an in-flight background fetch of the same day, that
+fetch is promoted to interactive.
+
+Pool settings are read from the environment:
+
+    HISTORICAL_FACTS_UPSTREAM_URL        base URL of the On This Day feed (default the Wikimedia API)
+    HISTORICAL_FACTS_MAX_CONNECTIONS     total connections (default 20)
+    HISTORICAL_FACTS_MAX_KEEPALIVE       idle keep-alive connections (default 10)
+    HISTORICAL_FACTS_KEEPALIVE_EXPIRY    idle connection lifetime in seconds (default 60)
+    HISTORICAL_FACTS_HTTP2               "0" to force HTTP/1.1 (default on when h2 is installed)
+    HISTORICAL_FACTS_WARMUP_CONNECTIONS  connections opened at startup (default 2, 0 disables)
+    HISTORICAL_FACTS_RATE_LIMIT          maximum upstream requests per second (default 5)
+    HISTORICAL_FACTS_RATE_BURST          requests allowed in a burst (default 10)
+    HISTORICAL_FACTS_MAX_RETRIES         retries per upstream GET (default 3)
+    HISTORICAL_FACTS_RETRY_DEADLINE      seconds a GET may spend including retries (default 20)
+    HISTORICAL_FACTS_BREAKER_FAILURES    consecutive failures that open a host's circuit (default 5)
+    HISTORICAL_FACTS_BREAKER_RESET       seconds an open circuit waits before a probe (default 30)
+    HISTORICAL_FACTS_HEDGE_PERCENTILE    latency percentile after which a GET is hedged (default 95, 0 disables)
+    HISTORICAL_FACTS_HEDGE_MAX_RATIO     maximum fraction of GETs that may be hedged (default 0.05)
+    HISTORICAL_FACTS_INTERACTIVE_CONCURRENCY  concurrent GETs for client requests (default 16)
+    HISTORICAL_FACTS_BACKGROUND_CONCURRENCY   concurrent GETs for background work (default 2)
+
+License: MIT
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import httpx
+
+try:
+    import h2  # noqa: F401 - only needed so httpx can negotiate HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger("historical-facts-upstream")
+
+# Wikipedia On This Day API base URL (overridable, e.g. to point at a fake served by backends.py)
+WIKI_API_BASE = (os.environ.get("HISTORICAL_FACTS_UPSTREAM_URL")
+                 or "https://api.wikimedia.org/feed/v1/wikipedia/en/onthisday").rstrip("/")
+
+# Wikimedia asks API clients to identify themselves
+USER_AGENT = "historical-facts-mcp-server/1.0 (https://github.com/oscar-fern-labs/historical-facts-mcp-server)"
+
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+# Responses worth retrying: throttling and transient server errors
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+# A hedge never waits longer than this multiple of the median latency, so a
+# burst of slow responses cannot push the percentile out of reach
+HEDGE_MEDIAN_MULTIPLE = 4.0
+
+# Decorrelated-jitter backoff bounds, in seconds
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 8.0
+
+_client: Optional[httpx.AsyncClient] = None
+
+# Transport the shared client sends through; None is the network (see backends.py)
+_transport: Optional[httpx.AsyncBaseTransport] = None
+
+# Priority classes, highest first
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+# Priority of upstream work started from the current task; tasks inherit it
+_priority: ContextVar[str] = ContextVar("historical_facts_priority", default=INTERACTIVE)
+
+# In-flight upstream fetches keyed by URL and validators, shared by every concurrent
+# caller, with the ticket that admits them through the scheduler
+_inflight: Dict[Tuple[str, Optional[str], Optional[str]], Tuple[asyncio.Task, "Ticket"]] = {}
+
+_counters = {
+    "requests": 0,          # fetch() calls
+    "upstream_fetches": 0,  # GETs actually sent upstream
+    "conditional": 0,       # GETs sent with If-None-Match / If-Modified-Since
+    "not_modified": 0,      # 304 responses to conditional GETs
+    "bytes_received": 0,    # response body bytes downloaded
+    "sent": 0,              # individual GETs sent, including retries and hedges
+    "hedged": 0,            # hedge GETs sent for slow requests
+    "hedge_wins": 0,        # hedges that answered before the original GET
+    "coalesced": 0,         # calls that joined an in-flight GET
+    "retries": 0,           # GETs re-sent after a retryable failure
+    "throttled": 0,         # 429 responses received
+    "deadline_exceeded": 0, # fetches abandoned because retrying would pass the deadline
+}
+
+
+class UpstreamResponse:
+    """Body and cache validators of a feed GET; not_modified responses carry no body"""
+
+    __slots__ = ("body", "etag", "last_modified", "not_modified")
+
+    def __init__(self, body: bytes, etag: Optional[str], last_modified: Optional[str],
+                 not_modified: bool = False):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = not_modified
+
+
+class UpstreamDeadlineExceeded(httpx.TimeoutException):
+    """Raised when a fetch cannot complete (or be retried) within its deadline"""
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Raised without contacting upstream while a host's circuit is open"""
+
+
+def env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment, falling back to default"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        logger.warning(f"Ignoring invalid value for {name}: {os.environ.get(name)!r}")
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment, falling back to default"""
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        logger.warning(f"Ignoring invalid value for {name}: {os.environ.get(name)!r}")
+        return default
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket shared by every upstream GET in the process.
+
+    The refill rate is cut in half on each 429 (down to min_rate) and recovers
+    additively on success, so the process settles just under whatever rate
+    upstream tolerates. A Retry-After pause blocks all callers, not only the
+    one that was throttled.
+    """
+
+    def __init__(self, max_rate: float, burst: float, min_rate: float = 0.1):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max_rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, deadline: Optional[float] = None) -> None:
+        """
+        Wait for a request slot.
+
+        Raises:
+            UpstreamDeadlineExceeded: if the slot would come after deadline (monotonic time)
+        """
+        now = time.monotonic()
+        self._refill(now)
+        # Reserve a token now (possibly going into debt) so concurrent callers queue fairly
+        self._tokens -= 1
+        wait = max(-self._tokens / self.rate if self._tokens < 0 else 0.0, self._blocked_until - now)
+        if deadline is not None and now + wait > deadline:
+            self._tokens += 1
+            raise UpstreamDeadlineExceeded("Upstream rate limit wait exceeds request deadline")
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def available(self) -> float:
+        """Tokens that could be taken right now without waiting (0 while a Retry-After pause lasts)"""
+        now = time.monotonic()
+        self._refill(now)
+        return max(0.0, self._tokens) if now >= self._blocked_until else 0.0
+
+    def try_acquire(self) -> bool:
+        """Take a token only if one is available right now (used for optional hedges)"""
+        now = time.monotonic()
+        self._refill(now)
+        if self._tokens >= 1 and now >= self._blocked_until:
+            self._tokens -= 1
+            return True
+        return False
+
+    def on_success(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def on_throttled(self, retry_after: Optional[float]) -> None:
+        self.rate = max(self.min_rate, self.rate / 2)
+        if retry_after:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "rate": round(self.rate, 3),
+            "max_rate": self.max_rate,
+            "blocked_for": round(max(0.0, self._blocked_until - time.monotonic()), 3),
+        }
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker for one upstream host.
+
+    closed:    requests flow; consecutive failures are counted
+    open:      requests fail fast until reset_timeout has passed
+    half_open: one probe request is allowed; success closes, failure re-opens
+    """
+
+    def __init__(self, host: str, failure_threshold: int, reset_timeout: float):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probing = False
+        self._probe_started = 0.0
+
+    def before_request(self) -> bool:
+        """
+        Returns:
+            True if this request claimed the half-open probe slot
+
+        Raises:
+            CircuitOpenError: if the circuit is open, or half-open with a probe already in flight
+        """
+        now = time.monotonic()
+        if self.state == "open" and now - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._probing = False
+        # A probe that never reported back (cancelled caller) must not wedge the circuit
+        probe_busy = self._probing and now - self._probe_started < self.reset_timeout
+        if self.state == "open" or (self.state == "half_open" and probe_busy):
+            self.rejected += 1
+            raise CircuitOpenError(f"Circuit for {self.host} is open; not contacting upstream")
+        if self.state == "half_open":
+            self._probing = True
+            self._probe_started = now
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """Give back the half-open probe slot claimed by a request that was never sent"""
+        self._probing = False
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            logger.info(f"Circuit for {self.host} closed")
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+                logger.warning(f"Circuit for {self.host} opened after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class LatencyTracker:
+    """Recent successful upstream latencies, used to pick the hedging delay"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: "deque[float]" = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """The pct-th percentile of recent latencies, or None until enough samples exist"""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+        return ordered[index]
+
+
+latencies = LatencyTracker()
+
+
+# One breaker per upstream host
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def breaker_for(url: str) -> CircuitBreaker:
+    host = urlsplit(url).netloc
+    breaker = _breakers.get(host)
+    if breaker is None:
+        breaker = _breakers[host] = CircuitBreaker(
+            host,
+            failure_threshold=env_int("HISTORICAL_FACTS_BREAKER_FAILURES", 5),
+            reset_timeout=env_float("HISTORICAL_FACTS_BREAKER_RESET", 30.0),
+        )
+    return breaker
+
+
+class Ticket:
+    """One fetch's place in the scheduler; its priority can be raised while it waits"""
+
+    __slots__ = ("priority", "admitted_as", "waiter", "queued_at")
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.admitted_as: Optional[str] = None
+        self.waiter: Optional[asyncio.Future] = None
+        self.queued_at = 0.0
+
+
+class PriorityScheduler:
+    """
+    Admission control for upstream GETs by priority class.
+
+    Each class has its own concurrency limit. Waiters are admitted highest
+    priority first, and a background GET is only admitted while no interactive
+    GET is queued, so background work never delays a client's request.
+    """
+
+    def __init__(self, limits: Dict[str, int]):
+        self.limits = dict(limits)
+        self._active = {priority: 0 for priority in PRIORITIES}
+        self._waiting: Dict[str, Deque[Ticket]] = {priority: deque() for priority in PRIORITIES}
+        self.counters = {priority: {
+            "admitted": 0,
+            "queued": 0,          # admissions that had to wait
+            "max_queue_depth": 0,
+            "wait_seconds": 0.0,  # total time spent queued
+        } for priority in PRIORITIES}
+        self.counters[BACKGROUND]["promoted"] = 0
+
+    def set_limit(self, priority: str, limit: int) -> None:
+        self.limits[priority] = limit
+        self._dispatch()
+
+    def _can_admit(self, priority: str) -> bool:
+        if self._active[priority] >= self.limits[priority]:
+            return False
+        # Queued interactive work preempts all background work
+        return priority == INTERACTIVE or not self._waiting[INTERACTIVE]
+
+    def _admit(self, ticket: Ticket) -> None:
+        ticket.admitted_as = ticket.priority
+        self._active[ticket.priority] += 1
+        self.counters[ticket.priority]["admitted"] += 1
+
+    def _dispatch(self) -> None:
+        for priority in PRIORITIES:
+            waiting = self._waiting[priority]
+            while waiting and self._can_admit(priority):
+                ticket = waiting.popleft()
+                if ticket.waiter.done():
+                    continue
+                self._admit(ticket)
+                self.counters[priority]["wait_seconds"] += time.monotonic() - ticket.queued_at
+                ticket.waiter.set_result(None)
+
+    async def acquire(self, ticket: Ticket, deadline: Optional[float] = None) -> None:
+        """
+        Wait until ticket may send a GET.
+
+        Raises:
+            UpstreamDeadlineExceeded: if it is still queued at deadline (monotonic time)
+        """
+        if not self._waiting[ticket.priority] and self._can_admit(ticket.priority):
+            self._admit(ticket)
+            return
+        ticket.waiter = asyncio.get_running_loop().create_future()
+        ticket.queued_at = time.monotonic()
+        waiting = self._waiting[ticket.priority]
+        waiting.append(ticket)
+        counters = self.counters[ticket.priority]
+        counters["queued"] += 1
+        counters["max_queue_depth"] = max(counters["max_queue_depth"], len(waiting))
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if ticket.waiter.done():
+                # Admitted just as we gave up: hand the slot back
+                self.release(ticket)
+            else:
+                ticket.waiter.cancel()
+                self._remove(ticket)
+            if isinstance(e, asyncio.TimeoutError):
+                raise UpstreamDeadlineExceeded("Upstream queue wait exceeds request deadline") from None
+            raise
+
+    def _remove(self, ticket: Ticket) -> None:
+        for waiting in self._waiting.values():
+            if ticket in waiting:
+                waiting.remove(ticket)
+        self._dispatch()
+
+    def release(self, ticket: Ticket) -> None:
+        """Give back the slot ticket was admitted to"""
+        if ticket.admitted_as is not None:
+            self._active[ticket.admitted_as] -= 1
+            ticket.admitted_as = None
+        self._dispatch()
+
+    def promote(self, ticket: Ticket) -> None:
+        """Raise a ticket to interactive, e.g. when a client joins a background fetch"""
+        if ticket.priority == INTERACTIVE:
+            return
+        background = self._waiting[ticket.priority]
+        if ticket in background:
+            background.remove(ticket)
+            self._waiting[INTERACTIVE].append(ticket)
+        ticket.priority = INTERACTIVE
+        self.counters[BACKGROUND]["promoted"] += 1
+        self._dispatch()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {priority: {
+            **self.counters[priority],
+            "wait_seconds": round(self.counters[priority]["wait_seconds"], 3),
+            "active": self._active[priority],
+            "limit": self.limits[priority],
+            "queue_depth": len(self._waiting[priority]),
+        } for priority in PRIORITIES}
+
+
+scheduler = PriorityScheduler({
+    INTERACTIVE: env_int("HISTORICAL_FACTS_INTERACTIVE_CONCURRENCY", 16),
+    BACKGROUND: env_int("HISTORICAL_FACTS_BACKGROUND_CONCURRENCY", 2),
+})
+
+
+def set_priority(priority: str) -> None:
+    """
+    Run upstream work started from the current task (and tasks it creates) at
+    this priority. Background workers call set_priority(BACKGROUND) once.
+    """
+    _priority.set(priority)
+
+
+limiter = AdaptiveRateLimiter(
+    max_rate=env_float("HISTORICAL_FACTS_RATE_LIMIT", 5.0),
+    burst=env_float("HISTORICAL_FACTS_RATE_BURST", 10.0),
+)
+
+
+def pool_limits() -> httpx.Limits:
+    """Connection pool limits for the shared client"""
+    return httpx.Limits(
+        max_connections=env_int("HISTORICAL_FACTS_MAX_CONNECTIONS", 20),
+        max_keepalive_connections=env_int("HISTORICAL_FACTS_MAX_KEEPALIVE", 10),
+        keepalive_expiry=env_float("HISTORICAL_FACTS_KEEPALIVE_EXPIRY", 60.0),
+    )
+
+
+def http2_enabled() -> bool:
+    """Whether the shared client negotiates HTTP/2"""
+    return HTTP2_AVAILABLE and os.environ.get("HISTORICAL_FACTS_HTTP2", "1") != "0"
+
+
+def set_transport(transport: Optional[httpx.AsyncBaseTransport]) -> None:
+    """
+    Send upstream GETs through transport instead of the network (None restores it).
+
+    Takes effect when the shared client is next opened; backends.install() calls
+    this before start_client().
+    """
+    global _transport
+    _transport = transport
+
+
+def _create_client() -> httpx.AsyncClient:
+    if not HTTP2_AVAILABLE and _transport is None:
+        logger.info("h2 is not installed; upstream client will use HTTP/1.1")
+
+    return httpx.AsyncClient(
+        http2=http2_enabled(),
+        limits=pool_limits(),
+        timeout=DEFAULT_TIMEOUT,
+        headers={"User-Agent": USER_AGENT, "Accept": "application/json"},
+        transport=_transport,
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the process-wide upstream client.
+
+    The client is normally opened by start_client() at startup; if a code path
+    runs outside a lifespan (scripts, ad-hoc calls) it is created lazily here.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+    return _client
+
+
+async def warm_up(connections: int) -> None:
+    """Open connections to the upstream host so the first tool call skips the handshake"""
+    client = get_client()
+
+    async def _touch() -> None:
+        try:
+            await client.head(WIKI_API_BASE, timeout=5.0)
+        except httpx.HTTPError as e:
+            logger.warning(f"Upstream warm-up request failed: {e}")
+
+    await asyncio.gather(*[_touch() for _ in range(connections)])
+
+
+async def start_client() -> httpx.AsyncClient:
+    """Create the shared client and warm up its connection pool"""
+    client = get_client()
+    connections = env_int("HISTORICAL_FACTS_WARMUP_CONNECTIONS", 2)
+    if connections > 0:
+        await warm_up(connections)
+    logger.info(f"Upstream client ready (http2={http2_enabled()}, warmed {connections} connections)")
+    return client
+
+
+async def close_client() -> None:
+    """Close the shared client and release its pooled connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def feed_url(event_type: str, month: int, day: int) -> str:
+    """Build the On This Day feed URL for a feed type and date"""
+    return f"{WIKI_API_BASE}/{event_type}/{month:02d}/{day:02d}"
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def conditional_headers(etag: Optional[str], last_modified: Optional[str]) -> Dict[str, str]:
+    """Request headers that make a GET conditional on the cached copy's validators"""
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def hedge_delay() -> Optional[float]:
+    """Seconds to wait before hedging a GET, or None if hedging is off or not yet calibrated"""
+    pct = env_float("HISTORICAL_FACTS_HEDGE_PERCENTILE", 95.0)
+    if pct <= 0:
+        return None
+    delay = latencies.percentile(min(pct, 100.0))
+    if delay is None:
+        return None
+    return min(delay, HEDGE_MEDIAN_MULTIPLE * latencies.percentile(50))
+
+
+def _hedge_allowed() -> bool:
+    max_ratio = min(env_float("HISTORICAL_FACTS_HEDGE_MAX_RATIO", 0.05), 0.5)
+    if _counters["hedged"] + 1 > max_ratio * max(_counters["sent"], 1):
+        return False
+    return limiter.try_acquire()
+
+
+async def _send(client: httpx.AsyncClient, url: str, headers: Dict[str, str],
+                timeout: Union[float, httpx.Timeout, None]) -> httpx.Response:
+    _counters["sent"] += 1
+    if timeout is None:
+        return await client.get(url, headers=headers)
+    return await client.get(url, headers=headers, timeout=timeout)
+
+
+async def _send_hedged(client: httpx.AsyncClient, url: str, headers: Dict[str, str],
+                       timeout: Union[float, httpx.Timeout, None]) -> httpx.Response:
+    """Send a GET, racing a second copy against it if it is slower than usual"""
+    started = time.monotonic()
+    primary = asyncio.ensure_future(_send(client, url, headers, timeout))
+    copies = [primary]
+    tasks = {primary}
+    try:
+        delay = hedge_delay()
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and _hedge_allowed():
+                _counters["hedged"] += 1
+                copies.append(asyncio.ensure_future(_send(client, url, headers, timeout)))
+                tasks.add(copies[-1])
+
+        # First successful response wins; an error only counts once every copy has failed
+        error: Optional[BaseException] = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        _counters["hedge_wins"] += 1
+                    # Track latency as callers saw it, so successful hedges pull the
+                    # percentile down instead of slow originals pushing it up
+                    latencies.record(time.monotonic() - started)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # Cancel the loser; a copy that failed alongside the winner has its
+        # error retrieved so it is not logged as never retrieved
+        for task in copies:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()
+
+
+async def _get(url: str, timeout: Union[float, httpx.Timeout, None],
+               etag: Optional[str], last_modified: Optional[str], ticket: Ticket) -> UpstreamResponse:
+    client = get_client()
+    headers = conditional_headers(etag, last_modified)
+    breaker = breaker_for(url)
+    deadline = time.monotonic() + env_float("HISTORICAL_FACTS_RETRY_DEADLINE", 20.0)
+    max_retries = env_int("HISTORICAL_FACTS_MAX_RETRIES", 3)
+    backoff = BACKOFF_BASE
+    attempt = 0
+
+    while True:
+        probe = breaker.before_request()
+        try:
+            await scheduler.acquire(ticket, deadline)
+        except UpstreamDeadlineExceeded:
+            if probe:
+                breaker.release_probe()
+            _counters["deadline_exceeded"] += 1
+            raise
+        try:
+            await limiter.acquire(deadline)
+        except UpstreamDeadlineExceeded:
+            scheduler.release(ticket)
+            if probe:
+                breaker.release_probe()
+            _counters["deadline_exceeded"] += 1
+            raise
+        retry_after = None
+        try:
+            if headers:
+                _counters["conditional"] += 1
+            response = await _send_hedged(client, url, headers, timeout)
+            if response.status_code == 429:
+                _counters["throttled"] += 1
+                retry_after = retry_after_seconds(response)
+                limiter.on_throttled(retry_after)
+            if response.status_code not in RETRYABLE_STATUS:
+                # The host answered; a 404 says nothing about its health
+                breaker.record_success()
+            if response.status_code == 304 and headers:
+                limiter.on_success()
+                _counters["not_modified"] += 1
+                return UpstreamResponse(b"", etag, last_modified, not_modified=True)
+            response.raise_for_status()
+            limiter.on_success()
+            _counters["bytes_received"] += len(response.content)
+            return UpstreamResponse(
+                response.content,
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+            )
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code not in RETRYABLE_STATUS:
+                raise
+            if e.response.status_code == 429:
+                # Throttling is the rate limiter's business; the host itself is up
+                if probe:
+                    breaker.release_probe()
+            else:
+                breaker.record_failure()
+            if attempt >= max_retries:
+                raise
+            error = e
+        except httpx.TransportError as e:
+            breaker.record_failure()
+            if attempt >= max_retries:
+                raise
+            error = e
+        finally:
+            # The slot is held for one attempt, not across backoff sleeps
+            scheduler.release(ticket)
+
+        # Decorrelated jitter, unless upstream told us exactly how long to wait
+        backoff = min(BACKOFF_CAP, random.uniform(BACKOFF_BASE, backoff * 3))
+        delay = retry_after if retry_after is not None else backoff
+        if time.monotonic() + delay > deadline:
+            _counters["deadline_exceeded"] += 1
+            raise error
+        attempt += 1
+        _counters["retries"] += 1
+        logger.warning(f"Retrying {url} in {delay:.2f}s (attempt {attempt}/{max_retries}): {error}")
+        await asyncio.sleep(delay)
+
+
+def _forget(key: Tuple[str, Optional[str], Optional[str]], task: asyncio.Task) -> None:
+    if _inflight.get(key, (None,))[0] is task:
+        del _inflight[key]
+    # Mark the exception as retrieved even if every waiter was cancelled
+    if not task.cancelled():
+        task.exception()
+
+
+async def fetch(url: str, timeout: Union[float, httpx.Timeout, None] = None,
+                etag: Optional[str] = None, last_modified: Optional[str] = None) -> UpstreamResponse:
+    """
+    GET a feed URL through the shared client, coalescing concurrent identical requests.
+
+    The first caller for a URL starts the upstream request (with its timeout);
+    callers arriving while it is in flight await the same response. Waiters
+    are shielded from one another: cancelling one caller never cancels the
+    shared fetch the others are waiting on. Passing the validators of a cached
+    copy makes the request conditional. The GET runs at the caller's priority
+    (see set_priority()); an interactive caller joining a background fetch
+    promotes it.
+
+    Raises:
+        httpx.HTTPError: if the upstream request fails
+    """
+    _counters["requests"] += 1
+    key = (url, etag, last_modified)
+    task, ticket = _inflight.get(key, (None, None))
+    if task is None or task.done():
+        _counters["upstream_fetches"] += 1
+        ticket = Ticket(_priority.get())
+        task = asyncio.ensure_future(_get(url, timeout, etag, last_modified, ticket))
+        _inflight[key] = (task, ticket)
+        task.add_done_callback(lambda t: _forget(key, t))
+    else:
+        _counters["coalesced"] += 1
+        if _priority.get() == INTERACTIVE:
+            scheduler.promote(ticket)
+    return await asyncio.shield(task)
+
+
+async def fetch_body(url: str, timeout: Union[float, httpx.Timeout, None] = None) -> bytes:
+    """Unconditional coalesced GET of a feed URL, returning the raw body"""
+    return (await fetch(url, timeout=timeout)).body
+
+
+async def fetch_json(url: str, timeout: Union[float, httpx.Timeout, None] = None) -> dict:
+    """
+    Coalesced GET of a feed URL, decoded as JSON.
+
+    Each caller decodes its own copy of the shared body, since servers
+    post-process the payload in place.
+    """
+    return json.loads(await fetch_body(url, timeout=timeout))
+
+
+async def fetch_onthisday_body(event_type: str, month: int, day: int,
+                               timeout: Union[float, httpx.Timeout, None] = None) -> bytes:
+    """Fetch the raw body of one On This Day feed ('all', 'events', 'births', 'deaths', 'holidays')"""
+    return await fetch_body(feed_url(event_type, month, day), timeout=timeout)
+
+
+async def fetch_onthisday(event_type: str, month: int, day: int,
+                          timeout: Union[float, httpx.Timeout, None] = None,
+                          etag: Optional[str] = None,
+                          last_modified: Optional[str] = None) -> UpstreamResponse:
+    """Fetch one On This Day feed, conditionally when validators are given"""
+    return await fetch(feed_url(event_type, month, day), timeout=timeout,
+                       etag=etag, last_modified=last_modified)
+
+
+def metrics() -> Dict[str, Any]:
+    """Upstream counters for health and metrics endpoints"""
+    return {
+        **_counters,
+        "in_flight": len(_inflight),
+        "http2": http2_enabled(),
+        "rate_limit": limiter.metrics(),
+        "scheduler": scheduler.metrics(),
+        "hedge_delay": hedge_delay(),
+        "circuits": {host: breaker.metrics() for host, breaker in _breakers.items()},
+    }